@@ -0,0 +1,215 @@
+"""
+对象缓存的作用：
+- 把由配置唯一确定的顶层对象(词表、预处理后的数据集等)保存在本地，
+- 以配置的规范化哈希与clazz源文件的哈希作为键，配置或代码变化后自动失效，
+- 之后的fdl run直接读取，跳过构造。
+numpy数组保存为.npy并以mmap方式读取，其余对象使用pickle。
+缓存总大小超过上限时，按最近使用时间淘汰。
+"""
+import hashlib
+import inspect
+import json
+import os
+import pickle
+import threading
+import time
+
+from fdl._utils import BUFFER_KEY, MMAP_KEY, config_hash, get_cache_dir, is_mapped_arg
+
+# 默认的缓存大小上限，可以通过环境变量FDL_CACHE_MAX_SIZE(字节)修改
+DEFAULT_MAX_SIZE = 10 * 2**30
+DATA_SUFFIXES = (".pkl", ".npy")
+
+_source_hashes = dict()
+_source_lock = threading.Lock()
+
+
+def source_hash(clazz):
+    """clazz所在源文件的哈希，无法获取源文件时使用clazz的全名"""
+    with _source_lock:
+        if clazz in _source_hashes:
+            return _source_hashes[clazz]
+    try:
+        source_path = inspect.getsourcefile(clazz)
+    except TypeError:
+        source_path = None
+    if source_path is not None and os.path.isfile(source_path):
+        with open(source_path, "rb") as file:
+            digest = hashlib.sha1(file.read()).hexdigest()
+    else:
+        full_name = f"{getattr(clazz, '__module__', '')}.{clazz.__qualname__}"
+        digest = hashlib.sha1(full_name.encode("utf-8")).hexdigest()
+    with _source_lock:
+        _source_hashes[clazz] = digest
+    return digest
+
+
+def mapped_file_stats(config):
+    """config中$mmap/$buffer参数映射的文件：[(路径, 修改时间(ns), 大小)]"""
+    stats = list()
+    stack = [config]
+    while stack:
+        item = stack.pop()
+        if isinstance(item, dict):
+            if is_mapped_arg(item):
+                path = str(item.get(MMAP_KEY, item.get(BUFFER_KEY)))
+                try:
+                    stat = os.stat(path)
+                    stats.append((path, stat.st_mtime_ns, stat.st_size))
+                except OSError:
+                    # 文件不存在时构造会报错，不会被缓存
+                    stats.append((path, -1, -1))
+                continue
+            stack.extend(item.values())
+        elif isinstance(item, list):
+            stack.extend(item)
+    return sorted(stats)
+
+
+def object_key(obj_config: dict, clazzs: list, dep_keys: list):
+    """对象的缓存键：去掉name/method/cache后的配置、用到的clazz源码、依赖对象的键。
+
+    配置中只有映射文件的路径，文件的修改时间与大小也计入键，文件被改写后缓存失效。
+    """
+    config = {
+        key: value
+        for key, value in obj_config.items()
+        if key not in ("name", "method", "cache")
+    }
+    key_config = {
+        "config": config,
+        "sources": sorted(source_hash(clazz) for clazz in clazzs),
+        "deps": dep_keys,
+    }
+    files = mapped_file_stats(config)
+    if files:
+        key_config["files"] = files
+    return config_hash(key_config)
+
+
+def _is_ndarray(obj):
+    # 不为了判断类型而导入numpy
+    return type(obj).__module__ == "numpy" and type(obj).__name__ == "ndarray"
+
+
+class ObjectCache:
+    """目录中每个对象保存为<key>.pkl或<key>.npy，以及记录来源的<key>.json"""
+
+    def __init__(self, cache_dir=None, max_size=None) -> None:
+        if cache_dir is None:
+            cache_dir = os.path.join(get_cache_dir(), "objects")
+        if max_size is None:
+            max_size = int(os.environ.get("FDL_CACHE_MAX_SIZE", DEFAULT_MAX_SIZE))
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        self._lock = threading.Lock()
+
+    def _data_path(self, key):
+        for suffix in DATA_SUFFIXES:
+            data_path = os.path.join(self.cache_dir, key + suffix)
+            if os.path.exists(data_path):
+                return data_path
+        return None
+
+    def load(self, key):
+        """返回(是否命中, 对象)"""
+        data_path = self._data_path(key)
+        if data_path is None:
+            return False, None
+        try:
+            if data_path.endswith(".npy"):
+                # pylint:disable=C0415
+                import numpy as np
+
+                obj = np.load(data_path, mmap_mode="r")
+            else:
+                with open(data_path, "rb") as file:
+                    obj = pickle.load(file)
+        except Exception:  # pylint:disable=W0703
+            # 损坏或不兼容的缓存视为未命中，之后会被覆盖
+            return False, None
+        # 修改时间即最近使用时间
+        try:
+            os.utime(data_path)
+        except OSError:
+            pass
+        return True, obj
+
+    def save(self, key, obj, obj_config: dict):
+        """保存对象，对象无法被pickle时返回False"""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        suffix = ".npy" if _is_ndarray(obj) else ".pkl"
+        data_path = os.path.join(self.cache_dir, key + suffix)
+        tmp_path = f"{data_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "wb") as file:
+                if suffix == ".npy":
+                    # pylint:disable=C0415
+                    import numpy as np
+
+                    np.save(file, obj, allow_pickle=False)
+                else:
+                    pickle.dump(obj, file, protocol=pickle.HIGHEST_PROTOCOL)
+        except (pickle.PicklingError, TypeError, AttributeError, ValueError):
+            os.remove(tmp_path)
+            return False
+        meta = {
+            "clazz": obj_config.get("clazz"),
+            "name": obj_config.get("name"),
+            "created": time.time(),
+        }
+        with open(
+            os.path.join(self.cache_dir, key + ".json"), "w", encoding="utf-8"
+        ) as file:
+            json.dump(meta, file)
+        os.replace(tmp_path, data_path)
+        self.evict()
+        return True
+
+    def entries(self):
+        """按最近使用时间从新到旧排列的缓存项"""
+        if not os.path.isdir(self.cache_dir):
+            return list()
+        entries = list()
+        for file_name in os.listdir(self.cache_dir):
+            key, suffix = os.path.splitext(file_name)
+            if suffix not in DATA_SUFFIXES:
+                continue
+            data_path = os.path.join(self.cache_dir, file_name)
+            try:
+                stat = os.stat(data_path)
+            except OSError:
+                continue
+            entry = {"key": key, "path": data_path, "size": stat.st_size}
+            entry["used"] = stat.st_mtime
+            try:
+                with open(
+                    os.path.join(self.cache_dir, key + ".json"), encoding="utf-8"
+                ) as file:
+                    entry.update(json.load(file))
+            except (OSError, ValueError):
+                pass
+            entries.append(entry)
+        return sorted(entries, key=lambda entry: -entry["used"])
+
+    def _remove(self, key):
+        for suffix in DATA_SUFFIXES + (".json",):
+            try:
+                os.remove(os.path.join(self.cache_dir, key + suffix))
+            except FileNotFoundError:
+                pass
+
+    def evict(self):
+        """删除最久未使用的缓存项，直到总大小不超过max_size"""
+        with self._lock:
+            total = 0
+            for entry in self.entries():
+                total += entry["size"]
+                if total > self.max_size:
+                    self._remove(entry["key"])
+
+    def clear(self):
+        entries = self.entries()
+        for entry in entries:
+            self._remove(entry["key"])
+        return entries
@@ -0,0 +1,330 @@
+"""
+check的作用：在构造任何对象之前，以毫秒级的耗时找出配置中的全部错误：
+- 每个clazz(包括子对象的)都能通过注册表解析，
+- args能绑定到clazz的签名(inspect.signature(...).bind)，不需要真正构造，
+- 每个${name}都引用了存在的顶层对象，method_args中的${name.result}、after与input
+  引用了有method的对象，
+- 顶层对象之间没有循环引用。
+签名按clazz缓存，检查上万个对象的配置时每个clazz只解析一次签名。
+"""
+import inspect
+from functools import lru_cache
+from inspect import Parameter
+
+from fdl._factory import PLACE_HOLDER_PATTERN, REF_PATTERN, Factory
+from fdl._graph import DependencyGraph
+from fdl._runner import RESULT_SUFFIX
+from fdl._utils import is_mapped_arg
+
+
+class SignatureInfo:
+    """由签名预先算出的参数约束，绝大多数args不需要调用较慢的Signature.bind"""
+
+    __slots__ = (
+        "signature",
+        "max_positional",
+        "min_positional",
+        "keywords",
+        "required_keywords",
+        "keyword_only",
+    )
+
+    def __init__(self, signature: inspect.Signature) -> None:
+        self.signature = signature
+        params = list(signature.parameters.values())
+        positional = [
+            param
+            for param in params
+            if param.kind in (Parameter.POSITIONAL_ONLY, Parameter.POSITIONAL_OR_KEYWORD)
+        ]
+        var_positional = any(param.kind == Parameter.VAR_POSITIONAL for param in params)
+        var_keyword = any(param.kind == Parameter.VAR_KEYWORD for param in params)
+        # None表示不限
+        self.max_positional = None if var_positional else len(positional)
+        self.min_positional = sum(
+            1 for param in positional if param.default is Parameter.empty
+        )
+        self.keywords = None
+        if not var_keyword:
+            self.keywords = frozenset(
+                param.name
+                for param in params
+                if param.kind in (Parameter.POSITIONAL_OR_KEYWORD, Parameter.KEYWORD_ONLY)
+            )
+        # 只用关键字传参时必须给出的参数，有必填的仅位置参数时为None
+        self.required_keywords = frozenset(
+            param.name
+            for param in params
+            if param.default is Parameter.empty
+            and param.kind in (Parameter.POSITIONAL_OR_KEYWORD, Parameter.KEYWORD_ONLY)
+        )
+        if any(
+            param.kind == Parameter.POSITIONAL_ONLY and param.default is Parameter.empty
+            for param in params
+        ):
+            self.required_keywords = None
+        self.keyword_only = any(
+            param.kind == Parameter.KEYWORD_ONLY and param.default is Parameter.empty
+            for param in params
+        )
+
+    def fits(self, args):
+        """args能否绑定到签名"""
+        if isinstance(args, list):
+            if self.keyword_only or len(args) < self.min_positional:
+                return False
+            return self.max_positional is None or len(args) <= self.max_positional
+        if self.required_keywords is None:
+            return False
+        if self.keywords is not None and not self.keywords.issuperset(args.keys()):
+            return False
+        return self.required_keywords.issubset(args.keys())
+
+    def bind_error(self, args):
+        """args不能绑定时的错误"""
+        try:
+            if isinstance(args, list):
+                self.signature.bind(*args)
+            else:
+                self.signature.bind(**args)
+        except TypeError as error:
+            return error
+        return None
+
+
+@lru_cache(maxsize=None)
+def get_signature(clazz):
+    """clazz的签名信息，无法获取签名(部分内置类型)时返回None，不检查其参数"""
+    try:
+        return SignatureInfo(inspect.signature(clazz))
+    except (TypeError, ValueError):
+        return None
+
+
+class ConfigChecker:
+    def __init__(self, factory: Factory = None) -> None:
+        self.factory = Factory() if factory is None else factory
+        # [(位置, 异常)]
+        self.errors = list()
+        self._names = set()
+        self._core_names = set()
+        # 流式检查时，引用在全部配置读完后才检查：[(函数, 参数)]
+        self._deferred = None
+
+    def check(self, project_config: dict):
+        """检查project_config，返回全部错误"""
+        obj_configs = project_config["objects"]
+        graph = DependencyGraph(obj_configs)
+        self._set_names(obj_configs, graph.names)
+        try:
+            graph.order()
+        except ValueError as error:
+            self.errors.append(("objects", error))
+        for idx, obj_config in enumerate(obj_configs):
+            self._check_top(obj_config, f"objects[{idx}]({graph.names[idx]})")
+        return self.errors
+
+    def iter_checked(self, obj_configs, json_path: str):
+        """逐个检查obj_configs产生的顶层配置，通过后原样产出，有错误时立即抛出。
+
+        流式构造允许引用之后声明的对象，引用在配置耗尽后、构造等待中的对象之前检查。
+        循环引用由Factory.create_stream报告。
+        """
+        self._deferred = list()
+        seen = list()
+        for idx, obj_config in enumerate(obj_configs):
+            seen.append(obj_config)
+            path = f"objects[{idx}]"
+            if "name" in obj_config.keys():
+                path = f"{path}({obj_config['name']})"
+            self._check_top(obj_config, path)
+            raise_errors(self.errors, json_path)
+            yield obj_config
+        # 与DependencyGraph相同的命名方式
+        names = [
+            obj_config.get("name", f"objects_{len(seen) - 1 - idx}")
+            for idx, obj_config in enumerate(seen)
+        ]
+        self._set_names(seen, names)
+        deferred, self._deferred = self._deferred, None
+        for func, func_args in deferred:
+            func(*func_args)
+        raise_errors(self.errors, json_path)
+
+    def _set_names(self, obj_configs: list, names: list):
+        self._names = set(names)
+        self._core_names = {
+            obj_config["name"]
+            for obj_config in obj_configs
+            if "name" in obj_config.keys() and "method" in obj_config.keys()
+        }
+
+    def _check_top(self, obj_config: dict, path: str):
+        self._check_obj(obj_config, path)
+        method_args = obj_config.get("method_args", None)
+        if method_args is not None:
+            self._check_args(method_args, f"{path}.method_args", results=True)
+        if "method" in obj_config.keys():
+            if self._deferred is None:
+                self._check_method_deps(obj_config, path)
+            else:
+                self._deferred.append((self._check_method_deps, (obj_config, path)))
+
+    def _check_obj(self, obj_config: dict, path: str):
+        try:
+            clazz = self.factory._get_obj_clazz(obj_config)
+        except Exception as error:  # pylint:disable=W0703
+            # loader导入模块时的任何异常都记录下来，继续检查其余对象
+            self.errors.append((path, error))
+            clazz = None
+        args = obj_config.get("args", list())
+        if not self._check_args(args, f"{path}.args"):
+            return
+        info = None if clazz is None else get_signature(clazz)
+        if info is None or info.fits(args):
+            return
+        error = info.bind_error(args)
+        if error is not None:
+            signature = f"{obj_config['clazz']}{info.signature}"
+            self.errors.append(
+                (f"{path}.args", TypeError(f"args don't match {signature}: {error}"))
+            )
+
+    def _check_args(self, args, path: str, results: bool = False):
+        """与Factory._preprocess_args的处理一一对应，args不是容器时返回False"""
+        if isinstance(args, list):
+            args_iter = enumerate(args)
+        elif isinstance(args, dict):
+            args_iter = args.items()
+        else:
+            self.errors.append(
+                (
+                    path,
+                    TypeError(
+                        "unexpected args type, expected list or dict, got"
+                        f" {type(args)}"
+                    ),
+                )
+            )
+            return False
+        for arg_key, arg_value in args_iter:
+            arg_path = f"{path}.{arg_key}"
+            if isinstance(arg_value, dict):
+                if "clazz" in arg_value.keys():
+                    self._check_obj(arg_value, arg_path)
+                elif not is_mapped_arg(arg_value):
+                    self._check_args(arg_value, arg_path, results)
+            elif isinstance(arg_value, list):
+                self._check_args(arg_value, arg_path, results)
+            elif isinstance(arg_value, str):
+                if arg_value.count("@@") >= 2:
+                    for name in PLACE_HOLDER_PATTERN.findall(arg_value):
+                        self._check_ref(name, arg_path, results, command=True)
+                elif "${" in arg_value:
+                    match = REF_PATTERN.search(arg_value)
+                    if match:
+                        self._check_ref(match.group(1), arg_path, results)
+        return True
+
+    def _check_method_deps(self, obj_config: dict, path: str):
+        """after与input中的名字都是有method的顶层对象，与_runner.build_method_graph一致"""
+        after = obj_config.get("after", list())
+        if isinstance(after, str):
+            after = [after]
+        if not isinstance(after, list):
+            self.errors.append(
+                (f"{path}.after", TypeError(f"after expected list, got {type(after)}"))
+            )
+            after = list()
+        for name in after:
+            if name not in self._core_names:
+                self.errors.append(
+                    (
+                        f"{path}.after",
+                        ValueError(
+                            f"depends on {name}, which is not a top object with"
+                            " 'method'."
+                        ),
+                    )
+                )
+        stage_input = obj_config.get("input", None)
+        if stage_input is None:
+            return
+        match = None
+        if isinstance(stage_input, str):
+            match = REF_PATTERN.fullmatch(stage_input)
+        if match is None:
+            self.errors.append(
+                (
+                    f"{path}.input",
+                    TypeError(f"input expected to be '${{name}}', got {stage_input}"),
+                )
+            )
+        elif match.group(1) not in self._core_names:
+            self.errors.append(
+                (
+                    f"{path}.input",
+                    ValueError(
+                        f"input {match.group(1)} is not a top object with 'method'."
+                    ),
+                )
+            )
+
+    def _check_ref(self, name: str, path: str, results: bool, command=False):
+        if self._deferred is not None:
+            self._deferred.append((self._check_ref, (name, path, results, command)))
+            return
+        if name in self._names:
+            return
+        if results and name.endswith(RESULT_SUFFIX):
+            if name[: -len(RESULT_SUFFIX)] in self._core_names:
+                return
+        # 与构造时的报错相同
+        if command:
+            msg = f"{name} not found in objs_pool"
+        else:
+            msg = f"find ref object {name} failed"
+        self.errors.append(
+            (
+                path,
+                KeyError(
+                    f"{msg}, this may caused by wrong words in json. Only top objects"
+                    " with 'name' can be referenced."
+                ),
+            )
+        )
+
+
+# 检查本身产生的异常类型，只有一个错误时保持其类型；loader等抛出的其它异常的
+# 构造函数参数未知，统一报告为ValueError
+CHECK_ERROR_TYPES = (KeyError, TypeError, ValueError)
+
+
+def error_message(error: Exception):
+    # KeyError的str带引号
+    if isinstance(error, KeyError) and len(error.args) == 1:
+        return str(error.args[0])
+    return str(error) or type(error).__name__
+
+
+def format_errors(errors: list):
+    return "\n".join(f"{path}: {error_message(error)}" for path, error in errors)
+
+
+def raise_errors(errors: list, json_path: str):
+    """有错误时一次报告全部，只有一个错误时保持其原本的异常类型"""
+    if not errors:
+        return
+    if len(errors) == 1:
+        path, error = errors[0]
+        msg = f"{json_path} {path}: {error_message(error)}"
+        error_type = type(error) if type(error) in CHECK_ERROR_TYPES else ValueError
+        raise error_type(msg) from error
+    raise ValueError(
+        f"{len(errors)} errors found in {json_path}:\n{format_errors(errors)}"
+    )
+
+
+def check_objects_config(project_config: dict, json_path: str):
+    """构造前检查，有错误时一次报告全部"""
+    raise_errors(ConfigChecker().check(project_config), json_path)
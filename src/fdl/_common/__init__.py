@@ -1,2 +1,3 @@
 from .dict_config import Config
 from .log import Logger
+from .profile import Profiler
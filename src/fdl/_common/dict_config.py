@@ -1,66 +1,65 @@
 # pylint:disable=C0114,C0115,C0116
-import json
+from fdl._utils import read_json_from_file
 
 
 class Config(dict):
-    @classmethod
-    def from_dict(cls, **kwargs) -> None:
-        config = cls()
-        for key, value in kwargs.items():
-            if isinstance(value, dict):
-                value = Config.from_dict(**value)
-            if isinstance(value, list):
-                for index, item in enumerate(value):
-                    if isinstance(item, dict):
-                        value[index] = Config.from_dict(**item)
-            config[key] = value
-        return config
-
-    def read(self, config_path):
-        with open(config_path, "r", encoding="utf-8") as file:
-            content = file.read()
-        data = json.loads(content)
-        if isinstance(data, list):
-            data = {"objects": data}
-        for key, value in data.items():
-            if isinstance(value, dict):
-                value = Config.from_dict(**value)
-            if isinstance(value, list):
-                for index, item in enumerate(value):
-                    if isinstance(item, dict):
-                        value[index] = Config.from_dict(**item)
-            self[key] = value
-        return self
+    """配置节点。数据只保存在dict本身，属性访问直接映射到键值。
 
-    def get(self, key, default=None):
-        if key in self.__dict__:
-            return getattr(self, key)
-        else:
-            return default
+    与dict方法同名的键(如items、keys)只能通过config["items"]访问。
+    支持弱引用，以便对象以weakref的方式持有_init_config。
+    """
 
-    def keys(self):
-        return self.__dict__.keys()
+    __slots__ = ("__weakref__",)
 
-    def items(self):
-        return self.__dict__.items()
+    @classmethod
+    def from_dict(cls, **kwargs) -> None:
+        return cls.convert(kwargs)
 
-    def values(self):
-        return self.__dict__.values()
+    @classmethod
+    def convert(cls, data: dict):
+        """将data及其中嵌套的dict都转换为Config。
 
-    def __len__(self):
-        return len(self.__dict__)
+        使用显式栈代替递归，嵌套list原地替换元素，适用于节点数量很大的配置。
+        """
+        root = cls(data)
+        stack = [root]
+        while stack:
+            container = stack.pop()
+            if isinstance(container, dict):
+                items = container.items()
+            else:
+                items = enumerate(container)
+            for key, value in items:
+                if isinstance(value, dict):
+                    value = cls(value)
+                    container[key] = value
+                    stack.append(value)
+                elif isinstance(value, list):
+                    stack.append(value)
+        return root
 
-    def __getitem__(self, key):
-        return getattr(self, key)
+    def read(self, config_path):
+        # 与fdl run使用同一个解析函数，同一个文件在两处的解析结果一致
+        return self.load(read_json_from_file(config_path))
 
-    def __setitem__(self, key, value):
-        return setattr(self, key, value)
+    def load(self, data):
+        """从已经解析好的json数据(dict或list)构造配置"""
+        if isinstance(data, list):
+            data = {"objects": data}
+        self.update(Config.convert(data))
+        return self
 
-    def __contains__(self, key):
-        return key in self.__dict__
+    def __getattr__(self, key):
+        try:
+            return self[key]
+        except KeyError as error:
+            raise AttributeError(key) from error
 
-    def __repr__(self):
-        return self.__dict__.__repr__()
+    def __setattr__(self, key, value):
+        self[key] = value
 
-    def __iter__(self):
-        return iter(self.keys())
+    def __delattr__(self, key):
+        try:
+            del self[key]
+        except KeyError as error:
+            raise AttributeError(key) from error
@@ -1,5 +1,6 @@
 import logging as FatherLog
 import os
+import threading
 
 COLOR_DIC = {
     "ERROR": "31",
@@ -28,23 +29,31 @@ class ColorFormatter(FatherLog.Formatter):
 class Logger(FatherLog.Logger):
     instance = None
     init = False
+    _instance_lock = threading.Lock()
 
     def __new__(cls):
         if Logger.instance is None:
-            Logger.instance = super().__new__(cls)
+            with Logger._instance_lock:
+                if Logger.instance is None:
+                    Logger.instance = super().__new__(cls)
         return Logger.instance
 
     def __init__(self) -> None:
         if Logger.init:
             return
-        super().__init__("logger", 0)
-        self.fmt = "[%(asctime)s %(levelname)s %(pathname)s:%(lineno)d] %(message)s"
-        stream_handler = FatherLog.StreamHandler()
-        color_formater = ColorFormatter(self.fmt, True)
-        stream_handler.setFormatter(color_formater)
-        stream_handler.setLevel(FatherLog.INFO)
-        self.addHandler(stream_handler)
-        Logger.init = True
+        with Logger._instance_lock:
+            if Logger.init:
+                return
+            super().__init__("logger", 0)
+            self.fmt = (
+                "[%(asctime)s %(levelname)s %(pathname)s:%(lineno)d] %(message)s"
+            )
+            stream_handler = FatherLog.StreamHandler()
+            color_formater = ColorFormatter(self.fmt, True)
+            stream_handler.setFormatter(color_formater)
+            stream_handler.setLevel(FatherLog.INFO)
+            self.addHandler(stream_handler)
+            Logger.init = True
 
     def set_log_path(self, log_folder, log_file_name="log.txt"):
         """设置日志文件的保存位置，将保存在log_folder/log.txt下
@@ -0,0 +1,114 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+
+def get_rss():
+    """当前进程的常驻内存(字节)，无法获取时返回0"""
+    try:
+        with open("/proc/self/statm", "r", encoding="utf-8") as file:
+            return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        import resource
+
+        # 非linux平台只能拿到峰值内存，macOS单位是字节，其余是KB
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return max_rss if os.uname().sysname == "Darwin" else max_rss * 1024
+    except (ImportError, AttributeError):
+        return 0
+
+
+class Profiler:
+    """fdl run启动耗时分析：记录各阶段耗时，以及每个对象的构造耗时与内存变化。
+
+    只有enable后才记录阶段与对象并输出报告，未开启时常驻进程中的记录不会无限增长。
+    """
+
+    instance = None
+    init = False
+    _instance_lock = threading.Lock()
+
+    def __new__(cls):
+        if Profiler.instance is None:
+            with Profiler._instance_lock:
+                if Profiler.instance is None:
+                    Profiler.instance = super().__new__(cls)
+        return Profiler.instance
+
+    def __init__(self) -> None:
+        if Profiler.init:
+            return
+        with Profiler._instance_lock:
+            if Profiler.init:
+                return
+            self.enabled = False
+            self.phases = list()
+            self.objects = list()
+            self._local = threading.local()
+            Profiler.init = True
+
+    def enable(self):
+        self.enabled = True
+
+    def clear(self):
+        self.phases.clear()
+        self.objects.clear()
+
+    def add_phase(self, name, start, end):
+        if self.enabled:
+            self.phases.append({"phase": name, "wall": end - start})
+        return end - start
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_phase(name, start, time.perf_counter())
+
+    @contextmanager
+    def profile_obj(self, obj_config: dict):
+        depth = getattr(self._local, "depth", 0)
+        self._local.depth = depth + 1
+        rss = get_rss()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            # 子对象在父对象之前构造完成，父对象的耗时包含子对象
+            self.objects.append(
+                {
+                    "clazz": obj_config.get("clazz"),
+                    "name": obj_config.get("name"),
+                    "depth": depth,
+                    "wall": time.perf_counter() - start,
+                    "rss_delta": get_rss() - rss,
+                }
+            )
+            self._local.depth = depth
+
+    def report(self, work_dir=None, top=20):
+        print("=============profile: phases=============")
+        print(f"{'wall(s)':>10}  phase")
+        for phase in sorted(self.phases, key=lambda item: -item["wall"]):
+            print(f"{phase['wall']:>10.4f}  {phase['phase']}")
+        objects = sorted(self.objects, key=lambda item: -item["wall"])
+        title = f"profile: objects (top {top} of {len(objects)})"
+        print(f"============={title}=============")
+        print(f"{'wall(s)':>10}{'rss delta(MB)':>15}{'depth':>7}  clazz(name)")
+        for obj in objects[:top]:
+            name = "" if obj["name"] is None else f"({obj['name']})"
+            print(
+                f"{obj['wall']:>10.4f}{obj['rss_delta'] / 2**20:>15.2f}"
+                f"{obj['depth']:>7}  {obj['clazz']}{name}"
+            )
+        if work_dir is not None:
+            profile_path = os.path.join(work_dir, "profile.json")
+            with open(profile_path, "w", encoding="utf-8") as file:
+                json.dump({"phases": self.phases, "objects": objects}, file, indent=2)
+            print(f"saved profile to {profile_path}")
@@ -0,0 +1,166 @@
+"""
+compile的作用：
+- 在fdl run之前完成与具体运行无关的工作：校验配置(包括fdl check的全部检查)、
+  建立依赖图并检查循环引用，
+- 把clazz注册名解析为可以直接导入的模块路径，
+- 把每个对象参数中的${name}、@@...@@、子对象预先解析为操作列表，
+- 预先编译@@...@@中的代码，
+- 以二进制(pickle)保存，fdl run读取后直接按计划构造，不再解析json与扫描参数。
+代码对象与python版本相关，python版本不同时需要重新编译。
+"""
+import importlib
+import marshal
+import os
+import pickle
+import sys
+
+from fdl._check import check_objects_config
+from fdl._common import Config, Logger
+from fdl._factory import (
+    OP_COMMAND,
+    OP_NESTED,
+    OP_OBJ,
+    Factory,
+    compile_args,
+    compile_command,
+)
+from fdl._graph import DependencyGraph
+from fdl._utils import assert_file_exists, check_config_file
+
+PLAN_FORMAT = 1
+PLAN_SUFFIX = ".fdlc"
+
+
+def _walk_ops(ops, clazz_names: set, subs: set):
+    """收集操作中用到的clazz注册名与命令代码"""
+    for _, op, data in ops:
+        if op == OP_COMMAND:
+            subs.add(data[0])
+        elif op == OP_OBJ:
+            clazz_names.add(data[0])
+            _walk_ops(data[1], clazz_names, subs)
+        elif op == OP_NESTED:
+            _walk_ops(data, clazz_names, subs)
+
+
+def _clazz_location(clazz):
+    """(模块名, qualname, 模块所在的sys.path根目录)"""
+    module_name = clazz.__module__
+    module_file = getattr(sys.modules.get(module_name, None), "__file__", None)
+    root = None
+    if module_file is not None:
+        root = os.path.dirname(os.path.abspath(module_file))
+        if os.path.basename(module_file) == "__init__.py":
+            root = os.path.dirname(root)
+        # 包内模块的根目录在包的上层
+        for _ in range(module_name.count(".")):
+            root = os.path.dirname(root)
+    return module_name, clazz.__qualname__, root
+
+
+def compile_config(json_path: str):
+    """编译json配置，返回可以交给save_plan的数据"""
+    project_config = Config().load(check_config_file(json_path))
+    check_objects_config(project_config, json_path)
+    obj_configs = project_config["objects"]
+    graph = DependencyGraph(obj_configs)
+    # 循环引用在编译时就报出
+    graph.order()
+    clazz_names = set()
+    subs = set()
+    nodes = list()
+    for obj_config in obj_configs:
+        node = (obj_config["clazz"], compile_args(obj_config.get("args", list())))
+        clazz_names.add(node[0])
+        _walk_ops(node[1], clazz_names, subs)
+        nodes.append(node)
+    factory = Factory()
+    clazzs = {
+        clazz_name: _clazz_location(factory._get_obj_clazz({"clazz": clazz_name}))
+        for clazz_name in sorted(clazz_names)
+    }
+    # 语法错误在编译时就报出
+    codes = {sub: marshal.dumps(compile_command(sub)) for sub in sorted(subs)}
+    stat = os.stat(json_path)
+    return {
+        "format": PLAN_FORMAT,
+        "python": tuple(sys.version_info[:2]),
+        "source": {
+            "path": os.path.abspath(json_path),
+            "mtime": stat.st_mtime,
+            "size": stat.st_size,
+        },
+        "config": project_config,
+        "names": graph.names,
+        "deps": [sorted(dep) for dep in graph.deps],
+        "nodes": nodes,
+        "clazzs": clazzs,
+        "codes": codes,
+    }
+
+
+def save_plan(data: dict, plan_path: str):
+    with open(plan_path, "wb") as file:
+        pickle.dump(data, file, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def _import_clazz(clazz_name, module_name, qualname, root):
+    """注册表中没有时(未-b绑定)，按编译时记录的位置导入"""
+    if "<locals>" in qualname or module_name == "__main__":
+        raise ImportError(
+            f"clazz {clazz_name} ({module_name}.{qualname}) can't be imported, register"
+            " it before loading the compiled config."
+        )
+    if root is not None and root not in sys.path:
+        sys.path.append(root)
+    obj = importlib.import_module(module_name)
+    for attr in qualname.split("."):
+        obj = getattr(obj, attr)
+    return obj
+
+
+class CompiledPlan:
+    """load_plan的结果，交给Factory.create_compiled构造"""
+
+    def __init__(self, data: dict, clazzs: dict) -> None:
+        self.config = data["config"]
+        self.graph = DependencyGraph.from_deps(data["names"], data["deps"])
+        self.nodes = data["nodes"]
+        self.clazzs = clazzs
+        self.codes = {sub: marshal.loads(code) for sub, code in data["codes"].items()}
+        self.source = data["source"]
+
+
+def load_plan(plan_path: str):
+    """读取fdl compile的结果。pickle会执行任意代码，只读取可信的文件"""
+    assert_file_exists(plan_path)
+    with open(plan_path, "rb") as file:
+        data = pickle.load(file)
+    if not isinstance(data, dict) or data.get("format", None) != PLAN_FORMAT:
+        raise ValueError(
+            f"{plan_path} is not a compiled config of this fdl version, recompile it."
+        )
+    if tuple(data["python"]) != tuple(sys.version_info[:2]):
+        python = ".".join(map(str, data["python"]))
+        raise ValueError(
+            f"{plan_path} is compiled with python {python}, recompile it with the"
+            " current python."
+        )
+    source = data["source"]
+    try:
+        stat = os.stat(source["path"])
+    except OSError:
+        pass
+    else:
+        if stat.st_mtime != source["mtime"] or stat.st_size != source["size"]:
+            Logger().warning(
+                f"{source['path']} is modified after compiled to {plan_path}."
+            )
+    name2clazz = Factory().get_name2clazz()
+    clazzs = dict()
+    for clazz_name, location in data["clazzs"].items():
+        clazz = name2clazz.get(clazz_name, None)
+        if clazz is None:
+            clazz = _import_clazz(clazz_name, *location)
+        clazzs[clazz_name] = clazz
+    return CompiledPlan(data, clazzs)
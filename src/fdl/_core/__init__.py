@@ -1,3 +1,8 @@
 from .command_gen import gen_json
 from .command_run import run
 from .command_show import show
+from .command_serve import serve
+from .command_sweep import sweep
+from .command_cache import cache
+from .command_compile import compile_json
+from .command_check import check
@@ -0,0 +1,28 @@
+import time
+
+from fdl._cache import ObjectCache
+
+
+def print_cache_entries(entries):
+    total = sum(entry["size"] for entry in entries)
+    title = f"cache: {len(entries)} objects, {total / 2**20:.2f}MB"
+    print(f"============={title}=============")
+    print(f"{'key':<14}{'size(MB)':>10}  {'last used':<21}clazz(name)")
+    for entry in entries:
+        used = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(entry["used"]))
+        name = "" if entry.get("name") is None else f"({entry['name']})"
+        print(
+            f"{entry['key'][:12]:<14}{entry['size'] / 2**20:>10.2f}  {used:<21}"
+            f"{entry.get('clazz')}{name}"
+        )
+
+
+def cache(args):
+    object_cache = ObjectCache()
+    if args.action == "ls":
+        print(f"cache dir: {object_cache.cache_dir}")
+        print_cache_entries(object_cache.entries())
+    elif args.action == "clear":
+        entries = object_cache.clear()
+        total = sum(entry["size"] for entry in entries)
+        print(f"removed {len(entries)} cached objects, {total / 2**20:.2f}MB.")
@@ -0,0 +1,20 @@
+import time
+
+from fdl._check import ConfigChecker, format_errors
+from fdl._common import Config
+from fdl._utils import check_config_file
+
+
+def check(args):
+    start = time.perf_counter()
+    project_config = Config().load(check_config_file(args.check_json_path))
+    errors = ConfigChecker().check(project_config)
+    cost = (time.perf_counter() - start) * 1000
+    size = len(project_config["objects"])
+    if errors:
+        print(format_errors(errors))
+        raise ValueError(
+            f"{len(errors)} errors found in {args.check_json_path}, checked {size} top"
+            f" objects in {cost:.1f}ms."
+        )
+    print(f"{args.check_json_path} is ok, checked {size} top objects in {cost:.1f}ms.")
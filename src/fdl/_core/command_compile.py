@@ -0,0 +1,16 @@
+import os
+
+from fdl._compile import PLAN_SUFFIX, compile_config, save_plan
+
+
+def compile_json(args):
+    json_path = args.compile_json_path
+    plan_path = args.output
+    if plan_path is None:
+        plan_path = os.path.splitext(json_path)[0] + PLAN_SUFFIX
+    data = compile_config(json_path)
+    save_plan(data, plan_path)
+    print(
+        f"compiled {json_path} to {plan_path}: {len(data['nodes'])} top objects,"
+        f" {len(data['clazzs'])} clazzs, {len(data['codes'])} commands."
+    )
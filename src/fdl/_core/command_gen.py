@@ -1,7 +1,7 @@
 import json
 from copy import deepcopy
 
-from fdl._factory import Factory
+from fdl._manifest import IndexedClazz
 from fdl._utils import gen_clazz_example_obj
 
 FDL_JSON = {
@@ -16,9 +16,11 @@ def parse_args(args):
 
 
 def gen_json(args):
+    # fdl.modules默认按需导入，尽量从索引回答，不导入模块
+    from fdl.modules import get_all_clazzs
+
     clazzs, output_path = parse_args(args)
-    factory = Factory()
-    name2clazz = factory.get_name2clazz()
+    name2clazz = get_all_clazzs()
     clazz_count = dict()
     output_json = deepcopy(FDL_JSON)
     for clazz_name in clazzs:
@@ -28,7 +30,10 @@ def gen_json(args):
             count += 1
             clazz_count[clazz_name] = count
             clazz = name2clazz[clazz_name]
-            obj_config = gen_clazz_example_obj(clazz, clazz_name)
+            if isinstance(clazz, IndexedClazz):
+                obj_config = clazz.gen_example_obj(clazz_name)
+            else:
+                obj_config = gen_clazz_example_obj(clazz, clazz_name)
             # 设置
             obj_config["clazz"] = obj_clazz
             output_json["objects"].append(obj_config)
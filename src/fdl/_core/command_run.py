@@ -1,6 +1,22 @@
-from fdl._common import Config, Logger
+import os
+import time
+import traceback
+
+from fdl._check import ConfigChecker, check_objects_config
+from fdl._common import Config, Logger, Profiler
+from fdl._compile import PLAN_SUFFIX, load_plan
+from fdl._core.command_serve import submit_run
 from fdl._factory import Factory
-from fdl._utils import check_config_file, copy_if_not_exists, create_workfolder
+from fdl._graph import DependencyGraph
+from fdl._runner import METHOD_KEYS, MethodRunner
+from fdl._stream import ConfigStream
+from fdl._utils import (
+    JSON_BACKEND,
+    check_config_file,
+    config_hash,
+    copy_if_not_exists,
+    create_workfolder,
+)
 
 
 def is_create_workfolder(project_config: dict):
@@ -13,39 +29,331 @@ def is_create_workfolder(project_config: dict):
     return True
 
 
-def run(args):
-    json_path = args.run_json_path
-    check_config_file(json_path)
+def get_construct_workers(args, project_config: dict):
+    """命令行--workers优先，其次是task中的parallel_construct"""
+    workers = getattr(args, "workers", None)
+    if workers is None and isinstance(project_config.get("task"), dict):
+        workers = project_config["task"].get("parallel_construct", None)
+    # bool是int的子类，"parallel_construct": true不能被当作1个线程
+    if workers is not None and (
+        not isinstance(workers, int) or isinstance(workers, bool)
+    ):
+        raise TypeError(
+            f"parallel construct workers expected int, got {type(workers)}"
+        )
+    return workers
+
+
+def is_lazy_construct(args, project_config: dict):
+    """命令行--lazy，或task中的lazy_construct"""
+    if getattr(args, "lazy", False):
+        return True
+    if isinstance(project_config.get("task"), dict):
+        return bool(project_config["task"].get("lazy_construct", False))
+    return False
+
+
+def is_share_objects(args, project_config: dict):
+    """命令行--share，或task中的share_objects"""
+    if getattr(args, "share", False):
+        return True
+    if isinstance(project_config.get("task"), dict):
+        return bool(project_config["task"].get("share_objects", False))
+    return False
+
+
+def is_concurrent_methods(args, project_config: dict):
+    """命令行--concurrent，或task中的concurrent_methods"""
+    if getattr(args, "concurrent", False):
+        return True
+    if isinstance(project_config.get("task"), dict):
+        return bool(project_config["task"].get("concurrent_methods", False))
+    return False
+
+
+def preflight_check(args, project_config: Config, json_path: str):
+    """构造前检查clazz、args签名与引用，命令行--no-check跳过"""
+    if getattr(args, "no_check", False):
+        return
+    check_objects_config(project_config, json_path)
+
+
+def get_init_config_policy(args, project_config: dict):
+    """命令行--init-config优先，其次是task中的init_config"""
+    policy = getattr(args, "init_config", None)
+    if policy is None and isinstance(project_config.get("task"), dict):
+        policy = project_config["task"].get("init_config", None)
+    return "full" if policy is None else policy
 
-    project_config = Config()
-    project_config.read(json_path)
 
+def print_init_config_report(report: dict):
+    print("=============init_config retention=============")
+    print(f"{'policy':<16}{'retained bytes':>16}{'saved bytes':>16}")
+    for policy, (retained, saved) in report.items():
+        print(f"{policy:<16}{retained:>16}{saved:>16}")
+
+
+def setup_workfolder(project_config: dict, json_path: str):
+    """task中设置了saved_path时创建工作目录，并备份json文件"""
+    if not is_create_workfolder(project_config):
+        return
     logging = Logger()
+    work_dir = create_workfolder(
+        project_config["task"]["saved_path"], project_config["task"].get("name", "")
+    )
+    logging.set_log_path(work_dir)
+    # backup json file.
+    if os.path.isfile(json_path):
+        copy_if_not_exists(json_path, logging.get_work_dir())
+
+
+def run(args):
+    if getattr(args, "daemon", False):
+        submit_run(args)
+        return
+    profiler = Profiler()
+    try:
+        if getattr(args, "watch", False):
+            run_watch(args, profiler)
+        elif args.run_json_path.endswith(PLAN_SUFFIX):
+            run_plan(args, profiler)
+        elif getattr(args, "stream", False):
+            run_stream(args, profiler)
+        else:
+            run_json(args, profiler)
+    finally:
+        # 监视模式每次重新加载后单独报告
+        if profiler.enabled and not getattr(args, "watch", False):
+            profiler.report(getattr(Logger(), "log_folder", None))
+
+
+def run_json(args, profiler: Profiler):
+    json_path = args.run_json_path
+    # 只解析一次json文件，校验与构造配置都使用同一份解析结果
+    with profiler.phase("check_config_file"):
+        data = check_config_file(json_path)
+    with profiler.phase("Config.load"):
+        project_config = Config().load(data)
+    del data
+    with profiler.phase("preflight check"):
+        preflight_check(args, project_config, json_path)
+
     # create workspace if set
-    if is_create_workfolder(project_config):
-        work_dir = create_workfolder(
-            project_config["task"]["saved_path"], project_config["task"].get("name", "")
+    setup_workfolder(project_config, json_path)
+    Logger().debug(f"load {json_path} with {JSON_BACKEND}")
+    factory = create_objects(args, project_config, profiler)
+    concurrent = is_concurrent_methods(args, project_config)
+    # 之后只需要core对象的配置，释放配置树，使init_config策略真正生效
+    del project_config
+    if getattr(args, "init_config_report", False):
+        print_init_config_report(factory.init_config_report())
+    run_core_objs(factory, profiler, concurrent)
+
+
+def run_plan(args, profiler: Profiler):
+    """运行fdl compile编译出的配置，跳过json解析与参数扫描"""
+    if getattr(args, "stream", False):
+        raise ValueError("compiled config can't be run in stream mode.")
+    with profiler.phase("load_plan"):
+        plan = load_plan(args.run_json_path)
+    setup_workfolder(plan.config, plan.source["path"])
+    factory = create_objects(args, plan.config, profiler, plan)
+    concurrent = is_concurrent_methods(args, plan.config)
+    del plan
+    if getattr(args, "init_config_report", False):
+        print_init_config_report(factory.init_config_report())
+    run_core_objs(factory, profiler, concurrent)
+
+
+def run_stream(args, profiler: Profiler):
+    """边解析边构造，task等设置需要写在objects之前"""
+    json_path = args.run_json_path
+    stream = ConfigStream(json_path)
+    with profiler.phase("read config header"):
+        header = Config().load(stream.read_header())
+    workers = get_construct_workers(args, header)
+    if is_lazy_construct(args, header) or (workers is not None and workers > 1):
+        stream.close()
+        raise ValueError(
+            "stream mode constructs objects while parsing, it can't be used with lazy"
+            " or parallel construct."
         )
-        logging.set_log_path(work_dir)
-        # backup json file.
-        copy_if_not_exists(json_path, logging.get_work_dir())
+    setup_workfolder(header, json_path)
+    factory = setup_factory(args, header, profiler)
+    obj_configs = stream.iter_objects()
+    if not getattr(args, "no_check", False):
+        # 每个对象在构造前检查，引用在全部对象读完后检查
+        obj_configs = ConfigChecker().iter_checked(obj_configs, json_path)
+    with profiler.phase("Factory.create_stream"):
+        factory.create_stream(obj_configs)
+    factory.set_profiler(None)
+    if "task" in stream.tail:
+        Logger().warning("task after objects is ignored in stream mode.")
+    if getattr(args, "init_config_report", False):
+        print_init_config_report(factory.init_config_report())
+    run_core_objs(factory, profiler, is_concurrent_methods(args, header))
+
+
+class ConfigWatcher:
+    """fdl run --watch：json修改后，只重新构造配置变化的对象以及引用了它们的对象"""
+
+    def __init__(self, args, factory: Factory, profiler: Profiler) -> None:
+        self.args = args
+        self.json_path = args.run_json_path
+        self.factory = factory
+        self.profiler = profiler
+        # 对象池中每个顶层对象构造时的配置哈希
+        self.hashes = dict()
+        self._stamp = None
+
+    def poll(self):
+        """json文件是否在上次读取后被修改"""
+        try:
+            stat = os.stat(self.json_path)
+        except OSError:
+            # 编辑器保存时文件可能短暂不存在
+            return False
+        stamp = (stat.st_mtime_ns, stat.st_size)
+        if stamp == self._stamp:
+            return False
+        self._stamp = stamp
+        return True
+
+    def reload(self):
+        """重新读取json并更新对象池，返回是否成功。失败时打印异常，继续监视"""
+        try:
+            project_config = Config().load(check_config_file(self.json_path))
+            # 有错误的配置不会破坏对象池
+            preflight_check(self.args, project_config, self.json_path)
+        except Exception:  # pylint:disable=W0703
+            traceback.print_exc()
+            return False
+        obj_configs = project_config["objects"]
+        graph = DependencyGraph(obj_configs)
+        # method相关的键只影响调用，修改它们不需要重新构造
+        new_hashes = {
+            name: config_hash(
+                {
+                    key: value
+                    for key, value in obj_config.items()
+                    if key not in METHOD_KEYS
+                }
+            )
+            for name, obj_config in zip(graph.names, obj_configs)
+        }
+        changed = [
+            idx
+            for idx, name in enumerate(graph.names)
+            if self.hashes.get(name, None) != new_hashes[name]
+        ]
+        rebuilt = graph.dependents(changed)
+        keep = {name for idx, name in enumerate(graph.names) if idx not in rebuilt}
+        try:
+            with self.profiler.phase("Factory.recreate"):
+                self.factory.recreate(
+                    project_config,
+                    keep,
+                    workers=get_construct_workers(self.args, project_config),
+                    lazy=is_lazy_construct(self.args, project_config),
+                )
+        except Exception:  # pylint:disable=W0703
+            traceback.print_exc()
+            return False
+        finally:
+            # 构造失败时，对象池中的对象仍然都是按新配置构造或沿用的
+            name2obj = self.factory.get_name2obj()
+            self.hashes = {
+                name: value for name, value in new_hashes.items() if name in name2obj
+            }
+        print(
+            f"reloaded {self.json_path}: rebuilt"
+            f" {[graph.names[idx] for idx in sorted(rebuilt)]}, kept"
+            f" {graph.size - len(rebuilt)} objects."
+        )
+        try:
+            run_core_objs(
+                self.factory,
+                self.profiler,
+                is_concurrent_methods(self.args, project_config),
+            )
+        except Exception:  # pylint:disable=W0703
+            traceback.print_exc()
+            return False
+        return True
+
+
+def run_watch(args, profiler: Profiler, interval: float = 0.5):
+    """常驻进程，json每次被修改后增量更新对象池并重新调用method，Ctrl+C退出。
+
+    task中的设置只在启动时读取一次。
+    """
+    json_path = args.run_json_path
+    if json_path.endswith(PLAN_SUFFIX) or getattr(args, "stream", False):
+        raise ValueError(
+            "watch mode reloads the json file, it can't be used with stream mode or"
+            " compiled configs."
+        )
+    project_config = Config().load(check_config_file(json_path))
+    setup_workfolder(project_config, json_path)
+    factory = setup_factory(args, project_config, profiler)
+    del project_config
+    watcher = ConfigWatcher(args, factory, profiler)
+    try:
+        while True:
+            if watcher.poll():
+                watcher.reload()
+                if profiler.enabled:
+                    profiler.report(getattr(Logger(), "log_folder", None))
+                # 每次重新加载的记录单独报告，不累积
+                profiler.clear()
+                print(f"watching {json_path}, press Ctrl+C to stop.")
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        pass
+
+
+def setup_factory(args, project_config: Config, profiler: Profiler):
+    """按命令行与task设置默认factory，返回factory"""
+    # 每次运行都从空的对象池开始，上次运行构造的对象不会与本次冲突
     factory = Factory()
-    factory.create(project_config)
-    # run object with 'method'
+    factory.reset()
+    factory.set_init_config_policy(get_init_config_policy(args, project_config))
+    factory.set_share_objects(is_share_objects(args, project_config))
+    if getattr(args, "init_config_report", False):
+        factory.enable_init_config_report()
+    if profiler.enabled:
+        factory.set_profiler(profiler)
+    return factory
+
+
+def create_objects(args, project_config: Config, profiler: Profiler, plan=None):
+    """用默认factory构造project_config中的对象，返回factory。
+
+    plan是project_config编译后的结果(_compile.CompiledPlan)，给出时按计划构造。
+    """
+    factory = setup_factory(args, project_config, profiler)
+    workers = get_construct_workers(args, project_config)
+    lazy = is_lazy_construct(args, project_config)
+    with profiler.phase("Factory.create"):
+        if plan is None:
+            factory.create(project_config, workers=workers, lazy=lazy)
+        else:
+            factory.create_compiled(plan, workers=workers, lazy=lazy)
+    factory.set_profiler(None)
+    return factory
+
+
+def run_core_objs(factory: Factory, profiler: Profiler, concurrent: bool = False):
+    """调用core对象的method。
+
+    默认按声明顺序，设置了concurrent的并发执行，设置了after或引用了${name.result}时
+    按依赖图调度。
+    """
     core_objs = factory.get_core_objs()
     if len(core_objs) == 0:
         print(
             "No object with 'method' config in json. Nothing to run. Try set 'method' attr to top objects."
         )
         return
-    for obj in core_objs:
-        assert hasattr(obj, "_init_config")
-        assert hasattr(obj._init_config, "method")
-        func_to_run = obj._init_config.method
-        if not hasattr(obj, func_to_run):
-            raise AttributeError(
-                f"object {obj._init_config.name} don't have method {func_to_run}"
-            )
-        else:
-            func = getattr(obj, func_to_run)
-            func()
+    runner = MethodRunner(profiler, factory)
+    runner.run(core_objs, factory.get_core_configs(), concurrent)
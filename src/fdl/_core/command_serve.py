@@ -0,0 +1,221 @@
+"""
+fdl serve：常驻进程，预先导入全部模块，通过unix socket接收fdl run --daemon提交的任务。
+每个任务在fork出的子进程中执行Factory.create与method调用，子进程继承已经导入的模块
+与注册表，其stdout/stderr直接写回socket，结束时发送退出码。
+daemon启动后被修改过的-b模块在子进程中重新导入，不需要重启daemon。
+"""
+import argparse
+import importlib
+import json
+import os
+import re
+import signal
+import socket
+import sys
+import traceback
+
+from fdl._common import Profiler
+from fdl._factory import Factory
+from fdl._utils import bind, get_cache_dir, is_json_serializable
+
+EXIT_MARKER = b"\0FDL_EXIT:"
+# daemon启动时已导入模块的源文件：模块名 -> (路径, (st_mtime_ns, st_size))
+_module_mtimes = dict()
+
+
+def _snapshot_modules():
+    for name, module in list(sys.modules.items()):
+        path = getattr(module, "__file__", None)
+        if path is None:
+            continue
+        try:
+            stat = os.stat(path)
+            _module_mtimes[name] = (path, (stat.st_mtime_ns, stat.st_size))
+        except OSError:
+            pass
+
+
+def _drop_stale_module(bind_path):
+    """bind_path对应的模块在daemon启动后被修改过时，从sys.modules与注册表中移除，
+    之后的bind重新导入。只在子进程中调用，不影响daemon本身。返回是否移除。
+    """
+    module_name = os.path.basename(re.sub("/+$", "", bind_path))
+    module_name = re.sub(r"\.py$", "", module_name)
+    names = [
+        name
+        for name in _module_mtimes
+        if name == module_name or name.startswith(f"{module_name}.")
+    ]
+    stale = False
+    for name in names:
+        path, version = _module_mtimes[name]
+        try:
+            stat = os.stat(path)
+            stale = stale or (stat.st_mtime_ns, stat.st_size) != version
+        except OSError:
+            stale = True
+    if not stale:
+        return False
+    for name in names:
+        sys.modules.pop(name, None)
+    Factory().unregister_modules(names)
+    importlib.invalidate_caches()
+    return True
+
+
+def get_socket_path(args):
+    socket_path = getattr(args, "socket", None)
+    if socket_path is None:
+        socket_path = os.path.join(get_cache_dir(), "serve.sock")
+    return os.path.abspath(socket_path)
+
+
+def check_daemon_support():
+    if not hasattr(socket, "AF_UNIX") or not hasattr(os, "fork"):
+        raise RuntimeError("fdl serve requires unix socket and fork support.")
+
+
+def _remove_stale_socket(socket_path):
+    if not os.path.exists(socket_path):
+        return
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(socket_path)
+    except OSError:
+        # 没有进程在监听，是上次异常退出遗留的文件
+        os.remove(socket_path)
+    else:
+        raise RuntimeError(f"another fdl daemon is listening on {socket_path}")
+    finally:
+        probe.close()
+
+
+def _run_request(conn, serve_binds: list):
+    """在fork出的子进程中执行一次fdl run，返回退出码"""
+    # pylint:disable=C0415
+    from fdl._core.command_run import run
+
+    signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.default_int_handler)
+    try:
+        request = json.loads(conn.makefile("rb").readline())
+        os.dup2(conn.fileno(), sys.stdout.fileno())
+        os.dup2(conn.fileno(), sys.stderr.fileno())
+        sys.stdout.reconfigure(line_buffering=True)
+        os.chdir(request["cwd"])
+        # fdl serve -b的模块被修改后也需要重新导入
+        for bind_path in serve_binds:
+            if _drop_stale_module(bind_path):
+                bind(bind_path)
+        for bind_path in request.get("bind") or list():
+            if bind_path not in serve_binds:
+                _drop_stale_module(bind_path)
+                bind(bind_path)
+        profiler = Profiler()
+        profiler.clear()
+        profiler.enabled = bool(request["args"].get("profile", False))
+        run(argparse.Namespace(**request["args"]))
+        code = 0
+    except SystemExit as error:
+        code = error.code if isinstance(error.code, int) else 1
+    except BaseException:  # pylint:disable=W0703
+        traceback.print_exc()
+        code = 1
+    try:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os.write(sys.stdout.fileno(), EXIT_MARKER + f"{code}\n".encode("utf-8"))
+    except OSError:
+        # 客户端已断开
+        pass
+    return code
+
+
+def serve(args):
+    check_daemon_support()
+    # pylint:disable=C0415
+    from fdl.modules import load_all
+
+    load_all()
+    serve_binds = [os.path.abspath(path) for path in getattr(args, "bind", None) or ()]
+    _snapshot_modules()
+    socket_path = get_socket_path(args)
+    os.makedirs(os.path.dirname(socket_path), exist_ok=True)
+    _remove_stale_socket(socket_path)
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(socket_path)
+    server.listen()
+    # 子进程退出后由系统自动回收
+    signal.signal(signal.SIGCHLD, signal.SIG_IGN)
+    # kill与Ctrl+C一样正常退出，清理socket文件
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    print(f"fdl daemon listening on {socket_path}, press Ctrl+C to stop.")
+    sys.stdout.flush()
+    try:
+        while True:
+            conn, _ = server.accept()
+            if os.fork() == 0:
+                # 子进程无论如何都不能回到监听循环
+                code = 1
+                try:
+                    server.close()
+                    code = _run_request(conn, serve_binds)
+                finally:
+                    os._exit(code)  # pylint:disable=W0212
+            conn.close()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+        os.remove(socket_path)
+
+
+def submit_run(args):
+    """fdl run --daemon：把任务提交给fdl serve，并把输出原样写到当前终端"""
+    check_daemon_support()
+    socket_path = get_socket_path(args)
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        client.connect(socket_path)
+    except OSError as error:
+        raise RuntimeError(
+            f"connect fdl daemon failed. no daemon is listening on {socket_path},"
+            " start one with 'fdl serve'."
+        ) from error
+    run_args = {
+        key: value
+        for key, value in vars(args).items()
+        if key not in ("bind", "daemon", "socket") and is_json_serializable(value)
+    }
+    run_args["run_json_path"] = os.path.abspath(args.run_json_path)
+    bind_paths = getattr(args, "bind", None)
+    request = {
+        "cwd": os.getcwd(),
+        "bind": None if bind_paths is None else list(map(os.path.abspath, bind_paths)),
+        "args": run_args,
+    }
+    client.sendall(json.dumps(request).encode("utf-8") + b"\n")
+    output = sys.stdout.buffer
+    # 结尾的退出码可能被拆到两次recv中，始终保留末尾的一段数据
+    keep = len(EXIT_MARKER) + 16
+    tail = b""
+    with client:
+        while True:
+            chunk = client.recv(65536)
+            if not chunk:
+                break
+            data = tail + chunk
+            output.write(data[:-keep])
+            output.flush()
+            tail = data[-keep:]
+    idx = tail.rfind(EXIT_MARKER)
+    if idx < 0:
+        output.write(tail)
+        output.flush()
+        raise RuntimeError("fdl daemon closed the connection without exit code.")
+    output.write(tail[:idx])
+    output.flush()
+    code = int(tail[idx + len(EXIT_MARKER) :].strip())
+    if code != 0:
+        sys.exit(code)
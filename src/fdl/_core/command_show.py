@@ -1,13 +1,16 @@
-import inspect
 import json
 
-from fdl._factory import Factory
+from fdl._manifest import IndexedClazz
 from fdl._utils import gen_clazz_example_obj
 
 
 def print_module_v(clazz, clazz_name):
-    example_json = gen_clazz_example_obj(clazz, clazz_name)
-    doc = clazz.__doc__
+    if isinstance(clazz, IndexedClazz):
+        example_json = clazz.gen_example_obj(clazz_name)
+        doc = clazz.doc
+    else:
+        example_json = gen_clazz_example_obj(clazz, clazz_name)
+        doc = clazz.__doc__
     example_json = json.dumps(example_json, indent=2)
     print("below is a example config of this clazz.")
     print("=" * 20)
@@ -26,9 +29,11 @@ def parse_args(args):
 
 
 def show(args):
+    # fdl.modules默认按需导入，尽量从索引回答，不导入模块
+    from fdl.modules import get_all_clazzs
+
     input_clazz, verbose = parse_args(args)
-    factory = Factory()
-    name2clazz = [(name, clazz) for name, clazz in factory.get_name2clazz().items()]
+    name2clazz = [(name, clazz) for name, clazz in get_all_clazzs().items()]
     name2clazz = sorted(name2clazz)
     if not verbose:
         print("=============name:clazz=============")
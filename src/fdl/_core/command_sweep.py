@@ -0,0 +1,217 @@
+"""
+fdl sweep：在内存中把基础配置与覆盖项展开为多个变体，不写临时文件，
+在预先fork的进程池中逐个执行变体的Factory.create与method调用。
+工作进程从已经导入模块的主进程fork而来，没有解释器启动与导入的开销；
+每个进程只执行一个变体，变体之间互不影响。
+"""
+import argparse
+import itertools
+import json
+import multiprocessing
+import os
+import time
+import traceback
+from copy import deepcopy
+
+from fdl._check import check_objects_config
+from fdl._common import Config, Logger, Profiler
+from fdl._core.command_run import (
+    create_objects,
+    is_concurrent_methods,
+    run_core_objs,
+)
+from fdl._utils import bind, check_config, check_config_file, create_workfolder
+
+DEFAULT_SAVED_PATH = "./sweep"
+
+
+def expand_grid(grid):
+    """覆盖项 -> 变体列表，每个变体是{路径: 值}
+
+    - dict: {路径: [候选值]}，按键的顺序做笛卡尔积，
+    - list: [{路径: 值}]，每个元素就是一个变体。
+    """
+    if isinstance(grid, list):
+        for overrides in grid:
+            if not isinstance(overrides, dict):
+                raise TypeError(
+                    f"variant in grid list expected to be dict, got {type(overrides)}"
+                )
+        return grid
+    if not isinstance(grid, dict):
+        raise TypeError(f"grid expected to be dict or list, got {type(grid)}")
+    for path, values in grid.items():
+        if not isinstance(values, list):
+            raise TypeError(
+                f"candidate values of '{path}' in grid expected to be list, got"
+                f" {type(values)}"
+            )
+    return [
+        dict(zip(grid.keys(), values)) for values in itertools.product(*grid.values())
+    ]
+
+
+def _get_child(container, key, path):
+    if isinstance(container, dict):
+        if key not in container:
+            raise KeyError(f"override path '{path}' failed, '{key}' not found.")
+        return container[key]
+    if isinstance(container, list):
+        if key.lstrip("-").isdigit():
+            return container[int(key)]
+        # list中的元素也可以用它的name定位
+        for item in container:
+            if isinstance(item, dict) and item.get("name", None) == key:
+                return item
+        raise KeyError(f"override path '{path}' failed, no element named '{key}'.")
+    raise TypeError(
+        f"override path '{path}' failed, '{key}' is under {type(container)}."
+    )
+
+
+def apply_override(data: dict, path: str, value):
+    """按a.b.0.c形式的路径修改data。
+
+    list中的一段可以是下标，也可以是元素的name；路径的第一段不是data的键时，
+    视为objects中顶层对象的name，例如model.args.lr等价于objects.model.args.lr。
+    """
+    keys = path.split(".")
+    if keys[0] not in data:
+        keys = ["objects"] + keys
+    container = data
+    for key in keys[:-1]:
+        container = _get_child(container, key, path)
+    key = keys[-1]
+    if isinstance(container, dict):
+        container[key] = value
+    elif isinstance(container, list) and key.lstrip("-").isdigit():
+        container[int(key)] = value
+    else:
+        raise TypeError(
+            f"override path '{path}' failed, can't set '{key}' of {type(container)}."
+        )
+
+
+def gen_variants(base, grid):
+    """返回[(覆盖项, 变体配置)]，变体配置与base互不共享"""
+    if isinstance(base, list):
+        base = {"objects": base}
+    variants = list()
+    for overrides in expand_grid(grid):
+        data = deepcopy(base)
+        for path, value in overrides.items():
+            apply_override(data, path, value)
+        variants.append((overrides, data))
+    return variants
+
+
+def _variant_workfolder(args, data, idx):
+    """saved_path/name/variant_idx/time/，saved_path优先取命令行--output"""
+    task = data.get("task", None)
+    if not isinstance(task, dict):
+        task = dict()
+    saved_path = args.output or task.get("saved_path", None) or DEFAULT_SAVED_PATH
+    task_name = task.get("name", "") or os.path.splitext(
+        os.path.basename(args.run_json_path)
+    )[0]
+    return create_workfolder(saved_path, os.path.join(task_name, f"variant_{idx}"))
+
+
+def _run_variant(task):
+    """在工作进程中执行一个变体，异常不向外抛出，记录在结果中"""
+    args, idx, overrides, data = task
+    start = time.perf_counter()
+    rst = {"variant": idx, "overrides": overrides, "work_dir": None, "error": None}
+    try:
+        work_dir = _variant_workfolder(args, data, idx)
+        rst["work_dir"] = work_dir
+        Logger().set_log_path(work_dir)
+        variant_path = os.path.join(work_dir, "variant.json")
+        with open(variant_path, "w", encoding="utf-8") as file:
+            json.dump({"overrides": overrides, "config": data}, file, indent=4)
+        project_config = Config().load(data)
+        del data
+        # --workers是进程数，变体内的构造选项只来自task
+        run_args = argparse.Namespace(lazy=getattr(args, "lazy", False))
+        factory = create_objects(run_args, project_config, Profiler())
+        concurrent = is_concurrent_methods(run_args, project_config)
+        del project_config
+        run_core_objs(factory, Profiler(), concurrent)
+    except Exception:  # pylint:disable=W0703
+        rst["error"] = traceback.format_exc()
+    rst["wall"] = time.perf_counter() - start
+    return rst
+
+
+def _init_worker(bind_paths):
+    # 非fork启动的进程没有继承主进程导入的模块
+    # pylint:disable=C0415,W0611
+    for bind_path in bind_paths or list():
+        bind(bind_path)
+    import fdl.modules
+
+
+def sweep(args):
+    base = check_config_file(args.run_json_path)
+    with open(args.grid, "r", encoding="utf-8") as file:
+        grid = json.load(file)
+    variants = gen_variants(base, grid)
+    # 先校验全部变体，避免跑到一半才发现覆盖项写错
+    for idx, (_, data) in enumerate(variants):
+        variant_path = f"{args.run_json_path}[variant {idx}]"
+        check_config(data, variant_path)
+        check_objects_config(Config().load(deepcopy(data)), variant_path)
+    workers = args.workers or os.cpu_count() or 1
+    workers = max(1, min(workers, len(variants)))
+    print(
+        f"sweep {len(variants)} variants of {args.run_json_path} with {workers}"
+        " workers."
+    )
+
+    if "fork" in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context("fork")
+        initializer, initargs = None, ()
+    else:
+        context = multiprocessing.get_context()
+        initializer, initargs = _init_worker, (getattr(args, "bind", None),)
+    worker_args = argparse.Namespace(
+        run_json_path=args.run_json_path,
+        output=getattr(args, "output", None),
+        lazy=getattr(args, "lazy", False),
+    )
+    tasks = [
+        (worker_args, idx, overrides, data)
+        for idx, (overrides, data) in enumerate(variants)
+    ]
+    del variants
+    results = list()
+    # 每个进程只执行一个变体，结束后由从主进程重新fork的进程替换
+    with context.Pool(
+        workers, initializer=initializer, initargs=initargs, maxtasksperchild=1
+    ) as pool:
+        for rst in pool.imap_unordered(_run_variant, tasks):
+            status = "failed" if rst["error"] else "done"
+            print(
+                f"[{len(results) + 1}/{len(tasks)}] variant {rst['variant']} {status}"
+                f" in {rst['wall']:.2f}s {rst['overrides']}"
+            )
+            results.append(rst)
+    print_sweep_summary(sorted(results, key=lambda rst: rst["variant"]))
+    failed = [rst["variant"] for rst in results if rst["error"]]
+    if failed:
+        raise RuntimeError(f"{len(failed)} variants failed: {sorted(failed)}")
+
+
+def print_sweep_summary(results):
+    print("=============sweep summary=============")
+    print(f"{'variant':>8}{'status':>8}{'wall(s)':>10}  work_dir")
+    for rst in results:
+        status = "failed" if rst["error"] else "done"
+        print(
+            f"{rst['variant']:>8}{status:>8}{rst['wall']:>10.2f}  {rst['work_dir']}"
+        )
+    for rst in results:
+        if rst["error"]:
+            title = f"variant {rst['variant']} {rst['overrides']}"
+            print(f"============={title}=============")
+            print(rst["error"])
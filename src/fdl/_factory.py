@@ -10,66 +10,538 @@ Register && register function(register, register_as, register_module_)
 import inspect
 import re
 import sys
+import threading
 import traceback
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+from fdl._cache import ObjectCache, object_key
+from fdl._common import Logger
+from fdl._graph import DependencyGraph, find_refs
+from fdl._utils import config_hash, config_sizeof, is_mapped_arg, load_mapped_arg
 
 __all__ = ["register", "register_as", "register_clazz_as_name"]
 
+REF_PATTERN = re.compile(r"\${(.+?)}")
+PLACE_HOLDER_PATTERN = re.compile(r"\${(.*?)}")
+COMMAND_PATTERN = re.compile("@@(.*?)@@")
+# 构造出的对象如何持有自己的初始化配置_init_config
+INIT_CONFIG_POLICIES = ("full", "top-level-only", "weakref", "none")
+# 以pure:开头的命令没有副作用，同一个factory中只执行一次，之后复用其ret
+PURE_MARKER = "pure:"
+# 命令解析与编译结果的缓存上限，常驻进程(serve、--watch)中不会无限增长
+COMMAND_CACHE_SIZE = 1024
+
+
+@lru_cache(maxsize=COMMAND_CACHE_SIZE)
+def parse_command(command_str):
+    """解析@@...@@参数，返回(可执行的命令, 引用的对象名, 是否pure)
+
+    ${obj}被替换为对从对象池的查询，结果按原始字符串缓存。
+    """
+    ref_names = tuple(PLACE_HOLDER_PATTERN.findall(command_str))
+    command_str = PLACE_HOLDER_PATTERN.sub(
+        lambda match: f"_name2obj.get('{match.group(1)}')", command_str
+    )
+    sub_commands = COMMAND_PATTERN.findall(command_str)
+    if len(sub_commands) > 1:
+        raise RuntimeError(
+            f"Only allowed one exec(...) in args value, got {command_str}"
+        )
+    sub = sub_commands[0]
+    pure = sub.lstrip().startswith(PURE_MARKER)
+    if pure:
+        sub = sub.lstrip()[len(PURE_MARKER) :].lstrip()
+    return sub, ref_names, pure
+
+
+@lru_cache(maxsize=COMMAND_CACHE_SIZE)
+def compile_command(sub):
+    return compile(sub, "<fdl command>", "exec")
+
+
+# fdl compile预先解析出的参数操作：(键, 操作, 数据)
+OP_REF = 0  # ${name}引用，数据为对象名
+OP_COMMAND = 1  # @@...@@命令，数据为parse_command的结果
+OP_OBJ = 2  # 子对象，数据为(clazz注册名, 子对象参数的操作)
+OP_MAPPED = 3  # $mmap/$buffer参数
+OP_NESTED = 4  # 含有上述参数的容器，数据为容器内的操作
+
+
+def compile_args(args):
+    """与Factory._preprocess_args对args的处理一一对应，返回需要处理的元素的操作。
+
+    不需要处理的元素(普通数字、字符串等)不产生操作，构造时原样传入。
+    """
+    if isinstance(args, list):
+        args_iter = enumerate(args)
+    elif isinstance(args, dict):
+        args_iter = args.items()
+    else:
+        raise TypeError(
+            f"unexpected args type, expected list or dict, got {type(args)}"
+        )
+    ops = list()
+    for arg_key, arg_value in args_iter:
+        if isinstance(arg_value, dict):
+            if "clazz" in arg_value.keys():
+                sub_ops = compile_args(arg_value.get("args", list()))
+                ops.append((arg_key, OP_OBJ, (arg_value["clazz"], sub_ops)))
+            elif is_mapped_arg(arg_value):
+                ops.append((arg_key, OP_MAPPED, None))
+            else:
+                sub_ops = compile_args(arg_value)
+                if sub_ops:
+                    ops.append((arg_key, OP_NESTED, sub_ops))
+        elif isinstance(arg_value, list):
+            sub_ops = compile_args(arg_value)
+            if sub_ops:
+                ops.append((arg_key, OP_NESTED, sub_ops))
+        elif isinstance(arg_value, str):
+            if arg_value.count("@@") >= 2:
+                ops.append((arg_key, OP_COMMAND, parse_command(arg_value)))
+            elif "${" in arg_value:
+                match = REF_PATTERN.search(arg_value)
+                if match:
+                    ops.append((arg_key, OP_REF, match.group(1)))
+    return tuple(ops)
+
+
+def copy_container(args):
+    """args的浅拷贝，dict保持原本的类型(如Config)"""
+    return list(args) if isinstance(args, list) else type(args)(args)
+
+
+def find_clazz_names(config):
+    """config及其中子对象用到的clazz注册名"""
+    names = set()
+    stack = [config]
+    while stack:
+        item = stack.pop()
+        if isinstance(item, dict):
+            if isinstance(item.get("clazz", None), str):
+                names.add(item["clazz"])
+            stack.extend(item.values())
+        elif isinstance(item, list):
+            stack.extend(item)
+    return names
+
+
+def has_impure_command(config):
+    """config中是否有非pure的@@...@@命令，这样的配置每次构造的结果可能不同"""
+    stack = [config]
+    while stack:
+        item = stack.pop()
+        if isinstance(item, dict):
+            stack.extend(item.values())
+        elif isinstance(item, list):
+            stack.extend(item)
+        elif isinstance(item, str) and item.count("@@") >= 2:
+            for sub in COMMAND_PATTERN.findall(item):
+                if not sub.lstrip().startswith(PURE_MARKER):
+                    return True
+    return False
+
 
 class Factory:
+    """Factory()返回进程内默认的factory。
+
+    注册表(clazz与注册名)在所有factory间共享，对象池则属于各个factory：
+    Factory.scoped()创建拥有独立对象池的factory，reset()清空对象池，
+    以便在同一个进程中多次、或在多个线程中同时构造配置。
+
+    线程安全：注册、添加loader与对象池的写入都在锁内完成，可以在后台线程中导入
+    插件，同时在多个线程中调用同一个factory的create；重名的注册与对象名只有一个
+    成功，其余抛出RuntimeError。占位符只会被构造一次。每个@@...@@命令使用独立的
+    globals，命令自身的副作用不受保护。
+    """
+
     instance = None
     init = False
+    _instance_lock = threading.Lock()
+    # 所有factory共享的注册表
+    _name2clazz = dict()
+    _clazz2name = dict()
+    _clazz_loaders = list()
+    _registry_lock = threading.RLock()
 
     def __new__(cls):
         if Factory.instance is None:
-            Factory.instance = super().__new__(cls)
+            with Factory._instance_lock:
+                if Factory.instance is None:
+                    Factory.instance = super().__new__(cls)
         return Factory.instance
 
     def __init__(self) -> None:
         if Factory.init:
             return
-        self._name2clazz = dict()
-        self._clazz2name = dict()
+        with Factory._instance_lock:
+            if Factory.init:
+                return
+            self._init_pool()
+            Factory.init = True
+
+    @classmethod
+    def scoped(cls):
+        """创建与默认factory共享注册表、拥有独立对象池的factory"""
+        factory = object.__new__(cls)
+        factory._init_pool()
+        return factory
+
+    def _init_pool(self):
+        self._pool_lock = threading.RLock()
         self._name2obj = dict()
         # self._obj2name = dict()
         self._core_objs = list()
-        Factory.init = True
+        self._core_configs = list()
+        self._init_config_policy = "full"
+        self._init_config_sizes = None
+        self._profiler = None
+        # 配置相同的子对象只构造一次：规范化哈希 -> 对象
+        self._share_objects = False
+        self._shared_objs = dict()
+        self._share_locks = dict()
+        # 设置了cache的顶层对象的本地缓存，第一次用到时才创建默认缓存
+        self._object_cache = None
+        # fdl compile编译的配置中预先导入的clazz与预先编译的命令
+        self._plan_clazzs = dict()
+        self._plan_codes = dict()
+        # pure命令的结果缓存
+        self._pure_rsts = dict()
 
-    def create(self, config: dict):
+    def reset(self):
+        """清空对象池与core对象，保留注册表与设置"""
+        with self._pool_lock:
+            self._name2obj.clear()
+            self._core_objs.clear()
+            self._core_configs.clear()
+            self._pure_rsts.clear()
+            self._shared_objs.clear()
+            self._share_locks.clear()
+            self._plan_clazzs.clear()
+            self._plan_codes.clear()
+
+    def create(self, config: dict, workers: int = None, lazy: bool = False):
         assert "objects" in config.keys()
         obj_configs = config["objects"]
         assert isinstance(obj_configs, list)
-        # 反序构建
-        for idx, obj_config in enumerate(obj_configs[::-1]):
+        for obj_config in obj_configs:
             assert isinstance(obj_config, dict)
-            # get suggest anme
-            suggest_name = f"objects_{idx}"
-            obj_name = obj_config.get("name", suggest_name)
-            new_obj = self.create_single_obj(obj_config)
-            # 保存顶层对象
-            self._save_obj(obj_name, new_obj)
-            # 顶层object 可能拥有字段method
-            if "method" in obj_config.keys() and isinstance(obj_config["method"], str):
-                self._core_objs.append(new_obj)
-        # 反转core对象
-        self._core_objs.reverse()
-
-    def create_single_obj(self, obj_config: dict):
-        obj_clazz = self._get_obj_clazz(obj_config)
-        obj_args = self._get_obj_args(obj_config)
+        # 先扫描引用建立依赖图，再按拓扑序构建，声明顺序不再影响构造
+        graph = DependencyGraph(obj_configs)
+        self._create(obj_configs, graph, [None] * graph.size, workers, lazy)
+
+    def create_compiled(self, plan, workers: int = None, lazy: bool = False):
+        """构造fdl compile编译出的配置(_compile.CompiledPlan)。
+
+        依赖图、clazz与命令都已预先解析，构造时不再扫描参数中的引用与命令。
+        """
+        with self._pool_lock:
+            self._plan_clazzs.update(plan.clazzs)
+            self._plan_codes.update(plan.codes)
+        self._create(plan.config["objects"], plan.graph, plan.nodes, workers, lazy)
+
+    def recreate(
+        self, config: dict, keep: set, workers: int = None, lazy: bool = False
+    ):
+        """用新配置重建对象池：名字在keep中的顶层对象沿用当前实例，其余重新构造。
+
+        keep中的对象不能引用需要重新构造的对象，由调用者保证(DependencyGraph.dependents)。
+        """
+        obj_configs = config["objects"]
+        graph = DependencyGraph(obj_configs)
+        with self._pool_lock:
+            old_objs = dict(self._name2obj)
+        self.reset()
+        kept = set()
+        for idx, name in enumerate(graph.names):
+            if name in keep and name in old_objs:
+                self._save_obj(name, old_objs[name])
+                kept.add(idx)
+        self._create(obj_configs, graph, [None] * graph.size, workers, lazy, kept)
+
+    def _create(
+        self,
+        obj_configs: list,
+        graph: DependencyGraph,
+        nodes: list,
+        workers: int,
+        lazy: bool,
+        kept: set = frozenset(),
+    ):
+        """nodes[idx]为顶层对象预先编译的(clazz注册名, 参数操作)，未编译时为None。
+
+        kept中的对象已经在对象池中，不再构造。
+        """
+        core_idxs = [
+            idx
+            for idx, obj_config in enumerate(obj_configs)
+            if "method" in obj_config.keys() and isinstance(obj_config["method"], str)
+        ]
+        cache_keys = self._get_cache_keys(obj_configs, graph)
+        targets = set(range(graph.size)) - kept
+        if lazy:
+            # 只构建method对象能通过引用到达的对象，其余对象保存为占位符
+            targets = graph.reachable(core_idxs) - kept
+            for idx in range(graph.size):
+                if idx not in targets and idx not in kept:
+                    lazy_obj = LazyObject(
+                        self, graph.names[idx], obj_configs[idx], nodes[idx]
+                    )
+                    self._save_obj(graph.names[idx], lazy_obj)
+        if workers is not None and workers > 1:
+            self._create_parallel(
+                obj_configs, graph, nodes, workers, targets, cache_keys
+            )
+        else:
+            for idx in graph.order():
+                if idx not in targets:
+                    continue
+                new_obj = self._create_top_obj(
+                    obj_configs[idx], cache_keys.get(idx), nodes[idx]
+                )
+                # 保存顶层对象
+                self._save_obj(graph.names[idx], new_obj)
+        # 顶层object 可能拥有字段method，按声明顺序记录
+        with self._pool_lock:
+            for idx in core_idxs:
+                self._core_objs.append(self._name2obj[graph.names[idx]])
+                self._core_configs.append(obj_configs[idx])
+
+    def create_stream(self, obj_configs):
+        """边解析边构造。obj_configs逐个产生顶层配置：
+
+        依赖都已在对象池中的对象立即构造，其余对象等到依赖被构造后再构造。
+        配置耗尽后仍在等待的对象按create的方式构造，报告循环引用或不存在的引用。
+        流式构造不支持cache，未命名对象在配置耗尽、总数确定后才存入对象池。
+        """
+        # 等待中的对象：下标 -> [配置, 未满足的依赖名]，以及依赖名 -> 等待它的下标
+        pending = dict()
+        waiters = dict()
+        unnamed = list()
+        core_configs = list()
+        size = 0
+        for idx, obj_config in enumerate(obj_configs):
+            size += 1
+            if isinstance(obj_config.get("method", None), str):
+                core_configs.append((idx, obj_config))
+            if obj_config.get("cache", False):
+                Logger().warning(
+                    f"object {obj_config.get('name')} is not cached, cache is not"
+                    " supported when constructing from a stream."
+                )
+            refs = find_refs(obj_config.get("args", list()))
+            missing = {name for name in refs if name not in self._name2obj}
+            if missing:
+                pending[idx] = [obj_config, missing]
+                for name in missing:
+                    waiters.setdefault(name, list()).append(idx)
+                continue
+            ready = [(idx, obj_config)]
+            while ready:
+                ready_idx, ready_config = ready.pop()
+                new_obj = self.create_single_obj(ready_config, top_level=True)
+                if "name" not in ready_config:
+                    unnamed.append((ready_idx, new_obj))
+                    continue
+                name = ready_config["name"]
+                self._save_obj(name, new_obj)
+                for waiter in waiters.pop(name, list()):
+                    pending[waiter][1].discard(name)
+                    if not pending[waiter][1]:
+                        ready.append((waiter, pending.pop(waiter)[0]))
+        # 未命名对象沿用create中的命名方式
+        for idx, new_obj in unnamed:
+            self._save_obj(f"objects_{size - 1 - idx}", new_obj)
+        if pending:
+            idxs = sorted(pending)
+            left_configs = [pending[idx][0] for idx in idxs]
+            graph = DependencyGraph(left_configs)
+            for order_idx in graph.order():
+                obj_config = left_configs[order_idx]
+                name = obj_config.get("name", f"objects_{size - 1 - idxs[order_idx]}")
+                self._save_obj(name, self.create_single_obj(obj_config, True))
+        with self._pool_lock:
+            for idx, obj_config in core_configs:
+                name = obj_config.get("name", f"objects_{size - 1 - idx}")
+                self._core_objs.append(self._name2obj[name])
+                self._core_configs.append(obj_config)
+
+    def _create_parallel(
+        self,
+        obj_configs: list,
+        graph: DependencyGraph,
+        nodes: list,
+        workers: int,
+        targets: set,
+        cache_keys: dict,
+    ):
+        # 同一依赖层级的对象互不引用，在线程池中同时构造；层与层之间串行
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for level in graph.levels():
+                level = [idx for idx in level if idx in targets]
+                futures = [
+                    executor.submit(
+                        self._create_top_obj,
+                        obj_configs[idx],
+                        cache_keys.get(idx),
+                        nodes[idx],
+                    )
+                    for idx in level
+                ]
+                # result()会原样抛出_construct_obj包装过的异常
+                for idx, future in zip(level, futures):
+                    self._save_obj(graph.names[idx], future.result())
+
+    def _create_top_obj(self, obj_config: dict, cache_key: str = None, node=None):
+        if cache_key is None:
+            return self.create_single_obj(obj_config, True, node)
+        hit, obj = self._object_cache.load(cache_key)
+        if hit:
+            self._attach_init_config(obj, obj_config, True)
+            return obj
+        obj = self.create_single_obj(obj_config, True, node)
+        if not self._object_cache.save(cache_key, obj, obj_config):
+            Logger().warning(
+                f"cache object {obj_config.get('name')} failed, it can't be pickled."
+            )
+        return obj
+
+    def _get_cache_keys(self, obj_configs: list, graph: DependencyGraph):
+        """设置了cache的顶层对象 -> 缓存键。
+
+        键由配置、用到的clazz源码，以及依赖对象的键决定。自身或依赖中含有非pure命令
+        的对象每次构造的结果可能不同，不缓存。
+        """
+        if not any(obj_config.get("cache", False) for obj_config in obj_configs):
+            return dict()
+        if self._object_cache is None:
+            self._object_cache = ObjectCache()
+        keys = dict()
+        for idx in graph.order():
+            obj_config = obj_configs[idx]
+            deps = sorted(graph.deps[idx], key=lambda dep: graph.names[dep])
+            dep_keys = [keys[dep] for dep in deps]
+            if None in dep_keys or has_impure_command(obj_config):
+                keys[idx] = None
+                continue
+            clazzs = [
+                self._get_obj_clazz({"clazz": name})
+                for name in find_clazz_names(obj_config)
+            ]
+            try:
+                keys[idx] = object_key(obj_config, clazzs, dep_keys)
+            except TypeError:
+                keys[idx] = None
+        cache_keys = dict()
+        for idx, obj_config in enumerate(obj_configs):
+            if not obj_config.get("cache", False):
+                continue
+            if keys[idx] is None:
+                Logger().warning(
+                    f"object {graph.names[idx]} is not cached, it or its references"
+                    " contain commands that are not pure."
+                )
+            else:
+                cache_keys[idx] = keys[idx]
+        return cache_keys
+
+    def create_single_obj(self, obj_config: dict, top_level: bool = False, node=None):
+        if self._profiler is None:
+            return self._create_single_obj(obj_config, top_level, node)
+        with self._profiler.profile_obj(obj_config):
+            return self._create_single_obj(obj_config, top_level, node)
+
+    def _create_single_obj(self, obj_config: dict, top_level: bool, node):
+        if node is None:
+            obj_clazz = self._get_obj_clazz(obj_config)
+            obj_args = self._get_obj_args(obj_config)
+        else:
+            clazz_name, ops = node
+            obj_clazz = self._plan_clazzs[clazz_name]
+            obj_args = self._apply_arg_ops(obj_config.get("args", list()), ops)
         new_obj = self._construct_obj(obj_clazz, obj_args)
+        self._attach_init_config(new_obj, obj_config, top_level)
+        return new_obj
+
+    def _attach_init_config(self, obj, obj_config: dict, top_level: bool):
+        if self._init_config_sizes is not None:
+            key = "top-level" if top_level else "nested"
+            self._init_config_sizes[key] += config_sizeof(
+                obj_config, self._init_config_sizes["seen"]
+            )
+        policy = self._init_config_policy
+        if policy == "none" or (policy == "top-level-only" and not top_level):
+            return
         # 尝试保存对象的初始化配置。
         # 当对象重写了__setattr__方法时，不一定能成功，不成功就放过。(例如NoneType)
+        # 普通dict不支持弱引用，weakref策略下同样放过。
         try:
-            setattr(new_obj, "_init_config", obj_config)
+            if policy == "weakref":
+                obj_config = weakref.ref(obj_config)
+            setattr(obj, "_init_config", obj_config)
         except:
             pass
-        return new_obj
+
+    def set_profiler(self, profiler):
+        """profiler.profile_obj(obj_config)将记录此后每个对象的构造，None则关闭"""
+        self._profiler = profiler
+
+    def set_init_config_policy(self, policy: str):
+        """设置构造出的对象如何持有_init_config：
+
+        - full: 所有对象(含子对象)都持有完整配置，默认值。
+        - top-level-only: 只有顶层对象持有。
+        - weakref: 持有配置的弱引用，调用obj._init_config()获取，配置不会被对象保活。
+        - none: 不持有。
+        """
+        if policy not in INIT_CONFIG_POLICIES:
+            raise ValueError(
+                f"init_config policy expected one of {INIT_CONFIG_POLICIES}, got"
+                f" '{policy}'"
+            )
+        self._init_config_policy = policy
+
+    def set_object_cache(self, object_cache: ObjectCache):
+        """设置了cache的顶层对象使用的缓存，默认为$FDL_CACHE_DIR/objects"""
+        self._object_cache = object_cache
+
+    def set_share_objects(self, share: bool):
+        """为True时，没有设置share的子对象也按配置去重，含非pure命令的子对象除外"""
+        self._share_objects = bool(share)
+
+    def enable_init_config_report(self):
+        """统计此后构造的对象持有的_init_config大小，用于init_config_report"""
+        self._init_config_sizes = {"top-level": 0, "nested": 0, "seen": set()}
+
+    def init_config_report(self):
+        """各策略下，被对象持有的_init_config占用的字节数，以及相对full节省的字节数"""
+        assert (
+            self._init_config_sizes is not None
+        ), "call enable_init_config_report before create."
+        top_level = self._init_config_sizes["top-level"]
+        nested = self._init_config_sizes["nested"]
+        retained = {
+            "full": top_level + nested,
+            "top-level-only": top_level,
+            "weakref": 0,
+            "none": 0,
+        }
+        return {
+            policy: (size, retained["full"] - size) for policy, size in retained.items()
+        }
 
     def _get_obj_clazz(self, obj_config: dict):
         assert (
             "clazz" in obj_config.keys()
         ), f"no clazz in {obj_config} construct obj failed."
         clazz_name = obj_config["clazz"]
+        if clazz_name not in self._name2clazz:
+            # 尝试按需导入注册了该名字的模块，导入期间不持有注册表的锁
+            for loader in tuple(self._clazz_loaders):
+                if loader(clazz_name) and clazz_name in self._name2clazz:
+                    break
         if clazz_name in self._name2clazz:
             clazz = self._name2clazz[clazz_name]
         else:
@@ -84,6 +556,7 @@ class Factory:
 
     def _preprocess_args(self, args):
         # 参数args是一个list或dict容器，正则化容器元素
+        # 有元素需要替换时才复制容器，配置本身不被修改，可以在多个factory中构造
         if isinstance(args, list):
             args_iter = enumerate(args)
         elif isinstance(args, dict):
@@ -92,67 +565,112 @@ class Factory:
             raise TypeError(
                 f"unexpected args type, expected list or dict, got {type(args)}"
             )
-        for arg_key, arg_value in args_iter:
+        new_args = args
+        for arg_key, raw_value in args_iter:
+            arg_value = raw_value
             if isinstance(arg_value, dict):
                 if "clazz" in arg_value.keys():
                     # 有clazz走子对象构建
-                    arg_value = self.create_single_obj(arg_value)
+                    arg_value = self._create_sub_obj(arg_value)
+                elif is_mapped_arg(arg_value):
+                    # 大数组参数以只读内存映射传入，不经过json解析
+                    arg_value = load_mapped_arg(arg_value)
                 else:
                     # 没有则递归再处理此子元素，递归出口至所有元素都是非容器
                     arg_value = self._preprocess_args(arg_value)
             elif isinstance(arg_value, list):
                 arg_value = self._preprocess_args(arg_value)
             elif isinstance(arg_value, str):
-                match = re.search(r"\${(.+?)}", str(arg_value))
                 if arg_value.count("@@") >= 2:
                     # 解析命令并执行
-                    command_str = self._replace_place_holder_with_dict_get(arg_value)
-                    arg_value = self._exec_command_to_get_obj(command_str)
-                elif match:
-                    # 直接替换
-                    match_str = match.group(1)
-                    if not match_str in self._name2obj:
-                        raise KeyError(
-                            f"find ref object {match_str} failed, this may caused by"
-                            " wrong words in json or wrong objs order. Be careful that"
-                            " father obj should in front."
-                        )
-                    arg_value = self._name2obj[match_str]
-            args[arg_key] = arg_value
+                    arg_value = self._exec_command_to_get_obj(arg_value)
+                elif "${" in arg_value:
+                    match = REF_PATTERN.search(arg_value)
+                    if match:
+                        # 直接替换
+                        arg_value = self._get_arg_ref_obj(match.group(1))
+            if arg_value is not raw_value:
+                if new_args is args:
+                    new_args = copy_container(args)
+                new_args[arg_key] = arg_value
+        return new_args
+
+    def _apply_arg_ops(self, args, ops):
+        """按compile_args得到的操作处理args，效果与_preprocess_args相同"""
+        if not ops:
+            return args
+        args = copy_container(args)
+        for arg_key, op, data in ops:
+            if op == OP_REF:
+                args[arg_key] = self._get_arg_ref_obj(data)
+            elif op == OP_COMMAND:
+                args[arg_key] = self._exec_command(*data)
+            elif op == OP_OBJ:
+                args[arg_key] = self._create_sub_obj(args[arg_key], data)
+            elif op == OP_MAPPED:
+                args[arg_key] = load_mapped_arg(args[arg_key])
+            else:
+                args[arg_key] = self._apply_arg_ops(args[arg_key], data)
         return args
 
-    def _replace_place_holder_with_dict_get(self, command):
-        # Define the regular expression pattern to match "${obj}"
-        pattern = r"\${(.*?)}"
+    def _create_sub_obj(self, obj_config: dict, node=None):
+        key = self._get_share_key(obj_config)
+        if key is None:
+            return self.create_single_obj(obj_config, node=node)
+        # 同一份配置在多个线程中同时出现时也只构造一次
+        with self._pool_lock:
+            lock = self._share_locks.setdefault(key, threading.Lock())
+        with lock:
+            if key not in self._shared_objs:
+                self._shared_objs[key] = self.create_single_obj(obj_config, node=node)
+            return self._shared_objs[key]
+
+    def _get_share_key(self, obj_config: dict):
+        """子对象可以共享时返回其配置的哈希，否则返回None"""
+        share = obj_config.get("share", None)
+        if share is False or (share is None and not self._share_objects):
+            return None
+        sub_config = {key: value for key, value in obj_config.items() if key != "share"}
+        try:
+            key = config_hash(sub_config)
+        except TypeError:
+            # 配置中已经有构造好的对象，无法判断是否相同
+            return None
+        if share is None and has_impure_command(sub_config):
+            return None
+        return key
+
+    def _get_arg_ref_obj(self, obj_name):
+        if not obj_name in self._name2obj:
+            raise KeyError(
+                f"find ref object {obj_name} failed, this may caused by wrong words"
+                " in json. Only top objects with 'name' can be referenced."
+            )
+        return self._get_ref_obj(obj_name)
 
-        # Define the replacement function
-        def replace(match):
-            obj_name = match.group(1)
+    def _check_command_refs(self, ref_names):
+        for obj_name in ref_names:
             if not obj_name in self._name2obj:
                 raise KeyError(
                     f"{obj_name} not found in objs_pool, this may caused by wrong words"
-                    " in json or wrong objs order. Be careful that father obj should"
-                    " in front."
+                    " in json. Only top objects with 'name' can be referenced."
                 )
-            return f"_name2obj.get('{obj_name}')"
-            # return q_dict_name + "[" + obj + "]"
-
-        # Use re.sub() to replace all occurrences of the pattern with the replacement function
-        result = re.sub(pattern, replace, command)
-
-        return result
+            # 占位符在此处被真正构造，保证命令拿到的是真实对象
+            self._get_ref_obj(obj_name)
 
     def _exec_command_to_get_obj(self, command_str):
-        command_pattern = "@@(.*?)@@"
-        sub_commands = re.findall(command_pattern, command_str)
-        if len(sub_commands) > 1:
-            raise RuntimeError(
-                f"Only allowed one exec(...) in args value, got {command_str}"
-            )
-        sub = sub_commands[0]
+        return self._exec_command(*parse_command(command_str))
+
+    def _exec_command(self, sub, ref_names, pure):
+        self._check_command_refs(ref_names)
+        if pure and sub in self._pure_rsts:
+            return self._pure_rsts[sub]
         exec_rst = dict()
         try:
-            exec(sub, {"_name2obj": self._name2obj}, exec_rst)  # pylint:disable=W0122
+            code = self._plan_codes.get(sub, None) or compile_command(sub)
+            # 每个命令使用新的globals，命令中的global赋值不会影响之后的命令
+            exec_globals = {"_name2obj": self._name2obj}
+            exec(code, exec_globals, exec_rst)  # pylint:disable=W0122
         except Exception as error:
             exc_type, exc_value, exc_traceback = sys.exc_info()
             traceback_str = "".join(
@@ -162,6 +680,9 @@ class Factory:
                 f"exec sub command '{sub}' failed. Exception:\n {traceback_str}"
             ) from error
         if "ret" in exec_rst:
+            if pure:
+                # 多个线程同时执行同一个pure命令时，保留最先写入的结果
+                return self._pure_rsts.setdefault(sub, exec_rst["ret"])
             return exec_rst["ret"]
         else:
             raise KeyError(
@@ -200,14 +721,21 @@ class Factory:
             )
         return obj
 
+    def _get_ref_obj(self, obj_name):
+        obj = self._name2obj[obj_name]
+        if isinstance(obj, LazyObject):
+            obj = obj.fdl_resolve()
+        return obj
+
     def _save_obj(self, obj_name, obj):
-        if obj_name not in self._name2obj:
-            self._name2obj[obj_name] = obj
-        else:
-            raise RuntimeError(
-                f"factory save obj failed. obj_name {obj_name} already been used by"
-                f" {self._name2obj[obj_name]}"
-            )
+        with self._pool_lock:
+            if obj_name not in self._name2obj:
+                self._name2obj[obj_name] = obj
+            else:
+                raise RuntimeError(
+                    f"factory save obj failed. obj_name {obj_name} already been used"
+                    f" by {self._name2obj[obj_name]}"
+                )
         # if obj not in self._obj2name:
         #     self._obj2name[obj] = obj_name
         # else:
@@ -219,8 +747,33 @@ class Factory:
     def get_core_objs(self):
         return self._core_objs
 
+    def get_core_configs(self):
+        """与get_core_objs一一对应的顶层配置，不依赖对象上的_init_config"""
+        return self._core_configs
+
+    def get_name2obj(self):
+        """对象池的快照"""
+        with self._pool_lock:
+            return dict(self._name2obj)
+
     def get_name2clazz(self):
-        return self._name2clazz
+        """注册表的快照，遍历时不受其他线程注册的影响"""
+        with self._registry_lock:
+            return dict(self._name2clazz)
+
+    def add_clazz_loader(self, loader):
+        """loader(clazz_name)在clazz未注册时被调用，导入了可能注册该名字的模块时返回True"""
+        with self._registry_lock:
+            self._clazz_loaders.append(loader)
+
+    def unregister_modules(self, module_names):
+        """移除定义在这些模块中的clazz的注册，以便重新导入模块后再次注册"""
+        module_names = set(module_names)
+        with self._registry_lock:
+            for clazz, name in list(self._clazz2name.items()):
+                if getattr(clazz, "__module__", None) in module_names:
+                    del self._clazz2name[clazz]
+                    del self._name2clazz[name]
 
     def register(self, name, clazz):
         if not isinstance(name, str):
@@ -229,19 +782,73 @@ class Factory:
             )
         if not callable(clazz):
             raise AttributeError(f"register clazz expected callable:{clazz}")
-        if name not in self._name2clazz:
+        # 两张表在锁内先检查后写入，失败的注册不会留下一半的记录
+        with self._registry_lock:
+            if name in self._name2clazz:
+                raise RuntimeError(
+                    f"register name '{name}' already been used by class"
+                    f" {self._name2clazz[name]}"
+                )
+            if clazz in self._clazz2name:
+                raise RuntimeError(
+                    f"class '{clazz}' already register with name"
+                    f" {self._clazz2name[clazz]}"
+                )
             self._name2clazz[name] = clazz
-        else:
-            raise RuntimeError(
-                f"register name '{name}' already been used by class"
-                f" {self._name2clazz[name]}"
-            )
-        if clazz not in self._clazz2name:
             self._clazz2name[clazz] = name
-        else:
-            raise RuntimeError(
-                f"class '{clazz}' already register with name {self._clazz2name[clazz]}"
-            )
+
+
+# LazyObject尚未构造的标记，构造结果可以是None
+_UNRESOLVED = object()
+
+
+class LazyObject:
+    """顶层对象的占位符。
+
+    lazy模式下，没有被任何method对象引用到的顶层对象不会被构造，而是以LazyObject
+    保存在对象池中。首次访问其属性，或通过${name}被传给其他对象时，才真正构造，
+    并用真实对象替换对象池中的占位符。
+    """
+
+    __slots__ = (
+        "_fdl_factory",
+        "_fdl_name",
+        "_fdl_config",
+        "_fdl_node",
+        "_fdl_obj",
+        "_fdl_lock",
+    )
+
+    def __init__(
+        self, factory: Factory, name: str, obj_config: dict, node=None
+    ) -> None:
+        self._fdl_factory = factory
+        self._fdl_name = name
+        self._fdl_config = obj_config
+        self._fdl_node = node
+        self._fdl_obj = _UNRESOLVED
+        self._fdl_lock = threading.Lock()
+
+    def fdl_resolve(self):
+        if self._fdl_obj is _UNRESOLVED:
+            # 多个线程同时访问时只构造一次；依赖图无环，按引用顺序加锁不会死锁
+            with self._fdl_lock:
+                if self._fdl_obj is _UNRESOLVED:
+                    obj = self._fdl_factory.create_single_obj(
+                        self._fdl_config, True, self._fdl_node
+                    )
+                    with self._fdl_factory._pool_lock:
+                        self._fdl_factory._name2obj[self._fdl_name] = obj
+                    self._fdl_obj = obj
+        return self._fdl_obj
+
+    def __getattr__(self, item):
+        return getattr(self.fdl_resolve(), item)
+
+    def __repr__(self):
+        if self._fdl_obj is _UNRESOLVED:
+            return f"<LazyObject '{self._fdl_name}' not constructed>"
+        return repr(self._fdl_obj)
 
 
 def register_clazz_as_name(clazz, name):
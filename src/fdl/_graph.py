@@ -0,0 +1,132 @@
+"""
+graph的作用：
+- 在构造任何对象之前，扫描顶层objects中的${name}与@@...@@引用，
+- 建立顶层对象之间的依赖关系(DAG)，
+- 给出拓扑构造顺序，检测循环引用并报告完整路径，
+- 给出可并行构造的依赖层级，
+- 给出从某些对象出发能引用到的对象集合，以及引用了某些对象的对象集合。
+"""
+import re
+
+REF_PATTERN = re.compile(r"\${(.*?)}")
+
+
+def find_refs(args):
+    """收集args容器(含子对象)中所有字符串里出现的${name}引用名"""
+    refs = set()
+    stack = [args]
+    while stack:
+        item = stack.pop()
+        if isinstance(item, str):
+            if "${" in item:
+                refs.update(REF_PATTERN.findall(item))
+        elif isinstance(item, dict):
+            stack.extend(item.values())
+        elif isinstance(item, list):
+            stack.extend(item)
+    return refs
+
+
+class DependencyGraph:
+    """顶层对象的依赖图，节点为objects列表中的下标。
+
+    deps[idx]是idx构造前必须先构造的对象下标集合。
+    引用了不存在的顶层对象名时不在此报错，留给factory在构造时抛出。
+    """
+
+    def __init__(self, obj_configs: list) -> None:
+        self.size = len(obj_configs)
+        # 未命名对象沿用旧的命名方式：objects_{反序下标}
+        self.names = [
+            obj_config.get("name", f"objects_{self.size - 1 - idx}")
+            for idx, obj_config in enumerate(obj_configs)
+        ]
+        self.name2idx = {name: idx for idx, name in enumerate(self.names)}
+        self.deps = list()
+        for obj_config in obj_configs:
+            refs = find_refs(obj_config.get("args", list()))
+            self.deps.append(
+                {self.name2idx[ref] for ref in refs if ref in self.name2idx}
+            )
+
+    @classmethod
+    def from_deps(cls, names: list, deps: list):
+        """由已知的对象名与依赖下标直接建图，不再扫描配置(fdl compile的结果)"""
+        graph = cls.__new__(cls)
+        graph.size = len(names)
+        graph.names = list(names)
+        graph.name2idx = {name: idx for idx, name in enumerate(graph.names)}
+        graph.deps = [set(dep) for dep in deps]
+        return graph
+
+    def order(self):
+        """拓扑序。无依赖约束时保持旧的反序构造顺序。"""
+        visited = [False] * self.size
+        on_path = [False] * self.size
+        order = list()
+        for root in range(self.size - 1, -1, -1):
+            if visited[root]:
+                continue
+            # 迭代式dfs，避免长引用链超出递归深度
+            path = [root]
+            stack = [iter(sorted(self.deps[root], reverse=True))]
+            on_path[root] = True
+            while stack:
+                child = next(stack[-1], None)
+                if child is None:
+                    node = path.pop()
+                    stack.pop()
+                    on_path[node] = False
+                    visited[node] = True
+                    order.append(node)
+                    continue
+                if on_path[child]:
+                    self._raise_cycle(path[path.index(child) :] + [child])
+                if visited[child]:
+                    continue
+                on_path[child] = True
+                path.append(child)
+                stack.append(iter(sorted(self.deps[child], reverse=True)))
+        return order
+
+    def levels(self):
+        """按依赖深度分层，同一层内的对象互不依赖，可以同时构造。"""
+        depth = [0] * self.size
+        levels = list()
+        for idx in self.order():
+            if self.deps[idx]:
+                depth[idx] = max(depth[dep] for dep in self.deps[idx]) + 1
+            if depth[idx] == len(levels):
+                levels.append(list())
+            levels[depth[idx]].append(idx)
+        return levels
+
+    def reachable(self, roots):
+        """roots及其直接、间接引用的全部对象下标"""
+        seen = set(roots)
+        stack = list(roots)
+        while stack:
+            for dep in self.deps[stack.pop()]:
+                if dep not in seen:
+                    seen.add(dep)
+                    stack.append(dep)
+        return seen
+
+    def dependents(self, roots):
+        """roots及直接、间接引用了它们的全部对象下标"""
+        users = [list() for _ in range(self.size)]
+        for idx, deps in enumerate(self.deps):
+            for dep in deps:
+                users[dep].append(idx)
+        seen = set(roots)
+        stack = list(roots)
+        while stack:
+            for user in users[stack.pop()]:
+                if user not in seen:
+                    seen.add(user)
+                    stack.append(user)
+        return seen
+
+    def _raise_cycle(self, cycle):
+        cycle_str = " -> ".join(self.names[idx] for idx in cycle)
+        raise ValueError(f"circular reference found between top objects: {cycle_str}")
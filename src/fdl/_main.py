@@ -1,7 +1,10 @@
 import argparse
 import pathlib
+import time
 
 import fdl._core as _core
+from fdl._common import Profiler
+from fdl._factory import INIT_CONFIG_POLICIES
 from fdl._utils import bind
 
 __FDL_VERSION__ = "0.0.1"
@@ -16,9 +19,18 @@ def show_version():
 
 def get_usage():
     return (
-        "\nfdl run Your_Json_Path [-b temp_module]\n"
+        "\nfdl run Your_Json_Path [-b temp_module] [-w workers] [-l] [--stream]"
+        " [-s] [--no-check] [--watch] [-c] [--init-config Policy]"
+        " [--init-config-report] [-p] [-d]"
+        " [--socket Socket_Path]\n"
         "fdl show Partly_Clazz_Name(use '' to show all) [-b Temp_Module]\n"
         "fdl gen [Full_Clazz_Name1, Full_Clazz_Name2...] [-b Temp_Module]\n"
+        "fdl serve [-b Temp_Module] [--socket Socket_Path]\n"
+        "fdl sweep Your_Json_Path --grid Grid_Json_Path [-w workers] [-b temp_module]"
+        " [-o Saved_Path] [-l]\n"
+        "fdl cache {ls,clear}\n"
+        "fdl compile Your_Json_Path [-o Output_Fdlc_Path] [-b temp_module]\n"
+        "fdl check Your_Json_Path [-b temp_module]\n"
     )
 
 
@@ -48,11 +60,23 @@ class TerminalParser:
         self._add_gen()
         # subparser: show
         self._add_show()
+        # subparser: serve
+        self._add_serve()
+        # subparser: sweep
+        self._add_sweep()
+        # subparser: cache
+        self._add_cache()
+        # subparser: compile
+        self._add_compile()
+        # subparser: check
+        self._add_check()
 
     def _add_run(self):
         parser_run = self.sub_parser.add_parser("run", help="run with json file")
         parser_run.add_argument(
-            "run_json_path", type=str, help="json path you want to run."
+            "run_json_path",
+            type=str,
+            help="json path, or .fdlc compiled by 'fdl compile', you want to run.",
         )
         parser_run.add_argument(
             "-b",
@@ -63,6 +87,112 @@ class TerminalParser:
             required=False,
             default=None,
         )
+        parser_run.add_argument(
+            "-w",
+            "--workers",
+            type=int,
+            help=(
+                "construct independent top objects in parallel with N threads."
+                " overrides 'parallel_construct' in task."
+            ),
+            required=False,
+            default=None,
+        )
+        parser_run.add_argument(
+            "-l",
+            "--lazy",
+            default=False,
+            action="store_true",
+            help=(
+                "only construct top objects reachable from objects with 'method',"
+                " others are constructed on first use."
+            ),
+        )
+        parser_run.add_argument(
+            "--stream",
+            default=False,
+            action="store_true",
+            help=(
+                "parse 'objects' item by item and construct while parsing. keys such"
+                " as 'task' must come before 'objects'."
+            ),
+        )
+        parser_run.add_argument(
+            "-s",
+            "--share",
+            default=False,
+            action="store_true",
+            help=(
+                "construct identical child objects only once and share the instance."
+                " same as 'share_objects' in task."
+            ),
+        )
+        parser_run.add_argument(
+            "--no-check",
+            default=False,
+            action="store_true",
+            help="skip checking clazzs, args and references before constructing.",
+        )
+        parser_run.add_argument(
+            "--watch",
+            default=False,
+            action="store_true",
+            help=(
+                "keep running, and when the json changes rebuild only the changed"
+                " objects and the objects referencing them, then rerun methods."
+            ),
+        )
+        parser_run.add_argument(
+            "-c",
+            "--concurrent",
+            default=False,
+            action="store_true",
+            help=(
+                "run methods of all top objects concurrently. same as"
+                " 'concurrent_methods' in task."
+            ),
+        )
+        parser_run.add_argument(
+            "--init-config",
+            type=str,
+            choices=INIT_CONFIG_POLICIES,
+            help=(
+                "how constructed objects keep their _init_config. overrides"
+                " 'init_config' in task. default: full"
+            ),
+            required=False,
+            default=None,
+        )
+        parser_run.add_argument(
+            "--init-config-report",
+            default=False,
+            action="store_true",
+            help="print how much memory each init_config policy saves.",
+        )
+        parser_run.add_argument(
+            "-p",
+            "--profile",
+            default=False,
+            action="store_true",
+            help=(
+                "print time cost of each startup phase and each constructed object,"
+                " and save them to profile.json in the work folder."
+            ),
+        )
+        parser_run.add_argument(
+            "-d",
+            "--daemon",
+            default=False,
+            action="store_true",
+            help="submit to a running 'fdl serve' daemon instead of a new process.",
+        )
+        parser_run.add_argument(
+            "--socket",
+            type=str,
+            help="unix socket of the daemon. default: serve.sock in fdl cache dir.",
+            required=False,
+            default=None,
+        )
         parser_run.set_defaults(func=_core.run)
 
     def _add_gen(self):
@@ -126,6 +256,144 @@ class TerminalParser:
         )
         show_parser.set_defaults(func=_core.show)
 
+    def _add_serve(self):
+        serve_parser = self.sub_parser.add_parser(
+            "serve",
+            help="start a daemon keeping modules imported for 'fdl run --daemon'.",
+        )
+        serve_parser.add_argument(
+            "-b",
+            "--bind",
+            type=str,
+            nargs="+",
+            help="temp bind python file to preload.",
+            required=False,
+            default=None,
+        )
+        serve_parser.add_argument(
+            "--socket",
+            type=str,
+            help="unix socket to listen. default: serve.sock in fdl cache dir.",
+            required=False,
+            default=None,
+        )
+        serve_parser.set_defaults(func=_core.serve)
+
+    def _add_sweep(self):
+        sweep_parser = self.sub_parser.add_parser(
+            "sweep", help="run variants of a json with overrides in a process pool."
+        )
+        sweep_parser.add_argument(
+            "run_json_path", type=str, help="base json path of the variants."
+        )
+        sweep_parser.add_argument(
+            "-g",
+            "--grid",
+            type=str,
+            required=True,
+            help=(
+                "json of overrides. dict {path: [values]} runs the cartesian product,"
+                " list [{path: value}] runs each element."
+            ),
+        )
+        sweep_parser.add_argument(
+            "-w",
+            "--workers",
+            type=int,
+            help="number of worker processes. default: cpu count.",
+            required=False,
+            default=None,
+        )
+        sweep_parser.add_argument(
+            "-b",
+            "--bind",
+            type=str,
+            nargs="+",
+            help="temp bind python file to register modules.",
+            required=False,
+            default=None,
+        )
+        sweep_parser.add_argument(
+            "-o",
+            "--output",
+            type=str,
+            help=(
+                "saved path of variant work folders. overrides 'saved_path' in task."
+                f" default: {_core.command_sweep.DEFAULT_SAVED_PATH}"
+            ),
+            required=False,
+            default=None,
+        )
+        sweep_parser.add_argument(
+            "-l",
+            "--lazy",
+            default=False,
+            action="store_true",
+            help="construct each variant lazily, same as 'fdl run --lazy'.",
+        )
+        sweep_parser.set_defaults(func=_core.sweep)
+
+    def _add_cache(self):
+        cache_parser = self.sub_parser.add_parser(
+            "cache", help="list or clear objects cached by 'cache': true."
+        )
+        cache_parser.add_argument(
+            "action",
+            type=str,
+            choices=("ls", "clear"),
+            help="ls: list cached objects. clear: remove all cached objects.",
+        )
+        cache_parser.set_defaults(func=_core.cache)
+
+    def _add_compile(self):
+        compile_parser = self.sub_parser.add_parser(
+            "compile",
+            help="validate json and save a pre-resolved plan that 'fdl run' loads.",
+        )
+        compile_parser.add_argument(
+            "compile_json_path", type=str, help="json path you want to compile."
+        )
+        compile_parser.add_argument(
+            "-b",
+            "--bind",
+            type=str,
+            nargs="+",
+            help="temp bind python file to register modules.",
+            required=False,
+            default=None,
+        )
+        compile_parser.add_argument(
+            "-o",
+            "--output",
+            required=False,
+            default=None,
+            type=str,
+            help="output plan path. default: json path with .fdlc suffix",
+        )
+        compile_parser.set_defaults(func=_core.compile_json)
+
+    def _add_check(self):
+        check_parser = self.sub_parser.add_parser(
+            "check",
+            help=(
+                "check clazzs, args and references of json without constructing"
+                " anything, report all errors."
+            ),
+        )
+        check_parser.add_argument(
+            "check_json_path", type=str, help="json path you want to check."
+        )
+        check_parser.add_argument(
+            "-b",
+            "--bind",
+            type=str,
+            nargs="+",
+            help="temp bind python file to register modules.",
+            required=False,
+            default=None,
+        )
+        check_parser.set_defaults(func=_core.check)
+
     def parse_args(self):
         return self._parser.parse_args()
 
@@ -134,19 +402,30 @@ class TerminalParser:
 
 
 def main():
+    profiler = Profiler()
+    start = time.perf_counter()
     parser = TerminalParser()
     parser.add_arguments()
     args = parser.parse_args()
+    if getattr(args, "profile", False):
+        profiler.enable()
+    profiler.add_phase("parse arguments", start, time.perf_counter())
 
     if args.version:
         show_version()
         return
+    if getattr(args, "daemon", False):
+        # 模块由daemon导入，这里只负责提交任务
+        args.func(args)
+        return
     # try binding temp modules
     if hasattr(args, "bind") and args.bind is not None:
         for bind_path in args.bind:
-            bind(bind_path)
+            with profiler.phase(f"bind {bind_path}"):
+                bind(bind_path)
     if hasattr(args, "func") and args.func is not None:
-        import fdl.modules
+        with profiler.phase("import fdl.modules"):
+            import fdl.modules
 
         args.func(args)
     else:
@@ -0,0 +1,365 @@
+"""
+manifest的作用：
+- 不导入模块，通过扫描源码中的register/register_as/register_clazz_as_name调用，
+  得到注册名到模块路径的映射，
+- 使fdl只在配置的clazz真正用到某个模块时才导入它。
+无法静态确定注册名的模块(例如调用register_module_clazzs，或注册名不是字符串常量)
+被标记为eager，仍在启动时导入。
+- 扫描结果(含构造函数签名、doc)按文件的mtime与大小缓存在本地索引文件中，
+  文件未修改时无需重新解析，fdl show/gen也可以直接从索引回答而不导入模块。
+"""
+import ast
+import builtins
+import hashlib
+import json
+import os
+
+from fdl._utils import get_cache_dir, is_json_serializable
+
+INDEX_VERSION = 3
+# fdl提供的注册函数
+REGISTER_HELPERS = (
+    "register",
+    "register_as",
+    "register_clazz_as_name",
+    "register_module_clazzs",
+)
+# 注解无法静态得到与str(annotation)相同的文本
+_UNKNOWN_ANNOTATION = object()
+
+
+def list_module_paths(modules_dir):
+    """modules目录下可以被bind的模块：.py文件与文件夹"""
+    module_paths = list()
+    for name in sorted(os.listdir(modules_dir)):
+        if name.startswith((".", "_")):
+            continue
+        module_path = os.path.join(modules_dir, name)
+        if os.path.isdir(module_path) or name.endswith(".py"):
+            module_paths.append(module_path)
+    return module_paths
+
+
+def iter_source_files(module_path):
+    """(源文件路径, 导入后的模块名)，模块名与bind导入时一致"""
+    if os.path.isfile(module_path):
+        yield module_path, os.path.basename(module_path)[: -len(".py")]
+        return
+    parent = os.path.dirname(module_path)
+    for dir_path, dir_names, file_names in os.walk(module_path):
+        dir_names[:] = sorted(name for name in dir_names if name != "__pycache__")
+        package = os.path.relpath(dir_path, parent).replace(os.sep, ".")
+        for file_name in sorted(file_names):
+            if not file_name.endswith(".py"):
+                continue
+            if file_name == "__init__.py":
+                yield os.path.join(dir_path, file_name), package
+            else:
+                yield os.path.join(dir_path, file_name), f"{package}.{file_name[:-3]}"
+
+
+def _str_const(node):
+    # python<3.8中字符串常量是ast.Str
+    value = node.value if isinstance(node, ast.Constant) else getattr(node, "s", None)
+    return value if isinstance(value, str) else None
+
+
+def _annotation_text(node, source, postponed):
+    """与_utils.gen_clazz_example_obj中的str(annotation)一致的文本。
+
+    from __future__ import annotations时注解是源码字符串；否则只有内置类型
+    (如int对应"<class 'int'>")与字符串注解能静态确定，其余返回_UNKNOWN_ANNOTATION。
+    """
+    if postponed:
+        # ast.get_source_segment需要python>=3.8
+        if not hasattr(ast, "get_source_segment"):
+            return _UNKNOWN_ANNOTATION
+        text = ast.get_source_segment(source, node)
+        return _UNKNOWN_ANNOTATION if text is None else text
+    value = _str_const(node)
+    if value is not None:
+        return value
+    if isinstance(node, ast.Constant) and node.value is None:
+        return "None"
+    if isinstance(node, ast.Name):
+        if isinstance(getattr(builtins, node.id, None), type):
+            return f"<class '{node.id}'>"
+    return _UNKNOWN_ANNOTATION
+
+
+def _param_info(arg, default, source, postponed):
+    """参数的元数据，注解无法静态确定时返回None"""
+    param = {"name": arg.arg}
+    if default is not None:
+        try:
+            value = ast.literal_eval(default)
+        except ValueError:
+            value = None
+        else:
+            if is_json_serializable(value):
+                param["default"] = value
+    if arg.annotation is not None:
+        annotation = _annotation_text(arg.annotation, source, postponed)
+        if annotation is _UNKNOWN_ANNOTATION:
+            return None
+        param["annotation"] = annotation
+    return param
+
+
+def _signature_params(node, source, postponed=False):
+    """与inspect.signature(clazz)一致的参数列表，无法静态确定时返回None。
+
+    postponed表示模块中有from __future__ import annotations。
+    """
+    if isinstance(node, ast.ClassDef):
+        inits = [
+            child
+            for child in node.body
+            if isinstance(child, ast.FunctionDef) and child.name == "__init__"
+        ]
+        # 没有__init__时签名来自父类，需要导入才能确定
+        if not inits:
+            return None
+        func, drop_first = inits[-1], True
+    else:
+        func, drop_first = node, False
+    args = func.args
+    positional = list(getattr(args, "posonlyargs", list())) + list(args.args)
+    defaults = [None] * (len(positional) - len(args.defaults)) + list(args.defaults)
+    params = [
+        _param_info(arg, default, source, postponed)
+        for arg, default in zip(positional, defaults)
+    ]
+    if drop_first:
+        params = params[1:]
+    if args.vararg is not None:
+        params.append(_param_info(args.vararg, None, source, postponed))
+    for arg, default in zip(args.kwonlyargs, args.kw_defaults):
+        params.append(_param_info(arg, default, source, postponed))
+    if args.kwarg is not None:
+        params.append(_param_info(args.kwarg, None, source, postponed))
+    # 有注解无法静态确定时需要导入，保证与导入后生成的示例一致
+    if None in params:
+        return None
+    return params
+
+
+class _RegisterVisitor(ast.NodeVisitor):
+    def __init__(self, file_path, module_name, source) -> None:
+        self.file_path = file_path
+        self.module_name = module_name
+        self.source = source
+        # 注册名 -> 定义节点，定义不在此文件时为None
+        self.names = dict()
+        # register_clazz_as_name(X, name)中X的名字，扫描结束后在本文件的定义中查找
+        self.pending = dict()
+        self.definitions = dict()
+        self.dynamic = False
+        self.postponed = False
+        # 本文件中指向注册函数的名字 -> 注册函数名，包括import ... as的别名
+        self.helpers = {name: name for name in REGISTER_HELPERS}
+        self.imports_fdl = False
+
+    def _helper(self, node):
+        """node是注册函数时返回其原名"""
+        if isinstance(node, ast.Name):
+            return self.helpers.get(node.id, None)
+        if isinstance(node, ast.Attribute) and node.attr in REGISTER_HELPERS:
+            return node.attr
+        return None
+
+    def _add(self, name, node=None):
+        if name is None:
+            self.dynamic = True
+        else:
+            self.names[name] = node
+
+    def _visit_definition(self, node):
+        self.definitions.setdefault(node.name, node)
+        for decorator in node.decorator_list:
+            if self._helper(decorator) == "register":
+                self._add(f"{self.module_name}.{node.name}", node)
+            elif isinstance(decorator, ast.Call):
+                if self._helper(decorator.func) == "register_as":
+                    name = _str_const(decorator.args[0]) if decorator.args else None
+                    self._add(name, node)
+                # 装饰器中的调用已处理，不再作为普通调用访问
+                for arg in decorator.args + [kw.value for kw in decorator.keywords]:
+                    self.visit(arg)
+        for child in node.body:
+            self.visit(child)
+
+    visit_ClassDef = _visit_definition
+    visit_FunctionDef = _visit_definition
+    visit_AsyncFunctionDef = _visit_definition
+
+    def visit_Import(self, node):
+        if any(alias.name.split(".")[0] == "fdl" for alias in node.names):
+            self.imports_fdl = True
+        self.generic_visit(node)
+
+    def visit_ImportFrom(self, node):
+        if node.module == "__future__":
+            if any(alias.name == "annotations" for alias in node.names):
+                self.postponed = True
+        elif node.level == 0 and (node.module or "").split(".")[0] == "fdl":
+            self.imports_fdl = True
+            for alias in node.names:
+                if alias.name in REGISTER_HELPERS:
+                    self.helpers[alias.asname or alias.name] = alias.name
+        self.generic_visit(node)
+
+    def visit_Call(self, node):
+        func_name = self._helper(node.func)
+        if func_name == "register_clazz_as_name":
+            name = _str_const(node.args[1]) if len(node.args) > 1 else None
+            self._add(name)
+            if name is not None and isinstance(node.args[0], ast.Name):
+                self.pending[name] = node.args[0].id
+        elif func_name == "register_as":
+            self._add(_str_const(node.args[0]) if node.args else None)
+        elif func_name in ("register", "register_module_clazzs"):
+            # register(obj)的注册名取决于obj，静态无法可靠确定
+            self.dynamic = True
+        self.generic_visit(node)
+
+    def entries(self):
+        """注册名 -> 签名等元数据，无法静态确定的注册名元数据为None"""
+        entries = dict()
+        for name, node in self.names.items():
+            if node is None and name in self.pending:
+                node = self.definitions.get(self.pending[name], None)
+            if node is None:
+                entries[name] = None
+                continue
+            entries[name] = {
+                "module": self.module_name,
+                "qualname": node.name,
+                "kind": "class" if isinstance(node, ast.ClassDef) else "function",
+                "def_path": os.path.abspath(self.file_path),
+                "doc": ast.get_docstring(node, clean=False),
+                "params": _signature_params(node, self.source, self.postponed),
+            }
+        return entries
+
+
+def scan_source_file(file_path, module_name):
+    """返回{"entries": {注册名: 元数据或None}, "dynamic": 是否无法静态确定}"""
+    with open(file_path, "r", encoding="utf-8") as file:
+        content = file.read()
+    if "register" not in content:
+        return {"entries": dict(), "dynamic": False}
+    try:
+        tree = ast.parse(content, filename=file_path)
+    except SyntaxError:
+        # 交给导入时报出语法错误
+        return {"entries": dict(), "dynamic": True}
+    visitor = _RegisterVisitor(file_path, module_name, content)
+    visitor.visit(tree)
+    # 导入了fdl却没有找到注册名时，可能以无法识别的方式注册(例如把注册函数赋值给
+    # 其他变量)，在启动时导入
+    dynamic = visitor.dynamic or (visitor.imports_fdl and not visitor.names)
+    return {"entries": visitor.entries(), "dynamic": dynamic}
+
+
+def get_index_path(modules_dir):
+    """索引文件位于$FDL_CACHE_DIR，默认~/.cache/fdl，每个modules目录一个"""
+    cache_dir = get_cache_dir()
+    dir_hash = hashlib.md5(os.path.abspath(modules_dir).encode("utf-8")).hexdigest()
+    return os.path.join(cache_dir, f"registry-{dir_hash[:12]}.json")
+
+
+def _read_index(index_path):
+    try:
+        with open(index_path, "r", encoding="utf-8") as file:
+            index = json.load(file)
+    except (OSError, ValueError):
+        return dict()
+    if not isinstance(index, dict) or index.get("version") != INDEX_VERSION:
+        return dict()
+    return index.get("files", dict())
+
+
+def _write_index(index_path, files):
+    # 索引只是缓存，写入失败(例如目录只读)不影响使用
+    try:
+        os.makedirs(os.path.dirname(index_path), exist_ok=True)
+        tmp_path = f"{index_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as file:
+            json.dump({"version": INDEX_VERSION, "files": files}, file)
+        os.replace(tmp_path, index_path)
+    except OSError:
+        pass
+
+
+def build_manifest(modules_dir, index_path=None):
+    """扫描modules_dir，返回
+
+    {"names": {注册名: 模块路径}, "eager": [模块路径], "entries": {注册名: 元数据或None}}
+
+    index_path不为None时，复用其中mtime与大小未变化的文件的扫描结果，并写回新的结果。
+    """
+    cached = dict() if index_path is None else _read_index(index_path)
+    files = dict()
+    names = dict()
+    entries = dict()
+    eager = list()
+    for module_path in list_module_paths(modules_dir):
+        for file_path, module_name in iter_source_files(module_path):
+            stat = os.stat(file_path)
+            record = cached.get(file_path, None)
+            if (
+                record is None
+                or record["mtime_ns"] != stat.st_mtime_ns
+                or record["size"] != stat.st_size
+                or record["module"] != module_name
+            ):
+                record = scan_source_file(file_path, module_name)
+                record.update(
+                    mtime_ns=stat.st_mtime_ns, size=stat.st_size, module=module_name
+                )
+            files[file_path] = record
+            for name, entry in record["entries"].items():
+                if name not in names:
+                    names[name] = module_path
+                    entries[name] = entry
+            if record["dynamic"] and module_path not in eager:
+                eager.append(module_path)
+    if index_path is not None and files != cached:
+        _write_index(index_path, files)
+    return {"names": names, "eager": eager, "entries": entries}
+
+
+class IndexedClazz:
+    """索引中记录的、尚未导入的注册对象，供fdl show/gen使用"""
+
+    def __init__(self, entry: dict) -> None:
+        self.entry = entry
+
+    @property
+    def has_signature(self):
+        return self.entry["params"] is not None
+
+    @property
+    def doc(self):
+        return self.entry["doc"]
+
+    def gen_example_obj(self, clazz_name):
+        """与_utils.gen_clazz_example_obj生成的格式一致"""
+        args = dict()
+        for param in self.entry["params"]:
+            if "default" in param:
+                args[param["name"]] = param["default"]
+            elif "annotation" in param:
+                args[param["name"]] = param["annotation"]
+            else:
+                args[param["name"]] = "Todo Here!"
+        return {
+            "clazz": clazz_name,
+            "def_path": self.entry["def_path"],
+            "args": args,
+        }
+
+    def __repr__(self):
+        full_name = f"{self.entry['module']}.{self.entry['qualname']}"
+        return f"<{self.entry['kind']} '{full_name}'>"
@@ -0,0 +1,376 @@
+"""
+runner的作用：
+- 调用core对象的method，method可以是普通函数，也可以是协程函数(async def)，
+- 默认按声明顺序依次调用，
+- 设置了concurrent的method彼此之间、以及与顺序执行的method之间并发执行：
+  协程在同一个事件循环中await，阻塞的method交给线程池，
+- 有after或${name.result}时按method之间的依赖图调度，互不依赖的分支并发执行，
+  method的返回值以name.result保存在对象池中，供之后的method_args引用，
+- 设置了"input": "${name}"的对象与name组成流水线，各自在一个线程中同时执行，
+  name的method返回的生成器逐个产生的数据经有界队列传给下游method的第一个参数，
+- 并发执行时收集每个对象的异常，全部结束后统一报告。
+"""
+import asyncio
+import functools
+import inspect
+import queue
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from copy import deepcopy
+
+from fdl._common import Logger, Profiler
+from fdl._graph import REF_PATTERN, DependencyGraph, find_refs
+
+RESULT_SUFFIX = ".result"
+# 只影响method调用、不影响对象构造的顶层配置键
+METHOD_KEYS = ("method", "method_args", "after", "input", "queue_size", "concurrent")
+DEFAULT_QUEUE_SIZE = 64
+_END = object()
+
+
+class _PipeError:
+    __slots__ = ("error",)
+
+    def __init__(self, error) -> None:
+        self.error = error
+
+
+class Pipe:
+    """连接上下游两个stage的有界队列，队列满时上游阻塞(背压)"""
+
+    def __init__(self, name: str, size: int = DEFAULT_QUEUE_SIZE) -> None:
+        # queue.Queue的maxsize不大于0时不限长度，必须拒绝
+        if not isinstance(size, int) or isinstance(size, bool) or size <= 0:
+            raise ValueError(
+                f"queue_size of input {name} expected to be a positive int, got {size}"
+            )
+        self.name = name
+        self._queue = queue.Queue(size)
+        # 下游已经结束，不再读取
+        self._closed = threading.Event()
+        self._ended = False
+
+    def put(self, item):
+        """返回False表示下游已经结束，不需要更多数据"""
+        while not self._closed.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def end(self):
+        if not self._ended:
+            self._ended = True
+            self.put(_END)
+
+    def fail(self, error):
+        if not self._ended:
+            self._ended = True
+            self.put(_PipeError(error))
+
+    def close(self):
+        self._closed.set()
+
+    def __iter__(self):
+        while True:
+            item = self._queue.get()
+            if item is _END:
+                return
+            if isinstance(item, _PipeError):
+                raise RuntimeError(f"input {self.name} failed.") from item.error
+            yield item
+
+
+def pump(func, pipes: list):
+    """在当前线程中执行func，把返回的可迭代对象逐个送入每个下游的pipe"""
+    try:
+        for item in func():
+            # 每个下游都收到全部数据，全部下游结束后提前停止
+            if not any([pipe.put(item) for pipe in pipes]):
+                break
+    except BaseException as error:
+        for pipe in pipes:
+            pipe.fail(error)
+        raise
+    for pipe in pipes:
+        pipe.end()
+
+
+def drain(func):
+    """在当前线程中执行func，流水线末端的method返回生成器时逐个取完并丢弃。
+
+    只创建生成器而不迭代时，上游只会产生一个数据就被停止。
+    """
+    rst = func()
+    if inspect.isgenerator(rst):
+        for _ in rst:
+            pass
+        return None
+    return rst
+
+
+def get_method(obj, obj_config: dict):
+    func_to_run = obj_config.method
+    if not hasattr(obj, func_to_run):
+        raise AttributeError(
+            f"object {obj_config.get('name')} don't have method {func_to_run}"
+        )
+    return getattr(obj, func_to_run)
+
+
+def method_label(obj_config: dict):
+    return f"{obj_config.get('name', obj_config.clazz)}.{obj_config.method}"
+
+
+def result_refs(obj_config: dict):
+    """method_args中以${name.result}引用了返回值的对象名"""
+    refs = find_refs(obj_config.get("method_args", list()))
+    return {ref[: -len(RESULT_SUFFIX)] for ref in refs if ref.endswith(RESULT_SUFFIX)}
+
+
+def get_input_name(obj_config: dict):
+    """"input": "${name}"中的上游对象名，没有input时返回None"""
+    stage_input = obj_config.get("input", None)
+    if stage_input is None:
+        return None
+    match = REF_PATTERN.fullmatch(stage_input) if isinstance(stage_input, str) else None
+    if match is None:
+        raise TypeError(
+            f"input of {method_label(obj_config)} expected to be '${{name}}', got"
+            f" {stage_input}"
+        )
+    return match.group(1)
+
+
+def is_method_dag(obj_configs: list):
+    for obj_config in obj_configs:
+        if "after" in obj_config.keys() or "input" in obj_config.keys():
+            return True
+        if result_refs(obj_config):
+            return True
+    return False
+
+
+def build_method_graph(obj_configs: list):
+    """method之间的依赖图与每个对象的上游下标。
+
+    依赖图的边是after中的对象与method_args引用了返回值的对象；
+    上游与下游同时执行，不是依赖图的边，但参与循环检测。
+    """
+    names = [
+        obj_config.get("name", method_label(obj_config)) for obj_config in obj_configs
+    ]
+    name2idx = {
+        obj_config["name"]: idx
+        for idx, obj_config in enumerate(obj_configs)
+        if "name" in obj_config.keys()
+    }
+    deps = list()
+    for obj_config in obj_configs:
+        after = obj_config.get("after", list())
+        if isinstance(after, str):
+            after = [after]
+        if not isinstance(after, list):
+            raise TypeError(
+                f"after of {method_label(obj_config)} expected to be list, got"
+                f" {type(after)}"
+            )
+        dep_idxs = set()
+        for dep_name in set(after) | result_refs(obj_config):
+            if dep_name not in name2idx:
+                raise ValueError(
+                    f"{method_label(obj_config)} depends on {dep_name}, which is not a"
+                    " top object with 'method'."
+                )
+            dep_idxs.add(name2idx[dep_name])
+        deps.append(dep_idxs)
+    inputs = dict()
+    for idx, obj_config in enumerate(obj_configs):
+        input_name = get_input_name(obj_config)
+        if input_name is None:
+            continue
+        if input_name not in name2idx:
+            raise ValueError(
+                f"input {input_name} of {method_label(obj_config)} is not a top object"
+                " with 'method'."
+            )
+        inputs[idx] = name2idx[input_name]
+    # 循环依赖在调用任何method之前报出
+    stage_deps = [set(dep_idxs) for dep_idxs in deps]
+    for idx, input_idx in inputs.items():
+        stage_deps[idx].add(input_idx)
+    DependencyGraph.from_deps(names, stage_deps).order()
+    graph = DependencyGraph.from_deps(names, deps)
+    for idx, input_idx in inputs.items():
+        # 等待上游结束才开始的下游永远读不到数据
+        if input_idx in graph.reachable(graph.deps[idx]):
+            raise ValueError(
+                f"{method_label(obj_configs[idx])} waits for its input"
+                f" {names[input_idx]} to finish."
+            )
+    return graph, inputs
+
+
+class MethodRunner:
+    def __init__(self, profiler: Profiler, factory) -> None:
+        self.profiler = profiler
+        self.factory = factory
+        # [(method_label, 异常)]
+        self.errors = list()
+        self.skipped = list()
+        # 返回值被其它method引用的对象名
+        self._result_names = set()
+        # 流水线中每个对象读取的pipe与写入的pipe
+        self._pipe_in = dict()
+        self._pipes_out = dict()
+
+    def run(self, objs: list, obj_configs: list, concurrent: bool = False):
+        """concurrent为True时全部method并发执行，否则只有设置了concurrent的并发"""
+        jobs = list(zip(objs, obj_configs))
+        if is_method_dag(obj_configs):
+            graph, inputs = build_method_graph(obj_configs)
+            for obj_config in obj_configs:
+                self._result_names.update(result_refs(obj_config))
+            for idx, input_idx in inputs.items():
+                size = obj_configs[idx].get("queue_size", DEFAULT_QUEUE_SIZE)
+                pipe = Pipe(graph.names[input_idx], size)
+                self._pipe_in[idx] = pipe
+                self._pipes_out.setdefault(input_idx, list()).append(pipe)
+            asyncio.run(self._run_dag(jobs, graph))
+            self._raise_errors()
+            return
+        flags = [
+            concurrent or bool(obj_config.get("concurrent", False))
+            for obj_config in obj_configs
+        ]
+        if not any(flags):
+            for obj, obj_config in jobs:
+                self._call(obj, obj_config)
+            return
+        sequential = [job for job, flag in zip(jobs, flags) if not flag]
+        parallel = [job for job, flag in zip(jobs, flags) if flag]
+        asyncio.run(self._run_concurrent(sequential, parallel))
+        self._raise_errors()
+
+    def _get_func(self, obj, obj_config: dict, pipe_in: Pipe = None):
+        """绑定了method_args的method，流水线下游的第一个参数是上游的数据"""
+        func = get_method(obj, obj_config)
+        method_args = obj_config.get("method_args", None)
+        pre_args = () if pipe_in is None else (pipe_in,)
+        if method_args is None:
+            return functools.partial(func, *pre_args) if pre_args else func
+        # 不修改core对象的配置
+        method_args = self.factory._preprocess_args(deepcopy(method_args))
+        if isinstance(method_args, list):
+            return functools.partial(func, *pre_args, *method_args)
+        return functools.partial(func, *pre_args, **method_args)
+
+    def _call(self, obj, obj_config: dict):
+        func = self._get_func(obj, obj_config)
+        with self.profiler.phase(f"method {method_label(obj_config)}"):
+            rst = func()
+            if inspect.iscoroutine(rst):
+                rst = asyncio.run(rst)
+        return rst
+
+    async def _call_async(
+        self, obj, obj_config: dict, executor, pipe_in=None, pipes_out=None
+    ):
+        func = self._get_func(obj, obj_config, pipe_in)
+        if inspect.iscoroutinefunction(func) and (pipe_in or pipes_out):
+            raise TypeError(
+                f"method {method_label(obj_config)} in pipeline expected to be a"
+                " function or generator, got coroutine function."
+            )
+        loop = asyncio.get_running_loop()
+        with self.profiler.phase(f"method {method_label(obj_config)}"):
+            if pipes_out:
+                # 上游在自己的线程中产生数据，队列满时阻塞
+                rst = await loop.run_in_executor(executor, pump, func, pipes_out)
+            elif pipe_in is not None:
+                rst = await loop.run_in_executor(executor, drain, func)
+            elif inspect.iscoroutinefunction(func):
+                rst = await func()
+            else:
+                # 阻塞的method不能占用事件循环
+                rst = await loop.run_in_executor(executor, func)
+                if inspect.isawaitable(rst):
+                    rst = await rst
+        return rst
+
+    async def _run_job(self, job, executor, pipe_in=None, pipes_out=None):
+        obj, obj_config = job
+        try:
+            rst = await self._call_async(obj, obj_config, executor, pipe_in, pipes_out)
+        except Exception as error:  # pylint:disable=W0703
+            self.errors.append((method_label(obj_config), error))
+            return False
+        name = obj_config.get("name", None)
+        if name in self._result_names:
+            self.factory._save_obj(name + RESULT_SUFFIX, rst)
+        return True
+
+    async def _run_chain(self, jobs, executor):
+        """顺序执行的method，前一个失败后不再执行之后的"""
+        for idx, job in enumerate(jobs):
+            if not await self._run_job(job, executor):
+                self.skipped += [method_label(config) for _, config in jobs[idx + 1 :]]
+                return
+
+    async def _run_concurrent(self, sequential: list, parallel: list):
+        # 顺序链与每个并发的method各占一个线程
+        workers = len(parallel) + 1
+        with ThreadPoolExecutor(workers, thread_name_prefix="fdl-method") as executor:
+            tasks = [self._run_job(job, executor) for job in parallel]
+            if sequential:
+                tasks.append(self._run_chain(sequential, executor))
+            await asyncio.gather(*tasks)
+
+    async def _run_node(self, idx, job, dep_tasks: list, executor):
+        """依赖的method全部成功后才执行"""
+        pipe_in = self._pipe_in.get(idx, None)
+        pipes_out = self._pipes_out.get(idx, list())
+        try:
+            if dep_tasks and not all(await asyncio.gather(*dep_tasks)):
+                self.skipped.append(method_label(job[1]))
+                return False
+            return await self._run_job(job, executor, pipe_in, pipes_out)
+        finally:
+            # 没有执行或提前结束时，不能让上下游一直等待
+            if pipe_in is not None:
+                pipe_in.close()
+            for pipe in pipes_out:
+                pipe.fail(RuntimeError(f"{method_label(job[1])} didn't run."))
+
+    async def _run_dag(self, jobs: list, graph: DependencyGraph):
+        with ThreadPoolExecutor(len(jobs), thread_name_prefix="fdl-method") as executor:
+            tasks = dict()
+            # 按拓扑序创建，依赖的task总是已经存在
+            for idx in graph.order():
+                dep_tasks = [tasks[dep] for dep in graph.deps[idx]]
+                tasks[idx] = asyncio.ensure_future(
+                    self._run_node(idx, jobs[idx], dep_tasks, executor)
+                )
+            await asyncio.gather(*tasks.values())
+
+    def _raise_errors(self):
+        if self.skipped:
+            Logger().warning(f"skip methods after failure: {self.skipped}")
+        if not self.errors:
+            return
+        self.report_errors()
+        labels = [label for label, _ in self.errors]
+        first_error = self.errors[0][1]
+        raise RuntimeError(f"{len(labels)} methods failed: {labels}") from first_error
+
+    def report_errors(self):
+        for label, error in self.errors:
+            print(f"============={label} failed=============")
+            print(
+                "".join(
+                    traceback.format_exception(type(error), error, error.__traceback__)
+                )
+            )
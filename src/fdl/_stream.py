@@ -0,0 +1,145 @@
+"""
+stream的作用：
+- 分块读取json配置文件，不把整个文件读入内存，
+- 逐个解析objects数组中的元素，并按check_objects的规则逐个校验，
+- 使factory可以边解析边构造，内存峰值只取决于最大的单个对象配置。
+objects之前的键(例如task)在构造前读出，objects之后的键在构造完成后才可用。
+"""
+import json
+
+from fdl._common import Config
+from fdl._utils import assert_file_exists, check_object
+
+WHITESPACE = " \t\n\r"
+
+
+class ConfigStream:
+    def __init__(self, json_path, chunk_size=1 << 16) -> None:
+        assert_file_exists(json_path)
+        self.json_path = json_path
+        self.chunk_size = chunk_size
+        self._file = open(json_path, "r", encoding="utf-8")
+        self._buf = ""
+        self._pos = 0
+        self._eof = False
+        self._decoder = json.JSONDecoder()
+        # 顶层是list时没有header
+        self._is_list = None
+        self.header = dict()
+        self.tail = dict()
+
+    def _fill(self, size):
+        """丢弃已经解析的部分，再读入至少size个字符"""
+        chunk = self._file.read(size)
+        if not chunk:
+            self._eof = True
+        self._buf = self._buf[self._pos :] + chunk
+        self._pos = 0
+
+    def _error(self, msg):
+        return json.JSONDecodeError(
+            f"{self.json_path} is not a valid json file.{msg}", self._buf, self._pos
+        )
+
+    def _peek(self):
+        """跳过空白，返回下一个字符，文件结束时返回空字符串"""
+        while True:
+            while self._pos < len(self._buf) and self._buf[self._pos] in WHITESPACE:
+                self._pos += 1
+            if self._pos < len(self._buf) or self._eof:
+                break
+            self._fill(self.chunk_size)
+        return self._buf[self._pos : self._pos + 1]
+
+    def _expect(self, chars):
+        char = self._peek()
+        if not char or char not in chars:
+            raise self._error(f"Expecting one of '{chars}', got '{char}'")
+        self._pos += 1
+        return char
+
+    def _value(self):
+        """解析下一个完整的json值"""
+        self._peek()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buf, self._pos)
+            except json.JSONDecodeError as error:
+                if self._eof:
+                    raise self._error(error.msg) from error
+            else:
+                # 数字可能被截断在缓冲区末尾，需要读到其后的分隔符才能确定
+                if end < len(self._buf) or self._eof:
+                    self._pos = end
+                    return value
+            # 未解析部分加倍读入，超大的单个值也只被重复解析对数次
+            self._fill(max(self.chunk_size, len(self._buf) - self._pos))
+
+    def read_header(self):
+        """读到objects数组开始处，返回其之前的键值"""
+        char = self._expect("[{")
+        self._is_list = char == "["
+        if self._is_list:
+            return self.header
+        no_objects = KeyError(f"{self.json_path} is a dict, but no 'objects' found.")
+        if self._peek() == "}":
+            raise no_objects
+        while True:
+            key = self._value()
+            if not isinstance(key, str):
+                raise self._error("Expecting property name enclosed in double quotes")
+            self._expect(":")
+            if key == "objects":
+                if self._peek() != "[":
+                    raise TypeError(f"objects in {self.json_path} expected to be list.")
+                self._pos += 1
+                return self.header
+            self.header[key] = self._value()
+            if self._expect(",}") == "}":
+                raise no_objects
+
+    def _read_tail(self):
+        """objects数组之后的键值"""
+        if self._is_list:
+            if self._peek():
+                raise self._error("Extra data")
+            return
+        while self._expect(",}") == ",":
+            key = self._value()
+            self._expect(":")
+            self.tail[key] = self._value()
+        if self._peek():
+            raise self._error("Extra data")
+
+    def close(self):
+        self._file.close()
+
+    def iter_objects(self):
+        """逐个产生校验过的顶层对象配置(Config)"""
+        try:
+            yield from self._iter_objects()
+        finally:
+            self.close()
+
+    def _iter_objects(self):
+        if self._is_list is None:
+            self.read_header()
+        names = set()
+        if self._peek() != "]":
+            while True:
+                obj_config = self._value()
+                check_object(obj_config)
+                name = obj_config.get("name", None)
+                if name is not None:
+                    if name in names:
+                        raise ValueError(
+                            f"top element's name expected not repeat, {[name]} have"
+                            " repeat."
+                        )
+                    names.add(name)
+                yield Config.convert(obj_config)
+                if self._expect(",]") == "]":
+                    break
+        else:
+            self._pos += 1
+        self._read_tail()
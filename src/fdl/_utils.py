@@ -1,5 +1,7 @@
+import hashlib
 import inspect
 import json
+import mmap
 import os
 import re
 import shutil
@@ -9,6 +11,22 @@ from copy import deepcopy
 from datetime import datetime
 
 FDL_OBJ = {"clazz": "NotSet"}
+# 以只读内存映射方式传入的参数：{"$mmap": "x.npy"}与{"$buffer": "x.bin", "dtype": ...}
+MMAP_KEY = "$mmap"
+BUFFER_KEY = "$buffer"
+# $buffer的dtype到memoryview格式的映射
+BUFFER_DTYPES = {
+    "uint8": "B",
+    "int8": "b",
+    "uint16": "H",
+    "int16": "h",
+    "uint32": "I",
+    "int32": "i",
+    "uint64": "Q",
+    "int64": "q",
+    "float32": "f",
+    "float64": "d",
+}
 
 
 def setup_global_seed(seed):
@@ -32,6 +50,78 @@ def is_json_serializable(obj):
         return False
 
 
+def config_sizeof(config, seen=None):
+    """统计json结构(dict/list/str/数字)的配置占用的字节数。
+
+    不统计已构造出的对象，seen中已统计过的节点不重复统计。
+    """
+    if seen is None:
+        seen = set()
+    size = 0
+    stack = [config]
+    while stack:
+        item = stack.pop()
+        if id(item) in seen or not is_json_serializable(item):
+            continue
+        seen.add(id(item))
+        size += sys.getsizeof(item)
+        if isinstance(item, dict):
+            stack.extend(item.keys())
+            stack.extend(item.values())
+        elif isinstance(item, (list, tuple)):
+            stack.extend(item)
+    return size
+
+
+def config_hash(config):
+    """json配置的规范化哈希，与键的顺序无关。含有非json类型时抛出TypeError"""
+    content = json.dumps(config, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha1(content.encode("utf-8")).hexdigest()
+
+
+def is_mapped_arg(arg: dict):
+    return MMAP_KEY in arg or BUFFER_KEY in arg
+
+
+def load_mapped_arg(arg: dict):
+    """把{"$mmap": path}或{"$buffer": path, ...}参数映射为只读对象，不拷贝文件内容。
+
+    - $mmap: .npy文件，返回numpy的只读memmap数组，需要numpy。
+    - $buffer: 任意二进制文件，返回只读memoryview，可选dtype(默认uint8)、
+      offset(字节)与shape。
+    映射共享系统的页缓存，多个进程映射同一个文件不会重复占用内存。
+    """
+    if MMAP_KEY in arg:
+        path = arg[MMAP_KEY]
+        assert_file_exists(path)
+        try:
+            import numpy as np
+        except ImportError as error:
+            raise ImportError(
+                f"'{MMAP_KEY}' argument {path} requires numpy, use '{BUFFER_KEY}'"
+                " to map a file without numpy."
+            ) from error
+        return np.load(path, mmap_mode="r")
+    path = arg[BUFFER_KEY]
+    assert_file_exists(path)
+    dtype = arg.get("dtype", "uint8")
+    if dtype not in BUFFER_DTYPES:
+        raise ValueError(
+            f"dtype of '{BUFFER_KEY}' argument expected one of"
+            f" {list(BUFFER_DTYPES)}, got '{dtype}'"
+        )
+    if os.path.getsize(path) == 0:
+        raise ValueError(f"can't map empty file {path}")
+    with open(path, "rb") as file:
+        buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    # memoryview持有mmap的引用，文件在view被释放后才会解除映射
+    view = memoryview(buffer)[arg.get("offset", 0) :]
+    shape = arg.get("shape", None)
+    if shape is None:
+        return view.cast(BUFFER_DTYPES[dtype])
+    return view.cast(BUFFER_DTYPES[dtype], shape)
+
+
 def gen_clazz_example_obj(clazz, clazz_name):
     obj_config = deepcopy(FDL_OBJ)
     obj_config["clazz"] = clazz_name
@@ -101,6 +191,16 @@ def copy_if_not_exists(file_path: str, dst_dir: str):
     return True
 
 
+def get_cache_dir():
+    """fdl的本地缓存目录：$FDL_CACHE_DIR，默认~/.cache/fdl"""
+    return os.environ.get(
+        "FDL_CACHE_DIR",
+        os.path.join(
+            os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache")), "fdl"
+        ),
+    )
+
+
 def create_dirs_if_not_exists(dir_path):
     if not os.path.exists(dir_path):
         os.makedirs(dir_path)
@@ -146,16 +246,54 @@ def bind(module_path):
         ) from error
 
 
+def _get_json_backend():
+    """优先使用更快的orjson/ujson解析json，没有安装则使用标准库"""
+    try:
+        import orjson
+
+        return "orjson", orjson.loads
+    except ImportError:
+        pass
+    try:
+        import ujson
+
+        return "ujson", ujson.loads
+    except ImportError:
+        pass
+    return "json", json.loads
+
+
+JSON_BACKEND, _json_loads = _get_json_backend()
+
+
+def json_loads(content):
+    """用更快的后端解析，失败时用标准库重试，接受的输入与json.loads一致(例如NaN)"""
+    try:
+        return _json_loads(content)
+    except ValueError:
+        if _json_loads is json.loads:
+            raise
+    return json.loads(content)
+
+
 def read_json_from_file(json_path):
-    with open(json_path, "r", encoding="utf-8") as file:
-        try:
-            rst = json.load(file)
-        except json.JSONDecodeError as error:
-            raise json.JSONDecodeError(
-                f"{json_path} is not a valid json file.{error.msg}",
-                error.doc,
-                error.pos,
-            ) from error
+    with open(json_path, "rb") as file:
+        content = file.read()
+    try:
+        rst = json_loads(content)
+    except json.JSONDecodeError as error:
+        raise json.JSONDecodeError(
+            f"{json_path} is not a valid json file.{error.msg}",
+            error.doc,
+            error.pos,
+        ) from error
+    except ValueError as error:
+        # ujson的解析错误不携带位置信息
+        raise json.JSONDecodeError(
+            f"{json_path} is not a valid json file.{error}",
+            content.decode("utf-8", errors="replace"),
+            0,
+        ) from error
     return rst
 
 
@@ -174,29 +312,37 @@ def read_json_from_file(json_path):
 #     return names
 
 
-def check_objects(objects):
+def check_object(obj_config):
     """
-    check_objects:
+    check_object:
     - element in top objects must be dict
     - element in top objects must have key 'clazz', clazz value must be str
+    """
+    if not isinstance(obj_config, dict):
+        raise TypeError(
+            f"element in 'objects' list expected to be dict, got {type(obj_config)}"
+        )
+    if "clazz" not in obj_config.keys():
+        raise KeyError(
+            "element in 'objects' list expected to have key 'clazz', got"
+            f" {obj_config.keys()}"
+        )
+    if not isinstance(obj_config["clazz"], str):
+        raise TypeError(
+            "clazz of element in 'objects' list expected to be str, got"
+            f" {type(obj_config['clazz'])}"
+        )
+
+
+def check_objects(objects):
+    """
+    check_objects:
+    - every element passes check_object
     - name of element in top objects can't repeat.
     """
     obj_names = []
     for obj_config in objects:
-        if not isinstance(obj_config, dict):
-            raise TypeError(
-                f"element in 'objects' list expected to be dict, got {type(obj_config)}"
-            )
-        if "clazz" not in obj_config.keys():
-            raise KeyError(
-                "element in 'objects' list expected to have key 'clazz', got"
-                f" {obj_config.keys()}"
-            )
-        if not isinstance(obj_config["clazz"], str):
-            raise TypeError(
-                "clazz of element in 'objects' list expected to be str, got"
-                f" {type(obj_config['clazz'])}"
-            )
+        check_object(obj_config)
         # only count top elements' name
         if "name" in obj_config.keys():
             obj_names.append(obj_config["name"])
@@ -211,15 +357,11 @@ def check_objects(objects):
         )
 
 
-def check_config_file(json_path):
+def check_config(config, json_path):
     """
-    check json file:
-    - must exists
-    - valid json
+    check parsed json config:
     - have objects
     """
-    assert_file_exists(json_path)
-    config = read_json_from_file(json_path)
     if isinstance(config, dict):
         if "objects" not in config.keys():
             raise KeyError(f"{json_path} is a dict, but no 'objects' found.")
@@ -233,3 +375,17 @@ def check_config_file(json_path):
             f"json file top elements must be dict or list, got {type(config)}"
         )
     check_objects(objects)
+
+
+def check_config_file(json_path):
+    """
+    check json file:
+    - must exists
+    - valid json
+    - have objects
+    returns the parsed json, so callers don't need to parse the file again.
+    """
+    assert_file_exists(json_path)
+    config = read_json_from_file(json_path)
+    check_config(config, json_path)
+    return config
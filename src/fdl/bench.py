@@ -0,0 +1,248 @@
+"""
+fdl的性能基准：
+- 按顶层对象数量、嵌套深度、${ref}扇出、@@...@@密度生成合成配置，
+- 测量Config加载耗时、Factory.create吞吐、构造时的内存峰值，
+- 测量fdl run/show/gen的冷启动耗时，
+- 保存结果作为基线，并与基线比较。
+
+python -m fdl.bench --objects 100 1000 --save-baseline bench.json
+python -m fdl.bench --objects 100 1000 --baseline bench.json
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from fdl._common import Config
+from fdl._factory import Factory, register_clazz_as_name
+from fdl._utils import check_config_file
+
+NODE_CLAZZ = "fdl.bench.Node"
+NODE_MODULE = """from fdl import register_as
+
+
+@register_as("fdl.bench.Node")
+class Node:
+    def __init__(self, value=None, children=(), size=None):
+        self.value = value
+        self.children = children
+        self.size = size
+
+    def run(self):
+        pass
+"""
+
+
+class Node:
+    def __init__(self, value=None, children=(), size=None) -> None:
+        self.value = value
+        self.children = children
+        self.size = size
+
+    def run(self):
+        pass
+
+
+def gen_config(objects, depth=1, fanout=0, command_density=0.0, prefix="", seed=0):
+    """生成合成配置。
+
+    每个顶层对象是一条depth层的子对象链，引用fanout个之前声明的顶层对象，
+    并以command_density的概率带一个@@...@@参数。
+    """
+    rng = random.Random(seed)
+    obj_configs = list()
+    for idx in range(objects):
+        refs = [
+            f"${{{prefix}node_{ref}}}"
+            for ref in rng.sample(range(idx), min(fanout, idx))
+        ]
+        node = {"clazz": NODE_CLAZZ, "args": {"value": idx, "children": refs}}
+        for level in range(1, depth):
+            node = {"clazz": NODE_CLAZZ, "args": {"value": level, "children": [node]}}
+        if rng.random() < command_density:
+            node["args"]["size"] = f"@@ret=len('{prefix}node_{idx}') * 2@@"
+        node["name"] = f"{prefix}node_{idx}"
+        obj_configs.append(node)
+    # 最后一个对象作为入口，保证fdl run有method可以调用
+    if obj_configs:
+        obj_configs[-1]["method"] = "run"
+    # 打乱声明顺序，构造顺序完全由依赖图决定
+    rng.shuffle(obj_configs)
+    return {"objects": obj_configs}
+
+
+def _ensure_registered():
+    if NODE_CLAZZ not in Factory().get_name2clazz():
+        register_clazz_as_name(Node, NODE_CLAZZ)
+
+
+def bench_load(json_path, repeat):
+    """check_config_file + Config.load的最短耗时"""
+    costs = list()
+    for _ in range(repeat):
+        start = time.perf_counter()
+        Config().load(check_config_file(json_path))
+        costs.append(time.perf_counter() - start)
+    return min(costs)
+
+
+def bench_create(scale, repeat):
+    """Factory.create的最短耗时、对象吞吐与内存峰值。
+
+    tracemalloc会拖慢每次内存分配，计时不开启，内存峰值在另一次不计时的构造中测量。
+    """
+    _ensure_registered()
+    costs = list()
+    for _ in range(repeat):
+        factory = Factory.scoped()
+        config = Config().load(gen_config(**scale))
+        start = time.perf_counter()
+        factory.create(config)
+        costs.append(time.perf_counter() - start)
+    factory = Factory.scoped()
+    config = Config().load(gen_config(**scale))
+    tracemalloc.start()
+    try:
+        factory.create(config)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    cost = min(costs)
+    total = scale["objects"] * scale.get("depth", 1)
+    return cost, total / cost if cost > 0 else float("inf"), peak
+
+
+def bench_cli(args, cwd, repeat):
+    """子进程执行fdl命令的最短耗时，包含解释器启动"""
+    # 子进程使用与当前进程相同的fdl
+    env = dict(os.environ)
+    fdl_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env["PYTHONPATH"] = os.pathsep.join(
+        path for path in (fdl_root, env.get("PYTHONPATH", "")) if path
+    )
+    costs = list()
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run(
+            [sys.executable, "-m", "fdl._main"] + args,
+            cwd=cwd,
+            env=env,
+            check=True,
+            stdout=subprocess.DEVNULL,
+        )
+        costs.append(time.perf_counter() - start)
+    return min(costs)
+
+
+def run_benchmarks(scales, repeat=3, cli=True):
+    results = dict()
+    with tempfile.TemporaryDirectory() as work_dir:
+        module_path = os.path.join(work_dir, "fdl_bench_nodes.py")
+        with open(module_path, "w", encoding="utf-8") as file:
+            file.write(NODE_MODULE)
+        for scale in scales:
+            key = (
+                f"objects={scale['objects']},depth={scale['depth']},"
+                f"fanout={scale['fanout']},command_density={scale['command_density']}"
+            )
+            json_path = os.path.join(work_dir, "bench.json")
+            with open(json_path, "w", encoding="utf-8") as file:
+                json.dump(gen_config(**scale), file)
+            create_cost, throughput, peak = bench_create(scale, repeat)
+            results[f"load[{key}]"] = bench_load(json_path, repeat)
+            results[f"create[{key}]"] = create_cost
+            results[f"create_objs_per_s[{key}]"] = throughput
+            results[f"create_peak_bytes[{key}]"] = peak
+            if cli:
+                results[f"cli_run[{key}]"] = bench_cli(
+                    ["run", json_path, "-b", module_path], work_dir, repeat
+                )
+        if cli:
+            results["cli_show"] = bench_cli(
+                ["show", "", "-b", module_path], work_dir, repeat
+            )
+            results["cli_gen"] = bench_cli(
+                ["gen", NODE_CLAZZ, "-b", module_path, "-o", "gen.json"],
+                work_dir,
+                repeat,
+            )
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """打印与基线的对比，返回变差超过tolerance的指标"""
+    regressions = list()
+    print(f"{'metric':<72}{'baseline':>14}{'current':>14}{'ratio':>8}")
+    for key, value in results.items():
+        if key not in baseline:
+            print(f"{key:<72}{'-':>14}{value:>14.4g}{'-':>8}")
+            continue
+        ratio = value / baseline[key] if baseline[key] else float("inf")
+        # 吞吐越大越好，其余指标越小越好
+        worse = ratio < 1 - tolerance if "per_s" in key else ratio > 1 + tolerance
+        flag = " !" if worse else ""
+        print(f"{key:<72}{baseline[key]:>14.4g}{value:>14.4g}{ratio:>8.2f}{flag}")
+        if worse:
+            regressions.append(key)
+    return regressions
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m fdl.bench", description="benchmark fdl factory and loader."
+    )
+    parser.add_argument("--objects", type=int, nargs="+", default=[100, 1000])
+    parser.add_argument("--depth", type=int, nargs="+", default=[1])
+    parser.add_argument("--fanout", type=int, nargs="+", default=[2])
+    parser.add_argument("--command-density", type=float, nargs="+", default=[0.1])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument(
+        "--no-cli", action="store_true", help="skip fdl run/show/gen cold start."
+    )
+    parser.add_argument("--save-baseline", type=str, default=None)
+    parser.add_argument("--baseline", type=str, default=None)
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.2,
+        help="relative change allowed before reporting a regression.",
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    scales = [
+        {
+            "objects": objects,
+            "depth": depth,
+            "fanout": fanout,
+            "command_density": density,
+        }
+        for objects in args.objects
+        for depth in args.depth
+        for fanout in args.fanout
+        for density in args.command_density
+    ]
+    results = run_benchmarks(scales, args.repeat, cli=not args.no_cli)
+    baseline = dict()
+    if args.baseline is not None:
+        with open(args.baseline, "r", encoding="utf-8") as file:
+            baseline = json.load(file)
+    regressions = compare(results, baseline, args.tolerance)
+    if args.save_baseline is not None:
+        with open(args.save_baseline, "w", encoding="utf-8") as file:
+            json.dump(results, file, indent=2)
+        print(f"saved baseline to {args.save_baseline}")
+    if regressions:
+        print(f"{len(regressions)} metrics regressed: {regressions}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,76 @@
 import os
+import threading
 
+from fdl._factory import Factory
+from fdl._manifest import (
+    IndexedClazz,
+    build_manifest,
+    get_index_path,
+    list_module_paths,
+)
 from fdl._utils import bind
 
+__MODULES_DIR = os.path.dirname(os.path.abspath(__file__))
+__BIND_LOCK = threading.Lock()
+__BOUND = set()
+__MANIFEST = None
 
-def __register_fdlm():
-    dir_path = os.path.dirname(__file__)
-    file_names = os.listdir(dir_path)
 
-    for name in file_names:
-        if name == __file__:
-            continue
-        module_path = os.path.join(dir_path, name)
+def __bind_once(module_path):
+    with __BIND_LOCK:
+        if module_path in __BOUND:
+            return False
         bind(module_path)
+        __BOUND.add(module_path)
+        return True
+
+
+def load_clazz(clazz_name):
+    """导入注册了clazz_name的模块，导入了新模块时返回True"""
+    module_path = __MANIFEST["names"].get(clazz_name, None)
+    if module_path is None:
+        return False
+    return __bind_once(module_path)
+
+
+def load_all():
+    """导入modules目录下的全部模块"""
+    for module_path in list_module_paths(__MODULES_DIR):
+        __bind_once(module_path)
+
+
+def get_indexed_clazzs():
+    """modules目录中已注册但所在模块尚未导入的对象，{注册名: IndexedClazz或None}
+
+    元数据无法静态确定时为None，需要load_clazz后从注册表中获取。
+    """
+    name2clazz = Factory().get_name2clazz()
+    return {
+        name: None if entry is None else IndexedClazz(entry)
+        for name, entry in __MANIFEST["entries"].items()
+        if name not in name2clazz
+    }
+
+
+def get_all_clazzs():
+    """完整的注册表：已注册的对象，以及索引中可以不导入就回答的对象"""
+    name2clazz = dict()
+    for name, indexed in get_indexed_clazzs().items():
+        if indexed is None or not indexed.has_signature:
+            load_clazz(name)
+        else:
+            name2clazz[name] = indexed
+    name2clazz.update(Factory().get_name2clazz())
+    return name2clazz
+
+
+def __register_fdlm():
+    # 只扫描源码建立注册名到模块的映射，模块在clazz被用到时才导入
+    global __MANIFEST
+    __MANIFEST = build_manifest(__MODULES_DIR, get_index_path(__MODULES_DIR))
+    for module_path in __MANIFEST["eager"]:
+        __bind_once(module_path)
+    Factory().add_clazz_loader(load_clazz)
 
 
 __register_fdlm()
@@ -179,3 +179,57 @@ class TestException:
         with pytest.raises(RuntimeError) as excinfo:
             self.run_with_json_path(json_path)
         assert "exec sub command" in str(excinfo.value)
+
+    def test_circular_ref(self):
+        """test when top objects reference each other in a cycle"""
+        json_path = os.path.join(ROOT, "test/ci_resources/jsons/circular_ref.json")
+        with pytest.raises(ValueError) as excinfo:
+            self.run_with_json_path(json_path)
+        assert "circular reference found between top objects: " in str(excinfo.value)
+        assert "node_c -> node_a -> node_b -> node_c" in str(excinfo.value)
+
+    def test_preflight_reports_all_errors(self, tmp_path):
+        """errors of all objects are reported before anything is constructed"""
+
+        class Teacher:
+            def __init__(self, name, students=()) -> None:
+                self.name = name
+                self.students = students
+
+        register_clazz_as_name(Teacher, "PreflightTeacher")
+        json_path = tmp_path / "preflight.json"
+        json_path.write_text(
+            json.dumps(
+                [
+                    {"clazz": "PreflightTeacher", "args": {"nmae": "Alice"}},
+                    {"clazz": "PreflightTeacher", "args": ["Bob", "${students}"]},
+                    {"clazz": "PreflightStudent"},
+                ]
+            )
+        )
+        with pytest.raises(ValueError) as excinfo:
+            self.run_with_json_path(str(json_path))
+        assert "3 errors found in" in str(excinfo.value)
+        assert "missing a required argument: 'name'" in str(excinfo.value)
+        assert "find ref object students failed" in str(excinfo.value)
+        assert "clazz 'PreflightStudent' not register!" in str(excinfo.value)
+
+    def test_parallel_construct_bool(self, tmp_path):
+        """a bool is not accepted as the number of construct workers"""
+
+        class Worker:
+            pass
+
+        register_clazz_as_name(Worker, "BoolWorkersNode")
+        json_path = tmp_path / "bool_workers.json"
+        json_path.write_text(
+            json.dumps(
+                {
+                    "task": {"parallel_construct": True},
+                    "objects": [{"clazz": "BoolWorkersNode"}],
+                }
+            )
+        )
+        with pytest.raises(TypeError) as excinfo:
+            self.run_with_json_path(str(json_path))
+        assert "workers expected int, got <class 'bool'>" in str(excinfo.value)
@@ -2,18 +2,34 @@
 pytest for function
 """
 # pylint:disable=C0114,C0115,C0116
+import asyncio
 import json
+import math
 import os
 import pathlib
+import struct
+import subprocess
 import sys
+import threading
 
 import pytest
 
 ROOT = pathlib.Path(__file__).parent.parent.parent
 sys.path.append(str(ROOT))
 import fdl._core as core  # pylint: disable=C0413
-from fdl import register_as
-from fdl._factory import Factory
+import fdl._manifest  # pylint: disable=C0413
+import fdl._utils  # pylint: disable=C0413
+from fdl import bench, register_as, register_clazz_as_name
+from fdl._cache import ObjectCache, object_key
+from fdl._check import ConfigChecker, check_objects_config, get_signature
+from fdl._common import Config, Profiler
+from fdl._compile import compile_config, load_plan, save_plan
+from fdl._core import command_serve
+from fdl._core.command_run import ConfigWatcher, run_core_objs
+from fdl._factory import Factory, LazyObject
+from fdl._manifest import IndexedClazz, build_manifest
+from fdl._stream import ConfigStream
+from fdl._utils import bind, gen_clazz_example_obj, load_mapped_arg
 
 
 @register_as("Pipeline")
@@ -53,6 +69,81 @@ class Converter:
         return inputs
 
 
+VOCAB_BUILDS = list()
+
+
+@register_as("Vocab")
+class Vocab:
+    def __init__(self, words, lower=True) -> None:
+        VOCAB_BUILDS.append(words)
+        self.words = [word.lower() for word in words] if lower else words
+
+
+@register_as("WordList")
+def word_list(*words):
+    return list(words)
+
+
+@register_as("Job")
+class Job:
+    def __init__(self, events, barrier=None, fail=False) -> None:
+        self.events = events
+        self.barrier = barrier
+        self.fail = fail
+
+    def work(self):
+        if self.barrier is not None:
+            # only passes when the other job runs at the same time
+            self.barrier.wait(timeout=5)
+        if self.fail:
+            raise ValueError("job failed")
+        self.events.append(threading.current_thread().name)
+
+    async def poll(self):
+        await asyncio.sleep(0)
+        self.events.append("poll")
+        return "polled"
+
+
+@register_as("Stage")
+class Stage:
+    def __init__(self, factor=1) -> None:
+        self.factor = factor
+
+    def apply(self, data=(), barrier=None):
+        if barrier is not None:
+            barrier.wait(timeout=5)
+        if self.factor is None:
+            raise ValueError("stage failed")
+        return [item * self.factor for item in data]
+
+
+@register_as("Flow")
+class Flow:
+    def __init__(self, count=0, fail_at=None) -> None:
+        self.count = count
+        self.fail_at = fail_at
+        self.produced = 0
+        self.lag = 0
+        self.total = None
+
+    def read(self):
+        for item in range(self.count):
+            if item == self.fail_at:
+                raise ValueError("read failed")
+            self.produced += 1
+            yield item
+
+    def double(self, items, reader):
+        for item in items:
+            # bounded queues keep the reader close to the consumer
+            self.lag = max(self.lag, reader.produced - item)
+            yield item * 2
+
+    def write(self, items):
+        self.total = sum(items)
+
+
 class Args:
     """simulate as argparser's args"""
 
@@ -80,3 +171,1142 @@ class TestFunction:
             "mixer_egg_cool->mixer_egg_cool_hot",
             "mixer_egg_cool_hot->MoonCake",
         ]
+
+    def test_ref_declared_before(self):
+        """top objects are built in dependency order, not declaration order"""
+        factory = Factory()
+        config = Config().read("test/ci_resources/jsons/ref_declared_before.json")
+        factory.create(config)
+        pipeline = factory._name2obj["OrderFreePipeline"]
+        pipeline.process()
+        assert pipeline.rst["status"] == "raw_flour_salt"
+        assert pipeline.rst["history"] == [
+            "raw->raw_flour",
+            "raw_flour->raw_flour_salt",
+        ]
+
+    def test_parallel_construct(self):
+        """objects on the same dependency level are built at the same time"""
+        barrier = threading.Barrier(2, timeout=5)
+
+        def wait_sibling(tag):
+            barrier.wait()
+            return tag
+
+        register_clazz_as_name(wait_sibling, "WaitSibling")
+        factory = Factory()
+        config = Config.from_dict(
+            objects=[
+                {
+                    "name": "parallel_joined",
+                    "clazz": "Converter",
+                    "args": ["${parallel_left}", "${parallel_right}"],
+                },
+                {"name": "parallel_left", "clazz": "WaitSibling", "args": ["left"]},
+                {"name": "parallel_right", "clazz": "WaitSibling", "args": ["right"]},
+            ]
+        )
+        factory.create(config, workers=2)
+        joined = factory._name2obj["parallel_joined"]
+        assert (joined.src, joined.dst) == ("left", "right")
+
+    def test_lazy_construct(self):
+        """objects not reachable from 'method' objects are built on first use"""
+        built = []
+
+        class Tracked:
+            def __init__(self, tag) -> None:
+                self.tag = tag
+                built.append(tag)
+
+        register_clazz_as_name(Tracked, "Tracked")
+        factory = Factory()
+        config = Config.from_dict(
+            objects=[
+                {
+                    "name": "lazy_root",
+                    "clazz": "Converter",
+                    "method": "process",
+                    "args": ["${lazy_used}", "_lazy"],
+                },
+                {"name": "lazy_used", "clazz": "Tracked", "args": ["used"]},
+                {"name": "lazy_unused", "clazz": "Tracked", "args": ["unused"]},
+            ]
+        )
+        factory.create(config, lazy=True)
+        assert built == ["used"]
+        assert isinstance(factory._name2obj["lazy_unused"], LazyObject)
+        assert factory._name2obj["lazy_unused"].tag == "unused"
+        assert built == ["used", "unused"]
+        assert isinstance(factory._name2obj["lazy_unused"], Tracked)
+
+        # a constructor returning None is still built only once
+        register_clazz_as_name(lambda tag: built.append(tag), "TrackedNone")
+        lazy_none = LazyObject(
+            factory, "lazy_none", {"clazz": "TrackedNone", "args": ["none"]}
+        )
+        for _ in range(3):
+            assert lazy_none.fdl_resolve() is None
+        assert built == ["used", "unused", "none"]
+
+    def test_pure_command(self):
+        """pure commands are executed once per factory and their ret is reused"""
+        factory = Factory()
+        config = Config.from_dict(
+            objects=[
+                {
+                    "name": "pure_a",
+                    "clazz": "Converter",
+                    "args": [None, "@@pure: ret=[]@@"],
+                },
+                {
+                    "name": "pure_b",
+                    "clazz": "Converter",
+                    "args": [None, "@@pure: ret=[]@@"],
+                },
+                {
+                    "name": "impure_a",
+                    "clazz": "Converter",
+                    "args": [None, "@@ret=[]@@"],
+                },
+                {
+                    "name": "impure_b",
+                    "clazz": "Converter",
+                    "args": [None, "@@ret=[]@@"],
+                },
+            ]
+        )
+        factory.create(config)
+        name2obj = factory._name2obj
+        assert name2obj["pure_a"].dst is name2obj["pure_b"].dst
+        assert name2obj["impure_a"].dst is not name2obj["impure_b"].dst
+
+        # every command gets fresh globals
+        factory = Factory.scoped()
+        config = Config.from_dict(
+            objects=[
+                {
+                    "name": "global_set",
+                    "clazz": "Converter",
+                    "args": [None, "@@global leaked; leaked = 1; ret = leaked@@"],
+                },
+                {
+                    "name": "global_get",
+                    "clazz": "Converter",
+                    "args": ["${global_set}", "@@ret = 'leaked' in globals()@@"],
+                },
+            ]
+        )
+        factory.create(config)
+        assert factory._name2obj["global_get"].dst is False
+
+    def test_scoped_factory(self):
+        """scoped factories share the registry but not the object pool"""
+        config = Config.from_dict(
+            objects=[
+                {"name": "scoped", "clazz": "Converter", "args": [None, "_a"]},
+                {"name": "user", "clazz": "Converter", "args": ["${scoped}", "_b"]},
+            ]
+        )
+        first, second = Factory.scoped(), Factory.scoped()
+        first.create(config)
+        second.create(config)
+        assert first._name2obj["scoped"] is not second._name2obj["scoped"]
+        # each factory resolves references in its own pool
+        assert first._name2obj["user"].src is first._name2obj["scoped"]
+        assert second._name2obj["user"].src is second._name2obj["scoped"]
+        # the config is left untouched and can be built again
+        assert config.objects[1].args == ["${scoped}", "_b"]
+        assert "scoped" not in Factory()._name2obj
+        with pytest.raises(RuntimeError):
+            first.create(config)
+        first.reset()
+        first.create(config)
+        assert list(first._name2obj) == ["scoped", "user"]
+        assert first._name2obj["user"].src is first._name2obj["scoped"]
+
+    def test_concurrent_register_and_create(self):
+        """registry and object pool stay consistent under many threads"""
+        factory = Factory()
+        thread_num = 16
+        barrier = threading.Barrier(thread_num)
+        built = list()
+        rejected = list()
+        errors = list()
+
+        class Counted:
+            def __init__(self, value=None) -> None:
+                self.value = value
+                built.append(value)
+
+        register_clazz_as_name(Counted, "stress_counted")
+        lazy_config = Config.from_dict(
+            objects=[
+                {"name": "stress_lazy", "clazz": "stress_counted", "args": ["lazy"]}
+            ]
+        )
+        lazy = LazyObject(factory, "stress_lazy", lazy_config.objects[0])
+        factory._save_obj("stress_lazy", lazy)
+
+        def work(idx):
+            try:
+                barrier.wait()
+                clazz_name = f"stress_clazz_{idx}"
+                register_clazz_as_name(type(clazz_name, (Counted,), {}), clazz_name)
+                try:
+                    register_clazz_as_name(type("Dup", (), {}), "stress_dup")
+                except RuntimeError:
+                    rejected.append("register")
+                config = Config.from_dict(
+                    objects=[
+                        {
+                            "name": f"stress_{idx}_{num}",
+                            "clazz": clazz_name,
+                            "args": {"value": f"{idx}_{num}"},
+                        }
+                        for num in range(50)
+                    ]
+                )
+                factory.create(config)
+                Factory.scoped().create(config)
+                try:
+                    factory._save_obj("stress_shared", idx)
+                except RuntimeError:
+                    rejected.append("save")
+                assert lazy.fdl_resolve() is factory._name2obj["stress_lazy"]
+            except Exception as error:  # pylint:disable=W0703
+                errors.append(error)
+
+        threads = [
+            threading.Thread(target=work, args=(idx,)) for idx in range(thread_num)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert not errors
+        assert sorted(rejected) == ["register"] * (thread_num - 1) + ["save"] * (
+            thread_num - 1
+        )
+        assert built.count("lazy") == 1
+        assert len(built) == thread_num * 50 * 2 + 1
+        for idx in range(thread_num):
+            assert f"stress_clazz_{idx}" in factory.get_name2clazz()
+            for num in range(50):
+                assert factory._name2obj[f"stress_{idx}_{num}"].value == f"{idx}_{num}"
+        assert not isinstance(factory._name2obj["stress_lazy"], LazyObject)
+
+    def test_share_objects(self):
+        """identical child configs marked share are constructed once"""
+        factory = Factory.scoped()
+        shared = {
+            "clazz": "Converter",
+            "args": {"src": None, "dst": "_a"},
+            "share": True,
+        }
+        config = Config.from_dict(
+            objects=[
+                {
+                    "name": "share_pipeline",
+                    "clazz": "Pipeline",
+                    "args": [
+                        {"status": "", "history": []},
+                        [
+                            dict(shared),
+                            # key order does not matter
+                            {
+                                "share": True,
+                                "args": {"dst": "_a", "src": None},
+                                "clazz": "Converter",
+                            },
+                            {"clazz": "Converter", "args": {"src": None, "dst": "_a"}},
+                        ],
+                    ],
+                }
+            ]
+        )
+        factory.create(config)
+        first, second, third = factory._name2obj["share_pipeline"].processors
+        assert first is second
+        assert third is not first
+
+        factory = Factory.scoped()
+        factory.set_share_objects(True)
+        config = Config.from_dict(
+            objects=[
+                {
+                    "name": "share_all",
+                    "clazz": "Pipeline",
+                    "args": [
+                        None,
+                        [
+                            {"clazz": "Converter", "args": [None, "_a"]},
+                            {"clazz": "Converter", "args": [None, "_a"]},
+                            {
+                                "clazz": "Converter",
+                                "args": [None, "_a"],
+                                "share": False,
+                            },
+                            {"clazz": "Converter", "args": [None, "@@ret=[]@@"]},
+                            {"clazz": "Converter", "args": [None, "@@ret=[]@@"]},
+                        ],
+                    ],
+                }
+            ]
+        )
+        factory.create(config)
+        processors = factory._name2obj["share_all"].processors
+        assert processors[0] is processors[1]
+        assert processors[2] is not processors[0]
+        assert processors[3] is not processors[4]
+
+    def test_object_cache(self, tmp_path, monkeypatch):
+        """objects with cache are loaded from disk until config or deps change"""
+        monkeypatch.setenv("FDL_CACHE_DIR", str(tmp_path))
+
+        def build(word, cache=True, lower="@@pure: ret=True@@"):
+            factory = Factory.scoped()
+            factory.set_object_cache(ObjectCache())
+            config = Config.from_dict(
+                objects=[
+                    {"name": "cache_words", "clazz": "WordList", "args": [word, "B"]},
+                    {
+                        "name": "cache_vocab",
+                        "clazz": "Vocab",
+                        "cache": cache,
+                        "args": {"words": "${cache_words}", "lower": lower},
+                    },
+                ]
+            )
+            factory.create(config)
+            return factory._name2obj["cache_vocab"]
+
+        VOCAB_BUILDS.clear()
+        assert build("A").words == ["a", "b"]
+        assert build("A").words == ["a", "b"]
+        assert len(VOCAB_BUILDS) == 1
+        build("C")
+        assert len(VOCAB_BUILDS) == 2
+        build("A", cache=False)
+        assert len(VOCAB_BUILDS) == 3
+        build("A", lower="@@ret=True@@")
+        build("A", lower="@@ret=True@@")
+        assert len(VOCAB_BUILDS) == 5
+
+        object_cache = ObjectCache(max_size=0)
+        assert len(object_cache.entries()) == 2
+        object_cache.evict()
+        assert object_cache.entries() == list()
+        build("A")
+        args = Args()
+        setattr(args, "action", "clear")
+        core.cache(args)
+        assert ObjectCache().entries() == list()
+
+        # rewriting a mapped file invalidates the key of objects mapping it
+        bin_path = tmp_path / "words.bin"
+        bin_path.write_bytes(b"abcd")
+        mapped_config = {"clazz": "Vocab", "args": [{"$buffer": str(bin_path)}]}
+        key = object_key(mapped_config, [Vocab], [])
+        assert object_key(mapped_config, [Vocab], []) == key
+        bin_path.write_bytes(b"abcdef")
+        assert object_key(mapped_config, [Vocab], []) != key
+
+    def test_mapped_args(self, tmp_path):
+        """$buffer args are read-only memory maps of the file"""
+        bin_path = tmp_path / "table.bin"
+        bin_path.write_bytes(b"head" + struct.pack("6f", *range(6)))
+        factory = Factory.scoped()
+        config = Config.from_dict(
+            objects=[
+                {
+                    "name": "mapped",
+                    "clazz": "Converter",
+                    "args": {
+                        "src": {"$buffer": str(bin_path)},
+                        "dst": {
+                            "$buffer": str(bin_path),
+                            "dtype": "float32",
+                            "offset": 4,
+                            "shape": [2, 3],
+                        },
+                    },
+                }
+            ]
+        )
+        factory.create(config)
+        mapped = factory._name2obj["mapped"]
+        assert mapped.src.readonly and mapped.src[:4].tobytes() == b"head"
+        assert mapped.dst.tolist() == [[0.0, 1.0, 2.0], [3.0, 4.0, 5.0]]
+        with pytest.raises(ValueError):
+            load_mapped_arg({"$buffer": str(bin_path), "dtype": "float128"})
+
+    def test_mapped_npy_args(self, tmp_path):
+        """$mmap args load .npy files with mmap_mode='r'"""
+        np = pytest.importorskip("numpy")
+        npy_path = tmp_path / "weights.npy"
+        np.save(npy_path, np.arange(12, dtype=np.float32).reshape(3, 4))
+        weights = load_mapped_arg({"$mmap": str(npy_path)})
+        assert isinstance(weights, np.memmap)
+        assert not weights.flags.writeable
+        assert weights[2, 3] == 11
+
+    def test_stream_config(self, tmp_path):
+        """stream mode parses objects one by one and builds once refs are ready"""
+        data = {
+            "task": {"name": "stream"},
+            "objects": [
+                {
+                    "name": "stream_pipeline",
+                    "clazz": "Pipeline",
+                    "method": "process",
+                    "args": [
+                        {"status": "", "history": []},
+                        ["${stream_b}", "${stream_a}"],
+                    ],
+                },
+                {"clazz": "Converter", "args": [None, 12345.5e-3]},
+                {"name": "stream_b", "clazz": "Converter", "args": ["_a", "_b"]},
+                {"name": "stream_a", "clazz": "Converter", "args": [None, "_a"]},
+            ],
+            "extra": [True, None, "\u4e2d\"}"],
+        }
+        json_path = tmp_path / "stream.json"
+        json_path.write_text(json.dumps(data, indent=4))
+        stream = ConfigStream(str(json_path), chunk_size=3)
+        assert stream.read_header() == {"task": {"name": "stream"}}
+        obj_configs = list(stream.iter_objects())
+        assert obj_configs == data["objects"]
+        assert stream.tail == {"extra": data["extra"]}
+
+        factory = Factory.scoped()
+        factory.create_stream(
+            ConfigChecker().iter_checked(
+                ConfigStream(str(json_path), chunk_size=5).iter_objects(),
+                str(json_path),
+            )
+        )
+        pipeline = factory._name2obj["stream_pipeline"]
+        assert pipeline.processors == [
+            factory._name2obj["stream_b"],
+            factory._name2obj["stream_a"],
+        ]
+        assert factory._name2obj["objects_2"].dst == 12.3455
+        assert factory.get_core_objs() == [pipeline]
+
+        json_path.write_text(json.dumps([{"clazz": "Converter"}] * 2)[:-1])
+        with pytest.raises(json.JSONDecodeError, match="not a valid json file"):
+            list(ConfigStream(str(json_path)).iter_objects())
+        json_path.write_text(json.dumps({"objects": [{"name": "x", "clazz": "A"}] * 2}))
+        with pytest.raises(ValueError, match="have repeat"):
+            list(ConfigStream(str(json_path)).iter_objects())
+        circular = ROOT / "test/ci_resources/jsons/circular_ref.json"
+        with pytest.raises(ValueError, match="circular reference"):
+            Factory.scoped().create_stream(ConfigStream(str(circular)).iter_objects())
+
+        # each object is checked before it is built, refs once all are read
+        builds = len(VOCAB_BUILDS)
+        objects = [
+            {"name": "stream_vocab", "clazz": "Vocab", "args": [["A"]]},
+            {"clazz": "Converter", "args": {"srcc": None, "dst": "_a"}},
+        ]
+        json_path.write_text(json.dumps(objects))
+        factory = Factory.scoped()
+        checked = ConfigChecker().iter_checked(
+            ConfigStream(str(json_path)).iter_objects(), str(json_path)
+        )
+        with pytest.raises(TypeError, match=r"objects\[1\]\.args"):
+            factory.create_stream(checked)
+        assert len(VOCAB_BUILDS) == builds + 1
+        objects[1]["args"] = ["${stream_missing}", "_a"]
+        json_path.write_text(json.dumps(objects))
+        checked = ConfigChecker().iter_checked(
+            ConfigStream(str(json_path)).iter_objects(), str(json_path)
+        )
+        with pytest.raises(KeyError, match="stream_missing"):
+            Factory.scoped().create_stream(checked)
+
+    def test_compiled_config(self, tmp_path):
+        """a compiled plan builds the same objects as the json it comes from"""
+        mooncake = "test/ci_resources/jsons/mooncake.json"
+        plan_path = tmp_path / "mooncake.fdlc"
+        args = Args()
+        args.compile_json_path = mooncake
+        args.output = str(plan_path)
+        core.compile_json(args)
+        factory = Factory()
+        self.run_with_json_path(mooncake)
+        expected = factory._name2obj["MoonCakeFactory"].rst
+        self.run_with_json_path(str(plan_path))
+        assert factory._name2obj["MoonCakeFactory"].rst == expected
+
+        data = {
+            "objects": [
+                {
+                    "name": "plan_vocab",
+                    "clazz": "Vocab",
+                    "args": {
+                        "words": {
+                            "clazz": "WordList",
+                            "args": ["A", "@@ret=str(${plan_size}.dst)@@"],
+                        }
+                    },
+                },
+                {"name": "plan_size", "clazz": "Converter", "args": [None, 3]},
+                {
+                    "name": "plan_pipeline",
+                    "clazz": "Pipeline",
+                    "args": {
+                        "raw": {"history": [[1, "${plan_size}"]]},
+                        "processors": [],
+                    },
+                },
+            ]
+        }
+        json_path = tmp_path / "plan.json"
+        json_path.write_text(json.dumps(data))
+        save_plan(compile_config(str(json_path)), str(plan_path))
+        plan = load_plan(str(plan_path))
+        assert plan.graph.order() == [1, 2, 0]
+        factory = Factory.scoped()
+        factory.create_compiled(plan)
+        assert factory._name2obj["plan_vocab"].words == ["a", "3"]
+        history = factory._name2obj["plan_pipeline"].raw["history"]
+        assert history == [[1, factory._name2obj["plan_size"]]]
+
+        json_path.write_text(json.dumps({"objects": [{"clazz": "Vocab", "args": 1}]}))
+        with pytest.raises(TypeError, match="unexpected args type"):
+            compile_config(str(json_path))
+        json_path.write_text(json.dumps([{"clazz": "Vocab", "args": ["@@ret=[@@"]}]))
+        with pytest.raises(SyntaxError):
+            compile_config(str(json_path))
+
+    def test_concurrent_methods(self):
+        """concurrent methods overlap, coroutines are awaited, errors are gathered"""
+        events = list()
+        barrier = threading.Barrier(2)
+        config = Config().load(
+            [
+                {"clazz": "Job", "method": "poll", "args": [events]},
+                {"clazz": "Job", "method": "work", "args": [events, barrier]},
+                {
+                    "clazz": "Job",
+                    "method": "work",
+                    "concurrent": True,
+                    "args": [events, barrier],
+                },
+            ]
+        )
+        factory = Factory.scoped()
+        factory.create(config)
+        run_core_objs(factory, Profiler())
+        assert events[0] == "poll"
+        assert all(name.startswith("fdl-method") for name in events[1:])
+
+        events.clear()
+        config = Config().load(
+            [
+                {"clazz": "Job", "method": "work", "args": [events, None, True]},
+                {"clazz": "Job", "method": "poll", "args": [events]},
+                {"clazz": "Job", "method": "missing", "args": [events]},
+            ]
+        )
+        factory = Factory.scoped()
+        factory.create(config)
+        with pytest.raises(RuntimeError, match="2 methods failed"):
+            run_core_objs(factory, Profiler(), concurrent=True)
+        assert events == ["poll"]
+
+    def test_method_dag(self):
+        """methods run as a DAG of 'after' and ${name.result} dependencies"""
+        objects = [
+            {
+                "name": "dag_eval",
+                "clazz": "Stage",
+                "method": "apply",
+                "method_args": {"data": "${dag_train.result}"},
+            },
+            {
+                "name": "dag_train",
+                "clazz": "Stage",
+                "method": "apply",
+                "args": [10],
+                "method_args": ["${dag_prep.result}"],
+            },
+            {
+                "name": "dag_prep",
+                "clazz": "Stage",
+                "method": "apply",
+                "method_args": [[1, 2], "@@ret=${dag_barrier}@@"],
+            },
+            {
+                "name": "dag_export",
+                "clazz": "Stage",
+                "method": "apply",
+                "after": [],
+                "method_args": {"barrier": "${dag_barrier}"},
+            },
+        ]
+        factory = Factory.scoped()
+        factory.create(Config().load(objects))
+        # dag_prep and dag_export wait for each other, so they must overlap
+        factory._save_obj("dag_barrier", threading.Barrier(2))
+        run_core_objs(factory, Profiler())
+        # only results referenced by other methods are kept
+        assert factory._name2obj["dag_train.result"] == [10, 20]
+        assert "dag_eval.result" not in factory._name2obj
+
+        objects[1]["args"] = [None]
+        factory = Factory.scoped()
+        factory.create(Config().load(objects))
+        factory._save_obj("dag_barrier", threading.Barrier(2))
+        with pytest.raises(RuntimeError, match="1 methods failed"):
+            run_core_objs(factory, Profiler())
+        assert "dag_prep.result" in factory._name2obj
+        assert "dag_train.result" not in factory._name2obj
+
+        objects[2]["after"] = ["dag_eval"]
+        factory = Factory.scoped()
+        factory.create(Config().load(objects))
+        with pytest.raises(ValueError, match="circular reference"):
+            run_core_objs(factory, Profiler())
+        objects[2]["after"] = ["dag_missing"]
+        factory = Factory.scoped()
+        factory.create(Config().load(objects))
+        with pytest.raises(ValueError, match="not a top object with 'method'"):
+            run_core_objs(factory, Profiler())
+
+    def test_method_pipeline(self):
+        """generator methods stream through bounded queues to downstream stages"""
+        objects = [
+            {"name": "flow_writer", "clazz": "Flow", "method": "write"},
+            {
+                "name": "flow_double",
+                "clazz": "Flow",
+                "method": "double",
+                "input": "${flow_reader}",
+                "queue_size": 2,
+                "method_args": {"reader": "${flow_reader}"},
+            },
+            {"name": "flow_reader", "clazz": "Flow", "method": "read", "args": [1000]},
+        ]
+        objects[0]["input"] = "${flow_double}"
+        factory = Factory.scoped()
+        factory.create(Config().load(objects))
+        run_core_objs(factory, Profiler())
+        assert factory._name2obj["flow_writer"].total == 999 * 1000
+        assert factory._name2obj["flow_double"].lag <= 8
+
+        objects[2]["args"] = [1000, 10]
+        factory = Factory.scoped()
+        factory.create(Config().load(objects))
+        with pytest.raises(RuntimeError, match="3 methods failed"):
+            run_core_objs(factory, Profiler())
+        assert factory._name2obj["flow_writer"].total is None
+
+        objects[2]["input"] = "${flow_writer}"
+        factory = Factory.scoped()
+        factory.create(Config().load(objects))
+        with pytest.raises(ValueError, match="circular reference"):
+            run_core_objs(factory, Profiler())
+        objects[2].pop("input")
+        objects[1]["after"] = ["flow_reader"]
+        factory = Factory.scoped()
+        factory.create(Config().load(objects))
+        with pytest.raises(ValueError, match="waits for its input"):
+            run_core_objs(factory, Profiler())
+
+        # a generator at the end of a pipeline is drained, not just created
+        objects = [
+            {"name": "sink_reader", "clazz": "Flow", "method": "read", "args": [5]},
+            {
+                "name": "sink_double",
+                "clazz": "Flow",
+                "method": "double",
+                "input": "${sink_reader}",
+                "method_args": ["${sink_reader}"],
+            },
+        ]
+        factory = Factory.scoped()
+        factory.create(Config().load(objects))
+        run_core_objs(factory, Profiler())
+        assert factory._name2obj["sink_reader"].produced == 5
+
+        for size in (0, -1, True, "2"):
+            objects[1]["queue_size"] = size
+            factory = Factory.scoped()
+            factory.create(Config().load(objects))
+            with pytest.raises(ValueError, match="positive int"):
+                run_core_objs(factory, Profiler())
+
+    def test_watch_reload(self, tmp_path):
+        """a reload rebuilds changed objects and their dependents only"""
+        objects = [
+            {"name": "watch_a", "clazz": "Converter", "args": [None, "_a"]},
+            {"name": "watch_b", "clazz": "Converter", "args": ["_a", "_b"]},
+            {
+                "name": "watch_pipeline",
+                "clazz": "Pipeline",
+                "method": "process",
+                "args": [{"status": "", "history": []}, ["${watch_a}"]],
+            },
+        ]
+        json_path = tmp_path / "watch.json"
+        json_path.write_text(json.dumps(objects))
+        args = Args()
+        args.run_json_path = str(json_path)
+        factory = Factory.scoped()
+        watcher = ConfigWatcher(args, factory, Profiler())
+        assert watcher.poll() and not watcher.poll()
+        assert watcher.reload()
+        before = factory.get_name2obj()
+        assert before["watch_pipeline"].rst["status"] == "_a"
+
+        objects[0]["args"] = [None, "_x"]
+        objects[1]["method"] = "process"
+        objects[1]["method_args"] = [{"status": "_a", "history": []}]
+        json_path.write_text(json.dumps(objects))
+        assert watcher.poll() and watcher.reload()
+        after = factory.get_name2obj()
+        assert after["watch_b"] is before["watch_b"]
+        assert after["watch_a"] is not before["watch_a"]
+        assert after["watch_pipeline"] is not before["watch_pipeline"]
+        assert after["watch_pipeline"].rst["status"] == "_x"
+
+        # broken edits are rejected before the pool is touched
+        json_path.write_text(json.dumps(objects)[:-1])
+        assert watcher.poll() and not watcher.reload()
+        objects[1]["args"] = {"bad": 1}
+        json_path.write_text(json.dumps(objects))
+        assert watcher.poll() and not watcher.reload()
+        assert factory.get_name2obj()["watch_b"] is before["watch_b"]
+        objects[1]["args"] = ["_a", "_c"]
+        json_path.write_text(json.dumps(objects))
+        assert watcher.poll() and watcher.reload()
+        assert factory.get_name2obj()["watch_a"] is after["watch_a"]
+
+    def test_check_config(self):
+        """the checker reports every error without constructing anything"""
+        builds = len(VOCAB_BUILDS)
+        config = Config().load(
+            [
+                {
+                    "name": "check_vocab",
+                    "clazz": "Vocab",
+                    "args": {
+                        "words": {"clazz": "WordList", "args": ["a", "${check_x}"]},
+                        "upper": True,
+                    },
+                },
+                {"clazz": "Converter", "args": ["@@ret=${check_y}@@"]},
+                {"clazz": "CheckNotRegistered", "args": ["${check_vocab}"]},
+                {
+                    "clazz": "Stage",
+                    "method": "apply",
+                    "method_args": ["${check_vocab.result}", "${objects_0.result}"],
+                },
+            ]
+        )
+        errors = ConfigChecker(Factory.scoped()).check(config)
+        assert [path for path, _ in errors] == [
+            "objects[0](check_vocab).args.words.args.1",
+            "objects[0](check_vocab).args",
+            "objects[1](objects_2).args.0",
+            "objects[1](objects_2).args",
+            "objects[2](objects_1)",
+            "objects[3](objects_0).method_args.0",
+            "objects[3](objects_0).method_args.1",
+        ]
+        assert "unexpected keyword argument 'upper'" in str(errors[1][1])
+        assert "missing a required argument: 'dst'" in str(errors[3][1])
+        assert len(VOCAB_BUILDS) == builds
+
+        # loader failures and method dependency typos are collected too
+        def broken_loader(clazz_name):
+            if clazz_name == "CheckBroken":
+                raise ImportError("broken plugin")
+            return False
+
+        Factory().add_clazz_loader(broken_loader)
+        config = Config().load(
+            [
+                {"clazz": "CheckBroken"},
+                {"name": "check_src", "clazz": "Flow", "method": "read"},
+                {
+                    "clazz": "Stage",
+                    "method": "apply",
+                    "after": ["check_srk"],
+                    "input": "${check_missing}",
+                },
+                {"clazz": "Stage", "method": "apply", "input": "check_src"},
+            ]
+        )
+        errors = ConfigChecker(Factory.scoped()).check(config)
+        assert [path for path, _ in errors] == [
+            "objects[0](objects_3)",
+            "objects[2](objects_1).after",
+            "objects[2](objects_1).input",
+            "objects[3](objects_0).input",
+        ]
+        assert isinstance(errors[0][1], ImportError)
+        with pytest.raises(ValueError, match="4 errors found"):
+            check_objects_config(config, "check.json")
+
+        # loader errors with unusual constructors are reported as ValueError
+        def odd_loader(clazz_name):
+            if clazz_name == "CheckOddEmpty":
+                raise RuntimeError()
+            if clazz_name == "CheckOddProcess":
+                raise subprocess.CalledProcessError(1, "pip")
+            return False
+
+        Factory().add_clazz_loader(odd_loader)
+        for clazz_name, message, cause in (
+            ("CheckOddEmpty", "RuntimeError", RuntimeError),
+            ("CheckOddProcess", "exit status 1", subprocess.CalledProcessError),
+        ):
+            config = Config().load([{"clazz": clazz_name}])
+            with pytest.raises(ValueError, match=message) as excinfo:
+                check_objects_config(config, "check.json")
+            assert isinstance(excinfo.value.__cause__, cause)
+        assert "check_srk" in str(errors[1][1])
+        assert "check_missing" in str(errors[2][1])
+
+        # signatures are resolved once per clazz
+        get_signature.cache_clear()
+        config = Config().load(
+            [{"clazz": "Converter", "args": [None, idx]} for idx in range(10000)]
+        )
+        assert ConfigChecker().check(config) == []
+        assert get_signature.cache_info().misses == 1
+
+    def test_run_parses_config_once(self, tmp_path, monkeypatch):
+        """fdl run opens and parses the json once, with stdlib json semantics"""
+        json_path = tmp_path / "once.json"
+        json_path.write_text(
+            '[{"name": "once", "clazz": "Converter", "args": [null, NaN]}]'
+        )
+        opens = list()
+        parses = list()
+        real_open = open
+        real_loads = fdl._utils.json_loads
+
+        def counting_open(file, *args, **kwargs):
+            if str(file) == str(json_path):
+                opens.append(file)
+            return real_open(file, *args, **kwargs)
+
+        def counting_loads(content):
+            parses.append(content)
+            return real_loads(content)
+
+        def strict_loads(content):
+            # a fast backend that rejects NaN, like orjson
+            if b"NaN" in content:
+                raise ValueError("NaN is not allowed")
+            return json.loads(content)
+
+        monkeypatch.setattr("builtins.open", counting_open)
+        monkeypatch.setattr(fdl._utils, "json_loads", counting_loads)
+        monkeypatch.setattr(fdl._utils, "_json_loads", strict_loads)
+        factory = Factory()
+        self.run_with_json_path(str(json_path))
+        assert len(opens) == 1 and len(parses) == 1
+        assert math.isnan(factory._name2obj["once"].dst)
+        assert math.isnan(Config().read(str(json_path)).objects[0].args[1])
+
+    def test_config_deep_nesting(self):
+        """Config converts deep configs without recursion and keeps one table"""
+        data = leaf = {}
+        for _ in range(5000):
+            leaf["child"] = [{}]
+            leaf = leaf["child"][0]
+        leaf["value"] = 1
+        config = Config().load(data)
+        node = config
+        for _ in range(5000):
+            node = node.child[0]
+        assert isinstance(node, Config)
+        assert node.value == node["value"] == 1
+        assert not hasattr(node, "__dict__")
+
+    def test_init_config_policy(self):
+        """top-level-only policy keeps _init_config off nested objects"""
+        factory = Factory()
+        config = Config.from_dict(
+            objects=[
+                {
+                    "name": "policy_top",
+                    "clazz": "Converter",
+                    "args": [{"clazz": "Converter", "args": [None, "_a"]}, "_b"],
+                }
+            ]
+        )
+        factory.set_init_config_policy("top-level-only")
+        try:
+            factory.create(config)
+        finally:
+            factory.set_init_config_policy("full")
+        top = factory._name2obj["policy_top"]
+        assert top._init_config is config.objects[0]
+        assert not hasattr(top.src, "_init_config")
+        with pytest.raises(ValueError):
+            factory.set_init_config_policy("partly")
+
+    def test_build_manifest(self, tmp_path):
+        """registered names are found by scanning sources without importing"""
+        (tmp_path / "plain.py").write_text(
+            "from fdl import register_as, register_clazz_as_name\n"
+            "@register_as('ManifestPlain')\n"
+            "class Plain:\n"
+            "    pass\n"
+            "register_clazz_as_name(dict, 'ManifestDict')\n"
+        )
+        (tmp_path / "pkg").mkdir()
+        (tmp_path / "pkg" / "__init__.py").write_text("from . import sub\n")
+        (tmp_path / "pkg" / "sub.py").write_text(
+            "import fdl\n@fdl.register\ndef build():\n    pass\n"
+        )
+        (tmp_path / "dyn.py").write_text(
+            "from fdl._factory import register_module_clazzs\n"
+            "import json\nregister_module_clazzs(json, 'json')\n"
+        )
+        (tmp_path / "aliased.py").write_text(
+            "from fdl import register_as as reg\n"
+            "@reg('ManifestAliased')\n"
+            "class Aliased:\n"
+            "    pass\n"
+        )
+        (tmp_path / "assigned.py").write_text(
+            "from fdl import register_as\n"
+            "reg = register_as\n"
+            "@reg('ManifestAssigned')\n"
+            "class Assigned:\n"
+            "    pass\n"
+        )
+        manifest = build_manifest(str(tmp_path))
+        assert manifest["names"] == {
+            "ManifestAliased": str(tmp_path / "aliased.py"),
+            "ManifestPlain": str(tmp_path / "plain.py"),
+            "ManifestDict": str(tmp_path / "plain.py"),
+            "pkg.sub.build": str(tmp_path / "pkg"),
+        }
+        # registrations that can't be followed statically are imported eagerly
+        assert manifest["eager"] == [
+            str(tmp_path / "assigned.py"),
+            str(tmp_path / "dyn.py"),
+        ]
+
+    def test_manifest_index(self, tmp_path, monkeypatch):
+        """unchanged files are answered from the index without parsing"""
+        modules_dir = tmp_path / "modules"
+        modules_dir.mkdir()
+        (modules_dir / "indexed.py").write_text(
+            "from fdl import register_as\n"
+            "@register_as('IndexedNode')\n"
+            "class Node:\n"
+            "    '''node doc'''\n"
+            "    def __init__(self, uid, size: int, tag='leaf'):\n"
+            "        pass\n"
+        )
+        index_path = str(tmp_path / "index.json")
+        manifest = build_manifest(str(modules_dir), index_path)
+        assert os.path.isfile(index_path)
+
+        def scan_failed(*args):
+            raise AssertionError("file should be answered from index")
+
+        monkeypatch.setattr(fdl._manifest, "scan_source_file", scan_failed)
+        assert build_manifest(str(modules_dir), index_path) == manifest
+        example = IndexedClazz(manifest["entries"]["IndexedNode"]).gen_example_obj(
+            "IndexedNode"
+        )
+        assert example["args"] == {
+            "uid": "Todo Here!",
+            "size": "<class 'int'>",
+            "tag": "leaf",
+        }
+
+    def test_manifest_annotations(self, tmp_path):
+        """indexed and imported clazzs give the same example args"""
+        sources = {
+            "plain": "def __init__(self, a: int, b: 'Word', c: None, d=1): pass",
+            "future": "def __init__(self, a: int, b: List[int], c: 'str'): pass",
+            "custom": "def __init__(self, a: Word): pass",
+        }
+        for module_name, init in sources.items():
+            module_dir = tmp_path / module_name
+            module_dir.mkdir()
+            header = "from __future__ import annotations\n" * (module_name == "future")
+            (module_dir / f"{module_name}_mod.py").write_text(
+                f"{header}from typing import List\n"
+                "from fdl import register_clazz_as_name\n"
+                f"class Word: pass\nclass Node:\n    {init}\n"
+                f"register_clazz_as_name(Node, 'Annotated_{module_name}')\n"
+            )
+            entry = build_manifest(str(module_dir))["entries"][
+                f"Annotated_{module_name}"
+            ]
+            sys.path.insert(0, str(module_dir))
+            try:
+                clazz = __import__(f"{module_name}_mod").Node
+            finally:
+                sys.path.remove(str(module_dir))
+            imported = gen_clazz_example_obj(clazz, "Node")
+            if module_name == "custom":
+                # a custom class annotation can't be rendered without importing
+                assert not IndexedClazz(entry).has_signature
+                continue
+            indexed = IndexedClazz(entry).gen_example_obj("Node")
+            assert indexed["args"] == imported["args"]
+
+    def test_profile_objects(self):
+        """profiler records every constructed object with its nesting depth"""
+        factory = Factory()
+        profiler = Profiler()
+        config = Config.from_dict(
+            objects=[
+                {
+                    "name": "profiled",
+                    "clazz": "Converter",
+                    "args": [{"clazz": "Converter", "args": [None, "_a"]}, "_b"],
+                }
+            ]
+        )
+        with profiler.phase("not recorded"):
+            pass
+        assert all(phase["phase"] != "not recorded" for phase in profiler.phases)
+        factory.set_profiler(profiler)
+        profiler.enable()
+        try:
+            with profiler.phase("create profiled"):
+                factory.create(config)
+        finally:
+            factory.set_profiler(None)
+            profiler.enabled = False
+        records = profiler.objects[-2:]
+        assert [(obj["name"], obj["depth"]) for obj in records] == [
+            (None, 1),
+            ("profiled", 0),
+        ]
+        assert records[1]["wall"] >= records[0]["wall"]
+        assert profiler.phases[-1]["phase"] == "create profiled"
+        profiler.clear()
+        assert profiler.phases == [] and profiler.objects == []
+
+    def test_bench_create(self):
+        """synthetic bench configs build regardless of declaration order"""
+        cost, throughput, peak = bench.bench_create(
+            {"objects": 30, "depth": 2, "fanout": 3, "command_density": 0.5}, repeat=2
+        )
+        assert cost > 0 and throughput > 0 and peak > 0
+
+    @pytest.mark.skipif(not hasattr(os, "fork"), reason="fdl serve requires fork")
+    def test_serve_daemon(self, tmp_path):
+        """fdl run --daemon runs the config in a child forked from fdl serve"""
+        env = dict(os.environ)
+        env["PYTHONPATH"] = os.pathsep.join(
+            [str(ROOT / "src"), env.get("PYTHONPATH", "")]
+        )
+        env["FDL_CACHE_DIR"] = str(tmp_path)
+        socket_path = str(tmp_path / "serve.sock")
+        teacher = str(ROOT / "doc/complex_obj/teacher.py")
+        fdl_cmd = [sys.executable, "-m", "fdl._main"]
+        server = subprocess.Popen(
+            fdl_cmd + ["serve", "-b", teacher, "--socket", socket_path],
+            env=env,
+            stdout=subprocess.PIPE,
+        )
+        try:
+            assert b"fdl daemon listening" in server.stdout.readline()
+            json_path = str(ROOT / "doc/complex_obj/call_name_ref.json")
+            rst = subprocess.run(
+                fdl_cmd + ["run", json_path, "-d", "--socket", socket_path],
+                env=env,
+                capture_output=True,
+                check=True,
+            )
+            assert rst.stdout == b"Alice\nBob\nCandy\n"
+        finally:
+            server.terminate()
+            server.wait(timeout=10)
+        assert not os.path.exists(socket_path)
+
+    def test_serve_reloads_edited_modules(self, tmp_path):
+        """bound modules edited after the daemon started are imported again"""
+        module_path = tmp_path / "served_nodes.py"
+        source = (
+            "from fdl import register_as\n"
+            "@register_as('ServedNode')\n"
+            "class ServedNode:\n"
+            "    VERSION = {}\n"
+        )
+        module_path.write_text(source.format(1))
+        bind(str(module_path))
+        command_serve._snapshot_modules()
+        assert not command_serve._drop_stale_module(str(module_path))
+        module_path.write_text(source.format(22))
+        assert command_serve._drop_stale_module(str(module_path))
+        bind(str(module_path))
+        assert Factory().get_name2clazz()["ServedNode"].VERSION == 22
+
+    @pytest.mark.skipif(not hasattr(os, "fork"), reason="fdl sweep forks workers")
+    def test_sweep(self, tmp_path):
+        """every variant of the grid runs in its own work folder"""
+        base = {
+            "task": {"name": "sweep_test"},
+            "objects": [
+                {
+                    "name": "sweep_src",
+                    "clazz": "Converter",
+                    "args": {"src": "a", "dst": "b"},
+                },
+                {
+                    "name": "sweep_pipeline",
+                    "clazz": "Pipeline",
+                    "method": "process",
+                    "args": [
+                        {"status": "a", "history": []},
+                        ["${sweep_src}"],
+                    ],
+                },
+            ],
+        }
+        grid = {"sweep_src.args.dst": ["b", "c"], "sweep_src.args.append": [1, 0]}
+        variants = core.command_sweep.gen_variants(base, grid)
+        assert [overrides for overrides, _ in variants] == [
+            {"sweep_src.args.dst": "b", "sweep_src.args.append": 1},
+            {"sweep_src.args.dst": "b", "sweep_src.args.append": 0},
+            {"sweep_src.args.dst": "c", "sweep_src.args.append": 1},
+            {"sweep_src.args.dst": "c", "sweep_src.args.append": 0},
+        ]
+        assert variants[3][1]["objects"][0]["args"] == {
+            "src": "a",
+            "dst": "c",
+            "append": 0,
+        }
+        assert base["objects"][0]["args"] == {"src": "a", "dst": "b"}
+        with pytest.raises(KeyError):
+            core.command_sweep.gen_variants(base, {"sweep_missing.args.0": [1]})
+
+        json_path = tmp_path / "base.json"
+        json_path.write_text(json.dumps(base))
+        grid_path = tmp_path / "grid.json"
+        grid_path.write_text(json.dumps(grid))
+        args = Args()
+        setattr(args, "run_json_path", str(json_path))
+        setattr(args, "grid", str(grid_path))
+        setattr(args, "workers", 2)
+        setattr(args, "output", str(tmp_path / "sweep"))
+        core.sweep(args)
+        for idx, (overrides, _) in enumerate(variants):
+            variant_dir = tmp_path / "sweep" / "sweep_test" / f"variant_{idx}"
+            (work_dir,) = variant_dir.iterdir()
+            with open(work_dir / "variant.json", "r", encoding="utf-8") as file:
+                assert json.load(file)["overrides"] == overrides
+            assert (work_dir / "log.txt").exists()
+
+        setattr(args, "output", str(tmp_path / "failed"))
+        grid_path.write_text(json.dumps([{"objects.0.args.src": "x"}]))
+        with pytest.raises(RuntimeError, match="1 variants failed"):
+            core.sweep(args)